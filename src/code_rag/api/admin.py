@@ -0,0 +1,70 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from code_rag.models.admin import StorageProfileRequest
+from code_rag.profiling import get_profile_path, list_profiles
+
+router = APIRouter(prefix="/admin")
+
+
+@router.get("/storage-profiles")
+async def list_storage_profiles():
+    """列出可用的儲存層級設定。"""
+    from code_rag.storage.qdrant import STORAGE_PROFILES
+
+    return STORAGE_PROFILES
+
+
+@router.post("/collections/{collection}/profile")
+async def set_storage_profile(collection: str, req: StorageProfileRequest):
+    """將既有 collection 搬移到另一個儲存層級。"""
+    from qdrant_client.http.exceptions import UnexpectedResponse
+
+    from code_rag.main import get_qdrant
+    from code_rag.storage.qdrant import STORAGE_PROFILES
+
+    if req.profile not in STORAGE_PROFILES:
+        raise HTTPException(400, f"Unknown storage profile '{req.profile}'")
+
+    qdrant = get_qdrant()
+    if not await asyncio.to_thread(qdrant.client.collection_exists, collection):
+        raise HTTPException(404, f"Collection '{collection}' not found")
+    try:
+        return await asyncio.to_thread(qdrant.apply_storage_profile, req.profile, collection)
+    except UnexpectedResponse as e:
+        raise HTTPException(502, f"Qdrant rejected the storage profile change: {e}")
+
+
+@router.post("/path-prefixes/backfill")
+async def backfill_path_prefixes(project: str | None = None):
+    """為升級前索引、缺少 path_prefixes 的 chunk 補上欄位，path_prefix / exclude 搜尋才涵蓋它們。"""
+    from code_rag.main import get_qdrant
+
+    updated = await asyncio.to_thread(get_qdrant().backfill_path_prefixes, project)
+    return {"updated": updated}
+
+
+@router.get("/embedder")
+async def embedder_stats():
+    """Embedding backend 狀態；Ollama 另含各 endpoint 的健康、延遲與吞吐量。"""
+    from code_rag.main import get_embedder
+
+    return get_embedder().stats()
+
+
+@router.get("/profiles")
+async def get_profiles():
+    """列出以 profile=true 產生的索引 / 搜尋 profile（新到舊）。"""
+    return list_profiles()
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    """下載 profile：.speedscope.json 可直接載入 speedscope，.pstats 以 pstats / snakeviz 開啟。"""
+    path = get_profile_path(name)
+    if path is None:
+        raise HTTPException(404, f"Profile '{name}' not found")
+    media_type = "application/json" if name.endswith(".json") else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=name)
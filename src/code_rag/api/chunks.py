@@ -0,0 +1,51 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query
+
+from code_rag.api.search import to_chunk_context
+from code_rag.config import settings
+from code_rag.models.search import ChunkContext, ChunkLocation
+from code_rag.utils.context import merge_chunks
+
+router = APIRouter()
+
+
+@router.get("/chunks/context", response_model=ChunkContext)
+async def get_chunk_context(
+    project: str = Query(..., description="專案名稱"),
+    file_path: str = Query(..., description="專案內的相對檔案路徑"),
+    chunk_index: int = Query(..., ge=0, description="中心 chunk 的索引"),
+    radius: int = Query(1, ge=0, le=10, description="前後各取幾個 chunk"),
+    ref: str | None = Query(None, description="ref-aware 專案的 ref（取該 ref 中的檔案版本）"),
+):
+    """依確定性 point ID 取得 chunk 及其前後相鄰 chunk，合併為連續內容。"""
+    from code_rag.main import get_qdrant, get_state_db
+    from code_rag.storage.state import ref_state_key
+
+    qdrant = get_qdrant()
+    hit = {"project_name": project, "file_path": file_path, "chunk_index": chunk_index}
+    if ref is not None:
+        hit["file_hash"] = get_state_db().get_file_hash(ref_state_key(project, ref), file_path)
+        if hit["file_hash"] is None:
+            raise HTTPException(404, f"'{file_path}' not found in ref '{ref}' of '{project}'")
+    neighbors = (await asyncio.to_thread(qdrant.get_neighbor_chunks, [hit], radius))[0]
+    if not neighbors:
+        raise HTTPException(404, f"Chunk {chunk_index} of '{file_path}' not found in '{project}'")
+    return to_chunk_context(merge_chunks(neighbors))
+
+
+@router.get("/chunks/duplicates", response_model=list[ChunkLocation])
+async def get_chunk_duplicates(
+    project: str = Query(..., description="專案名稱"),
+    file_path: str = Query(..., description="代表 chunk 的相對檔案路徑"),
+    chunk_index: int = Query(..., ge=0, description="代表 chunk 的索引"),
+):
+    """列出與此 chunk 近似重複、只記錄位置未寫入索引的其他 chunk。"""
+    from code_rag.main import get_qdrant, get_state_db
+
+    cluster_id = get_qdrant().make_point_id(project, file_path, chunk_index)
+    members = get_state_db().get_cluster_members(project, [cluster_id]).get(cluster_id, [])
+    return [
+        ChunkLocation(**{**m, "file_path": settings.to_host_path(m["file_path"])})
+        for m in members
+    ]
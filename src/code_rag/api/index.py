@@ -1,13 +1,17 @@
 import asyncio
+import json
 import logging
-import threading
-import traceback
+import os
+import socket
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
 from code_rag.config import settings
 from code_rag.models.search import IndexRequest, IndexStatus
-from code_rag.indexer.pipeline import run_index
+from code_rag.indexer.progress import IndexProgress, StoredProgress, get_job, start_job
+from code_rag.profiling import Profiler
+from code_rag.storage.state import ref_state_key
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +19,8 @@ router = APIRouter()
 
 # 背景索引任務追蹤
 _index_tasks: set[asyncio.Task] = set()
-_index_lock = threading.Lock()
+# inline 模式下記錄在 index_jobs.worker 的名稱
+_WORKER_NAME = f"api:{socket.gethostname()}:{os.getpid()}"
 
 
 def get_index_tasks() -> set[asyncio.Task]:
@@ -25,54 +30,137 @@ def get_index_tasks() -> set[asyncio.Task]:
 
 @router.post("/index", response_model=IndexStatus)
 async def trigger_index(req: IndexRequest):
-    """觸發專案索引（背景執行）。"""
+    """觸發專案索引。
+
+    inline 模式在本行程背景執行；queue 模式只寫入 index_jobs，由 index worker 認領。
+    「是否已有任務」的檢查與建立在同一個 SQLite 交易內，多個 API worker 同時觸發也安全。
+    指定 ref 時以 ref-aware 模式索引；同一專案不可混用有 ref 與沒有 ref 的索引。
+    """
+    from code_rag.indexer.jobs import run_job
     from code_rag.main import get_qdrant, get_state_db, get_embedder
 
     state_db = get_state_db()
-    qdrant = get_qdrant()
-    embedder = get_embedder()
+    refs = state_db.get_refs(req.project_name)
+    if req.ref is None and refs:
+        raise HTTPException(
+            400, f"Project '{req.project_name}' is indexed per ref; specify one of: {', '.join(refs)}"
+        )
+    if req.ref is not None and not refs and state_db.get_index_status(req.project_name):
+        raise HTTPException(
+            400, f"Project '{req.project_name}' was indexed without refs; delete it or use another name"
+        )
+    status_key = ref_state_key(req.project_name, req.ref)
 
     # 路徑轉換
     container_path = str(settings.to_container_path(req.path))
 
-    # 原子化檢查與設定狀態
-    with _index_lock:
-        status = state_db.get_index_status(req.project_name)
-        if status and status["status"] == "running":
-            raise HTTPException(400, f"Project '{req.project_name}' is already being indexed")
-        state_db.set_index_status(req.project_name, "pending")
-
-    # 背景執行索引
-    async def _run():
-        try:
-            await asyncio.to_thread(
-                run_index, req.project_name, container_path, qdrant, state_db, embedder
-            )
-        except Exception as e:
-            logger.error("Index failed for '%s': %s\n%s", req.project_name, e, traceback.format_exc())
-            state_db.set_index_status(req.project_name, "failed", error=str(e))
-
-    task = asyncio.create_task(_run())
+    inline = settings.index_mode == "inline"
+    job_id = state_db.create_job(
+        req.project_name, container_path, force=req.force, profile=req.profile,
+        worker=_WORKER_NAME if inline else None, ref=req.ref,
+    )
+    if job_id is None:
+        raise HTTPException(400, f"Project '{req.project_name}' is already being indexed")
+    state_db.set_index_status(status_key, "pending")
+    if not inline:
+        return IndexStatus(project_name=req.project_name, ref=req.ref, status="pending")
+
+    # 先建立任務進度，POST 回應後即可訂閱 /events
+    progress = start_job(req.project_name, job_id)
+    profiler = Profiler("index", req.project_name) if req.profile else None
+    job = state_db.get_job(job_id)
+
+    # 背景執行索引（run_job 自行記錄失敗）
+    task = asyncio.create_task(
+        asyncio.to_thread(
+            run_job, job, get_qdrant(), state_db, get_embedder(), progress, profiler
+        )
+    )
     _index_tasks.add(task)
     task.add_done_callback(_index_tasks.discard)
 
-    return IndexStatus(project_name=req.project_name, status="pending")
+    return IndexStatus(
+        project_name=req.project_name,
+        ref=req.ref,
+        status="pending",
+        profile=profiler.name if profiler else None,
+    )
 
 
 @router.get("/index/{project_name}/status", response_model=IndexStatus)
-async def get_index_status(project_name: str):
+async def get_index_status(
+    project_name: str,
+    ref: str | None = Query(None, description="ref-aware 專案的 ref"),
+):
     """查詢索引進度。"""
     from code_rag.main import get_state_db
 
     state_db = get_state_db()
-    status = state_db.get_index_status(project_name)
+    status = state_db.get_index_status(ref_state_key(project_name, ref))
     if not status:
-        raise HTTPException(404, f"Project '{project_name}' not found")
+        name = project_name if ref is None else f"{project_name}' ref '{ref}"
+        raise HTTPException(404, f"Project '{name}' not found")
     return IndexStatus(
         project_name=project_name,
+        ref=ref,
         status=status["status"],
         total_files=status["total_files"],
         processed_files=status["processed_files"],
         total_chunks=status["total_chunks"],
         error=status.get("error"),
     )
+
+
+@router.get("/index/{project_name}/events")
+async def stream_index_events(project_name: str, request: Request):
+    """以 Server-Sent Events 推送索引任務的即時進度。
+
+    事件：progress（階段、檔案 / chunk / embedding 速率、ETA）、error（每個錯誤一次）、
+    done（任務結束後送出最終狀態並關閉連線）。任務在本行程執行時直接讀取記憶體中的
+    進度，否則讀取執行它的行程寫入 index_jobs 的快照（每 job_heartbeat_s 秒更新）。
+    """
+    from code_rag.main import get_state_db
+
+    state_db = get_state_db()
+    job = state_db.get_latest_job(project_name, kind="index")
+    progress: IndexProgress | StoredProgress | None = get_job(project_name)
+    if job and (progress is None or progress.job_id != job["id"]):
+        progress = StoredProgress(state_db, job)
+    if progress is None:
+        raise HTTPException(404, f"No index job for '{project_name}'")
+    return StreamingResponse(
+        _progress_events(progress, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _progress_events(progress: IndexProgress | StoredProgress, request: Request):
+    interval = settings.index_events_interval_s
+    last_version = -1
+    last_error = 0
+    idle = 0.0
+    while True:
+        progress.refresh()
+        for err in progress.errors_after(last_error):
+            last_error = err["seq"]
+            yield _sse("error", err)
+        if progress.finished is not None:
+            yield _sse("done", progress.snapshot())
+            return
+        if progress.version != last_version:
+            last_version = progress.version
+            idle = 0.0
+            yield _sse("progress", progress.snapshot())
+        elif idle >= 15:
+            # 沒有變化時定期送註解行，避免 proxy 關閉閒置連線
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        if await request.is_disconnected():
+            return
+        await asyncio.sleep(interval)
+        idle += interval
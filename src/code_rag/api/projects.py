@@ -1,5 +1,10 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import tempfile
 
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from code_rag.config import settings
 from code_rag.models.project import Project
 
 router = APIRouter()
@@ -7,43 +12,147 @@ router = APIRouter()
 
 @router.get("/projects", response_model=list[Project])
 async def list_projects():
-    """列出所有已索引的專案。"""
-    from code_rag.main import get_state_db, get_qdrant
+    """列出所有已索引的專案（讀取本地彙總的統計，不查詢 Qdrant）。"""
+    from code_rag.main import get_state_db
 
     state_db = get_state_db()
-    qdrant = get_qdrant()
-    projects = state_db.get_all_projects()
-
-    result = []
-    for p in projects:
-        stats = qdrant.get_project_stats(p["project_name"])
-        result.append(
-            Project(
-                name=p["project_name"],
-                path="",
-                file_count=p.get("total_files", 0),
-                chunk_count=stats["chunk_count"],
-                indexed_at=p.get("completed_at"),
-            )
+    return [
+        Project(
+            name=p["ref_project"] or p["project_name"],
+            ref=p["ref"],
+            path=p.get("path") or "",
+            status=p["status"],
+            languages=sorted(p["languages"], key=p["languages"].get, reverse=True),
+            language_chunks=p["languages"],
+            chunk_types=p["chunk_types"],
+            file_count=p.get("file_count") or p.get("total_files") or 0,
+            chunk_count=p.get("chunk_count") or 0,
+            bytes_indexed=p.get("bytes_indexed") or 0,
+            last_index_duration=p.get("last_index_duration"),
+            indexed_at=p.get("completed_at"),
         )
-    return result
+        for p in state_db.get_project_catalog()
+    ]
 
 
 @router.delete("/projects/{project_name}")
-async def delete_project(project_name: str):
-    """移除專案索引。"""
+async def delete_project(
+    project_name: str,
+    ref: str | None = Query(None, description="只移除 ref-aware 專案的這個 ref"),
+):
+    """移除專案索引（ref-aware 專案可只移除一個 ref，其他 ref 共用的向量會保留）。"""
     from code_rag.main import get_state_db, get_qdrant
+    from code_rag.indexer.refs import delete_ref, delete_ref_project
 
     state_db = get_state_db()
     qdrant = get_qdrant()
 
-    status = state_db.get_index_status(project_name)
-    if not status:
+    refs = state_db.get_refs(project_name)
+    if ref is not None and ref not in refs:
+        raise HTTPException(404, f"Project '{project_name}' has no ref '{ref}'")
+    statuses = [state_db.get_index_status(key) for key in refs.values()] if refs else [
+        state_db.get_index_status(project_name)
+    ]
+    if not any(statuses):
         raise HTTPException(404, f"Project '{project_name}' not found")
 
-    if status["status"] == "running":
+    job = state_db.get_latest_job(project_name)
+    if any(s and s["status"] == "running" for s in statuses) or (
+        job and job["status"] in ("queued", "running")
+    ):
         raise HTTPException(409, f"Project '{project_name}' is currently being indexed, cannot delete")
 
-    qdrant.delete_by_project(project_name)
-    state_db.remove_project(project_name)
+    if ref is not None:
+        await asyncio.to_thread(delete_ref, project_name, ref, qdrant, state_db)
+        return {"message": f"Ref '{ref}' of project '{project_name}' removed"}
+    if refs:
+        await asyncio.to_thread(delete_ref_project, project_name, qdrant, state_db)
+    else:
+        await asyncio.to_thread(qdrant.delete_by_project, project_name)
+        await asyncio.to_thread(state_db.remove_project, project_name)
     return {"message": f"Project '{project_name}' removed"}
+
+
+def _reject_ref(state_db, name: str):
+    """ref-aware 專案的 ref（<project>@<ref>）與其他 ref 共用 point，不支援以專案為單位的操作。"""
+    if state_db.get_refs(name) or state_db.get_ref_owner(name):
+        raise HTTPException(400, f"'{name}' is a ref-aware project; this operation is not supported for refs")
+
+
+@router.post("/projects/{project_name}/tune")
+async def tune_project(project_name: str):
+    """為專案自動調校 hnsw_ef（依 p95 延遲預算與 recall 目標）。"""
+    from code_rag.main import get_state_db, get_qdrant
+    from code_rag.storage.autotune import tune_hnsw_ef
+
+    state_db = get_state_db()
+    qdrant = get_qdrant()
+
+    if not state_db.get_index_status(project_name):
+        raise HTTPException(404, f"Project '{project_name}' not found")
+    _reject_ref(state_db, project_name)
+
+    result = await asyncio.to_thread(tune_hnsw_ef, qdrant, state_db, project_name)
+    if result is None:
+        raise HTTPException(409, f"Project '{project_name}' has no indexed vectors")
+    return result
+
+
+@router.post("/projects/{project_name}/reconcile")
+async def reconcile_project(project_name: str):
+    """以 Qdrant facet 計數校正專案統計。"""
+    from code_rag.main import get_state_db, get_qdrant
+    from code_rag.storage.catalog import reconcile_project_stats
+
+    state_db = get_state_db()
+    qdrant = get_qdrant()
+
+    if not state_db.get_index_status(project_name):
+        raise HTTPException(404, f"Project '{project_name}' not found")
+    _reject_ref(state_db, project_name)
+
+    return await asyncio.to_thread(reconcile_project_stats, qdrant, state_db, project_name)
+
+
+@router.get("/projects/{project_name}/export")
+async def export_project_snapshot(project_name: str):
+    """以 gzip JSONL 串流匯出專案 snapshot（向量、payload 與增量索引狀態）。"""
+    from code_rag.main import get_state_db, get_qdrant
+    from code_rag.storage.snapshot import begin_job, export_project
+
+    state_db = get_state_db()
+    if not state_db.get_index_status(project_name):
+        raise HTTPException(404, f"Project '{project_name}' not found")
+    _reject_ref(state_db, project_name)
+    # 在回應開始前登記任務，專案正在索引時才能回 409
+    try:
+        job_id = begin_job(state_db, project_name, "export")
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+    return StreamingResponse(
+        export_project(get_qdrant(), state_db, project_name, job_id),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{project_name}.jsonl.gz"'},
+    )
+
+
+@router.post("/projects/{project_name}/import")
+async def import_project_snapshot(project_name: str, request: Request, path: str | None = None):
+    """由 request body 的 snapshot 匯入專案（取代同名專案）；path 為專案在用戶本地的路徑。"""
+    from code_rag.main import get_state_db, get_qdrant
+    from code_rag.storage.snapshot import SnapshotError, import_project
+
+    container_path = str(settings.to_container_path(path)) if path else None
+    # 先串流寫入暫存檔，再於執行緒中解壓與寫入，避免整個 body 留在記憶體
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as body:
+        async for data in request.stream():
+            body.write(data)
+        body.seek(0)
+        try:
+            return await asyncio.to_thread(
+                import_project, get_qdrant(), get_state_db(), body, project_name, container_path
+            )
+        except SnapshotError as e:
+            raise HTTPException(400, str(e))
+        except RuntimeError as e:
+            raise HTTPException(409, str(e))
@@ -1,45 +1,291 @@
-import asyncio
+from contextlib import nullcontext
+from typing import Literal
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 
 from code_rag.config import settings
-from code_rag.models.search import SearchResult
+from code_rag.metrics import search_phase, server_timing, track_search_phases
+from code_rag.models.search import ChunkContext, ChunkLocation, FileGroup, SearchResult
+from code_rag.profiling import Profiler, to_thread
+from code_rag.utils.context import merge_chunks
+from code_rag.utils.paths import in_scope, normalize_path
 
 router = APIRouter()
 
 
 @router.get("/search", response_model=list[SearchResult])
 async def search(
+    response: Response,
     q: str = Query(..., description="搜尋查詢"),
-    project: str | None = Query(None, description="限定專案"),
-    language: str | None = Query(None, description="限定語言"),
+    project: list[str] | None = Query(None, description="限定專案（可重複指定多個）"),
+    language: list[str] | None = Query(None, description="限定語言（可重複指定多個）"),
+    path_prefix: list[str] | None = Query(
+        None, description="限定在目錄或檔案之下，例如 services/billing（可重複指定多個）"
+    ),
+    exclude: list[str] | None = Query(
+        None, description="排除的路徑 glob，例如 **/tests/**、*.min.js（可重複指定多個）"
+    ),
+    ref: list[str] | None = Query(
+        None, description="限定 ref-aware 專案的 branch / tag（可重複指定多個）"
+    ),
     limit: int = Query(10, ge=1, le=100, description="回傳數量"),
+    oversampling: float | None = Query(None, ge=1.0, le=16.0, description="量化搜尋的過取樣倍率"),
+    rescore: bool | None = Query(None, description="量化搜尋後以原始向量重新評分"),
+    ef: int | None = Query(None, ge=4, le=4096, description="覆寫 HNSW 搜尋的 hnsw_ef"),
+    exact: bool = Query(False, description="略過 HNSW，執行精確搜尋"),
+    expand: int = Query(0, ge=0, le=10, description="附帶命中 chunk 前後各 N 個 chunk 的內容"),
+    mode: Literal["flat", "hierarchical"] = Query(
+        "flat", description="hierarchical：先以摘要向量找出檔案，再搜尋檔案內的 chunk"
+    ),
+    files: int = Query(20, ge=1, le=200, description="hierarchical 模式的候選檔案數"),
+    profile: bool = Query(False, description="以 profiler 執行此請求，檔名回傳於 X-Profile header"),
 ):
     """語意搜尋 codebase。"""
-    from code_rag.main import get_qdrant, get_embedder
+    from code_rag.main import get_qdrant
 
-    embedder = get_embedder()
     qdrant = get_qdrant()
-
-    query_vector = await asyncio.to_thread(embedder.embed_single, q)
-    results = qdrant.search(
-        query_vector=query_vector,
-        limit=limit,
-        project_name=project,
-        language=language,
+    timings = track_search_phases()
+    profiler = (
+        Profiler("search", ",".join(project) if project else None, scope="request")
+        if profile else None
     )
+    with profiler or nullcontext():
+        results = await _run_search(
+            q, project, language, limit, mode, files,
+            path_prefix=path_prefix, exclude=exclude, ref=ref,
+            exact=exact, hnsw_ef=ef, oversampling=oversampling, rescore=rescore,
+        )
 
+        contexts: list[ChunkContext | None] = [None] * len(results)
+        if expand and results:
+            with search_phase("expand"):
+                neighbors = await to_thread(qdrant.get_neighbor_chunks, results, expand)
+            contexts = [
+                to_chunk_context(merge_chunks(group)) if group else None for group in neighbors
+            ]
+
+        duplicates = await get_duplicate_locations(results)
+    response.headers["Server-Timing"] = server_timing(timings)
+    if profiler and profiler.name:
+        response.headers["X-Profile"] = profiler.name
     return [
-        SearchResult(
-            content=r["content"],
-            file_path=settings.to_host_path(r["file_path"]),
-            project_name=r["project_name"],
-            language=r["language"],
-            chunk_type=r.get("chunk_type", "code"),
-            name=r.get("name"),
-            start_line=r.get("start_line", 0),
-            end_line=r.get("end_line", 0),
-            score=r["score"],
+        to_search_result(r, context, duplicates.get(i, []))
+        for i, (r, context) in enumerate(zip(results, contexts))
+    ]
+
+
+@router.get("/search/files", response_model=list[FileGroup])
+async def search_files(
+    response: Response,
+    q: str = Query(..., description="搜尋查詢"),
+    project: list[str] | None = Query(None, description="限定專案（可重複指定多個）"),
+    language: list[str] | None = Query(None, description="限定語言（可重複指定多個）"),
+    path_prefix: list[str] | None = Query(
+        None, description="限定在目錄或檔案之下，例如 services/billing（可重複指定多個）"
+    ),
+    exclude: list[str] | None = Query(
+        None, description="排除的路徑 glob，例如 **/tests/**、*.min.js（可重複指定多個）"
+    ),
+    ref: list[str] | None = Query(
+        None, description="限定 ref-aware 專案的 branch / tag（可重複指定多個）"
+    ),
+    limit: int = Query(30, ge=1, le=200, description="chunk 回傳數量（分組前）"),
+    files: int = Query(10, ge=1, le=200, description="候選檔案數"),
+    ef: int | None = Query(None, ge=4, le=4096, description="覆寫 HNSW 搜尋的 hnsw_ef"),
+):
+    """以 coarse-to-fine 搜尋，結果依檔案分組（依檔案內最高分排序）。"""
+    timings = track_search_phases()
+    results = await _run_search(
+        q, project, language, limit, "hierarchical", files,
+        hnsw_ef=ef, path_prefix=path_prefix, exclude=exclude, ref=ref,
+    )
+
+    duplicates = await get_duplicate_locations(results)
+    response.headers["Server-Timing"] = server_timing(timings)
+    groups: dict[tuple[str, str], list[SearchResult]] = {}
+    for i, r in enumerate(results):
+        groups.setdefault((r["project_name"], r["file_path"]), []).append(
+            to_search_result(r, duplicates=duplicates.get(i, []))
+        )
+    grouped = [
+        FileGroup(
+            project_name=project_name,
+            file_path=settings.to_host_path(file_path),
+            score=max(r.score for r in hits),
+            results=hits,
         )
-        for r in results
+        for (project_name, file_path), hits in groups.items()
     ]
+    grouped.sort(key=lambda g: g.score, reverse=True)
+    return grouped
+
+
+async def _run_search(
+    q: str,
+    project: list[str] | None,
+    language: list[str] | None,
+    limit: int,
+    mode: str,
+    top_files: int,
+    *,
+    hnsw_ef: int | None = None,
+    **search_kwargs,
+) -> list[dict]:
+    from code_rag.main import get_qdrant, get_embedder, get_state_db
+
+    embedder = get_embedder()
+    qdrant = get_qdrant()
+
+    # 未指定 ef 時使用該專案自動調校的結果（只在限定單一專案時）
+    if hnsw_ef is None and project and len(project) == 1:
+        tuning = await to_thread(get_state_db().get_search_tuning, project[0])
+        if tuning:
+            hnsw_ef = tuning["hnsw_ef"]
+
+    if mode == "hierarchical" and not settings.summary_vectors:
+        raise HTTPException(400, "Hierarchical search requires SUMMARY_VECTORS=true")
+
+    with search_phase("embed"):
+        query_vector = await to_thread(embedder.embed_single, q)
+    # Qdrant 查詢同樣放到執行緒，避免阻塞 event loop（排隊時間會被算進其他請求的 embed 階段）
+    with search_phase("query"):
+        if mode == "flat":
+            results = await to_thread(
+                qdrant.search,
+                query_vector=query_vector,
+                limit=limit,
+                project_name=project,
+                language=language,
+                hnsw_ef=hnsw_ef,
+                **search_kwargs,
+            )
+            if settings.dedup_chunks and (
+                search_kwargs.get("path_prefix") or search_kwargs.get("exclude")
+            ):
+                results = await to_thread(
+                    _with_scoped_duplicates,
+                    results, query_vector, limit, project, language, hnsw_ef, search_kwargs,
+                )
+            return results
+        return await to_thread(
+            qdrant.search_hierarchical,
+            query_vector,
+            limit,
+            project,
+            language,
+            top_files=top_files,
+            hnsw_ef=hnsw_ef,
+            **search_kwargs,
+        )
+
+
+def _with_scoped_duplicates(
+    results: list[dict],
+    query_vector,
+    limit: int,
+    project: list[str] | None,
+    language: list[str] | None,
+    hnsw_ef: int | None,
+    search_kwargs: dict,
+) -> list[dict]:
+    """路徑範圍搜尋補上「代表在範圍外、但有成員在範圍內」的 cluster。
+
+    重複 chunk 不是 point，Qdrant 的路徑過濾只看得到代表的位置。先由 StateDB 找出
+    範圍內的成員，再只在這些 cluster 的代表中搜尋，命中時以範圍內的成員位置回傳
+    （cluster_id 記錄原本的代表），與一般結果依分數合併。
+    """
+    from code_rag.main import get_qdrant, get_state_db
+
+    qdrant = get_qdrant()
+    path_prefix = search_kwargs.get("path_prefix")
+    exclude = search_kwargs.get("exclude")
+    prefixes = sorted({normalize_path(p) for p in path_prefix or ()} - {""})
+    found = {_cluster_id(qdrant, r) for r in results}
+    members: dict[str, dict] = {}
+    for member in get_state_db().get_duplicate_members(project, prefixes):
+        cluster_id = member["cluster_id"]
+        if cluster_id in found or cluster_id in members:
+            continue
+        if in_scope(member["file_path"], prefixes, exclude):
+            members[cluster_id] = member
+    if not members:
+        return results
+
+    unscoped = {k: v for k, v in search_kwargs.items() if k not in ("path_prefix", "exclude")}
+    hits = qdrant.search(
+        query_vector, limit, project, language, ids=list(members), hnsw_ef=hnsw_ef, **unscoped
+    )
+    surfaced = []
+    for hit in hits:
+        cluster_id = _cluster_id(qdrant, hit)
+        member = members[cluster_id]
+        surfaced.append({
+            **hit,
+            "file_path": member["file_path"],
+            "chunk_index": member["chunk_index"],
+            "start_line": member["start_line"],
+            "end_line": member["end_line"],
+            "cluster_id": cluster_id,
+        })
+    merged = sorted(results + surfaced, key=lambda r: r["score"], reverse=True)
+    return merged[:limit]
+
+
+def _cluster_id(qdrant, r: dict) -> str:
+    """結果所屬 cluster 的 ID：代表的 point ID；以成員位置回傳的結果另記於 cluster_id。"""
+    return r.get("cluster_id") or qdrant.make_point_id(
+        r["project_name"], r["file_path"], r["chunk_index"]
+    )
+
+
+async def get_duplicate_locations(results: list[dict]) -> dict[int, list[ChunkLocation]]:
+    """查詢每個結果（cluster 代表）在 StateDB 中記錄的近似重複位置，key 為結果索引。"""
+    from code_rag.main import get_qdrant, get_state_db
+
+    if not settings.dedup_chunks or not results:
+        return {}
+    qdrant = get_qdrant()
+    state_db = get_state_db()
+    cluster_ids = [_cluster_id(qdrant, r) for r in results]
+    members: dict[str, list[dict]] = {}
+    with search_phase("duplicates"):
+        for project in {r["project_name"] for r in results}:
+            members.update(
+                await to_thread(state_db.get_cluster_members, project, cluster_ids)
+            )
+    # 以成員位置回傳的結果不重複列出自己
+    return {
+        i: [
+            ChunkLocation(**{**m, "file_path": settings.to_host_path(m["file_path"])})
+            for m in members[cluster_id]
+            if (m["file_path"], m["chunk_index"]) != (r["file_path"], r["chunk_index"])
+        ]
+        for i, (r, cluster_id) in enumerate(zip(results, cluster_ids))
+        if cluster_id in members
+    }
+
+
+def to_search_result(
+    r: dict,
+    context: ChunkContext | None = None,
+    duplicates: list[ChunkLocation] | None = None,
+) -> SearchResult:
+    return SearchResult(
+        content=r["content"],
+        file_path=settings.to_host_path(r["file_path"]),
+        project_name=r["project_name"],
+        language=r["language"],
+        chunk_type=r.get("chunk_type", "code"),
+        name=r.get("name"),
+        symbols=r.get("symbols") or [],
+        start_line=r.get("start_line", 0),
+        end_line=r.get("end_line", 0),
+        score=r["score"],
+        context=context,
+        duplicates=duplicates or [],
+        refs=r.get("refs") or [],
+    )
+
+
+def to_chunk_context(merged: dict) -> ChunkContext:
+    return ChunkContext(**{**merged, "file_path": settings.to_host_path(merged["file_path"])})
@@ -0,0 +1,119 @@
+"""Matryoshka 截斷維度 benchmark：比較各維度的延遲、記憶體與 recall。
+
+從 collection 取出已索引 chunk 的內容，以完整維度重新嵌入後，
+在記憶體內的 Qdrant 中分別以各截斷維度建索引，並以完整維度的
+搜尋結果作為 recall 基準。
+
+用法：
+    python -m code_rag.bench.dims --project my-project --dims 1024 512 256
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PointStruct,
+    VectorParams,
+)
+
+from code_rag.config import settings
+from code_rag.indexer.embedder import create_embedder
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.recall import percentile
+from code_rag.utils.vectors import truncate
+
+
+def _load_texts(qdrant: QdrantStorage, project: str | None, sample: int) -> list[str]:
+    scroll_filter = None
+    if project:
+        scroll_filter = Filter(
+            must=[FieldCondition(key="project_name", match=MatchValue(value=project))]
+        )
+    points, _ = qdrant.client.scroll(
+        collection_name=qdrant.collection,
+        scroll_filter=scroll_filter,
+        limit=sample,
+        with_payload=["content"],
+        with_vectors=False,
+    )
+    return [p.payload["content"] for p in points if p.payload.get("content")]
+
+
+def _run_dims(vectors: np.ndarray, queries: np.ndarray, dims: int, k: int):
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        collection_name="bench",
+        vectors_config=VectorParams(size=dims, distance=Distance.COSINE),
+    )
+    client.upsert(
+        collection_name="bench",
+        points=[
+            PointStruct(id=i, vector=v) for i, v in enumerate(truncate(vectors, dims).tolist())
+        ],
+    )
+    results: list[list[int]] = []
+    latencies: list[float] = []
+    for q in queries:
+        start = time.perf_counter()
+        hits = client.query_points(
+            collection_name="bench", query=truncate(q, dims).tolist(), limit=k
+        ).points
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([h.id for h in hits])
+    client.close()
+    latencies.sort()
+    return results, latencies
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Matryoshka dimension benchmark")
+    parser.add_argument("--project", default=None)
+    parser.add_argument("--sample", type=int, default=2000, help="嵌入的 chunk 數")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dims", type=int, nargs="+", default=[1024, 512, 256])
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    qdrant = QdrantStorage()
+    embedder = create_embedder()
+    try:
+        texts = _load_texts(qdrant, args.project, args.sample)
+        if not texts:
+            print("No chunks found to sample", file=sys.stderr)
+            return 1
+        vectors = embedder.embed_batch(texts)
+    finally:
+        qdrant.client.close()
+        embedder.close()
+
+    queries = vectors[: args.queries]
+    full_dims = settings.embedding_dims
+    baseline, _ = _run_dims(vectors, queries, full_dims, args.k)
+
+    report = []
+    for dims in args.dims:
+        results, latencies = _run_dims(vectors, queries, dims, args.k)
+        recall = sum(
+            len(set(r) & set(b)) / len(b) for r, b in zip(results, baseline) if b
+        ) / len(baseline)
+        report.append({
+            "dims": dims,
+            "recall_at_k": recall,
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "vector_bytes": len(vectors) * dims * 4,
+        })
+    print(json.dumps({"chunks": len(vectors), "k": args.k, "results": report}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
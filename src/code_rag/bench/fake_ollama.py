@@ -0,0 +1,91 @@
+"""模擬 Ollama /api/embed 的 HTTP 服務，供離線 benchmark 使用。
+
+回應延遲 = latency_ms + per_text_ms × 批次大小，同時處理的請求數以
+concurrency 限制（模擬單一 GPU 的模型執行器）。向量由 HashingEmbedder 產生，
+具確定性，共享 token 越多的文字越相似。
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+from code_rag.indexer.embedder import HashingEmbedder
+
+
+class FakeOllama:
+    """以 with 啟動與關閉；url 為服務位址。"""
+
+    def __init__(
+        self,
+        dims: int,
+        latency_ms: float = 20.0,
+        per_text_ms: float = 0.5,
+        concurrency: int = 1,
+    ):
+        self.embedder = HashingEmbedder(dims)
+        self.latency = latency_ms / 1000
+        self.per_text = per_text_ms / 1000
+        self.slots = threading.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-ollama", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def embed(self, texts: list[str]) -> bytes:
+        with self.slots:
+            time.sleep(self.latency + self.per_text * len(texts))
+            vectors = self.embedder.embed_batch(texts)
+        with self._lock:
+            self.requests += 1
+            self.texts += len(texts)
+        return orjson.dumps({"embeddings": vectors}, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._reply(200, b"Ollama is running")
+
+            def do_POST(self):
+                if self.path != "/api/embed":
+                    self._reply(404, b"not found")
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                texts = orjson.loads(body)["input"]
+                if isinstance(texts, str):
+                    texts = [texts]
+                self._reply(200, fake.embed(texts), "application/json")
+
+            def _reply(self, status: int, body: bytes, content_type: str = "text/plain"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
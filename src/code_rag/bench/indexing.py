@@ -0,0 +1,261 @@
+"""索引吞吐量 benchmark：合成 repository + 模擬 Ollama + 行程內 Qdrant。
+
+依序量測三種情境：
+- full：全新索引
+- noop：未變更的重新索引（只有掃描與 hash 檢查）
+- delta：修改 --delta 比例的檔案後重新索引
+
+每個情境記錄 files/s、chunks/s、峰值 RSS 與各階段耗時（取自 Prometheus
+histogram），結果以 JSON 輸出；指定 --baseline 時附上與先前結果的比值。
+
+用法：
+    python -m code_rag.bench.indexing --files 2000 --file-kb 6 --output bench.json
+    python -m code_rag.bench.indexing --backend hashing --baseline old.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import ExitStack
+from pathlib import Path
+
+from prometheus_client import REGISTRY
+from qdrant_client import QdrantClient
+
+from code_rag.bench.fake_ollama import FakeOllama
+from code_rag.bench.synthetic import LANGUAGES, generate_repo, mutate_repo
+from code_rag.config import settings
+from code_rag.indexer.embedder import Embedder, HashingEmbedder, OllamaEmbedder
+from code_rag.indexer.pipeline import run_index
+from code_rag.indexer.progress import IndexProgress
+from code_rag.indexer.scheduler import EmbeddingScheduler
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.state import StateDB
+
+STAGES = ("scan", "hash", "chunk", "dedup", "embed", "write", "state")
+PROJECT = "bench"
+
+
+class _RssSampler:
+    """背景取樣目前的 RSS（Linux 讀 /proc/self/statm），記錄期間的峰值。"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        try:
+            pages = int(Path("/proc/self/statm").read_text().split()[1])
+            return pages * resource.getpagesize()
+        except OSError:
+            # 非 Linux：只能取得整個行程的峰值（KB，macOS 為 bytes）
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def _stage_seconds() -> dict[str, float]:
+    return {
+        stage: REGISTRY.get_sample_value("code_rag_index_stage_seconds_sum", {"stage": stage}) or 0.0
+        for stage in STAGES
+    }
+
+
+def _run_scenario(
+    name: str,
+    repo: Path,
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    embedder: Embedder,
+    changed_files: int | None,
+) -> dict:
+    """執行一次 run_index；changed_files 為 None 時視為所有檔案都需處理。"""
+    progress = IndexProgress(PROJECT)
+    before = _stage_seconds()
+    with _RssSampler() as rss:
+        started = time.perf_counter()
+        run_index(PROJECT, str(repo), qdrant, state_db, embedder, progress=progress)
+        elapsed = time.perf_counter() - started
+    after = _stage_seconds()
+    snapshot = progress.snapshot()
+    if changed_files is None:
+        changed_files = snapshot["total_files"]
+    return {
+        "scenario": name,
+        "seconds": elapsed,
+        "files": snapshot["total_files"],
+        "changed_files": changed_files,
+        "files_per_second": snapshot["total_files"] / elapsed,
+        "changed_files_per_second": changed_files / elapsed,
+        "chunks": snapshot["total_chunks"],
+        "chunks_per_second": snapshot["total_chunks"] / elapsed,
+        "embedded_texts": snapshot["embedded_texts"],
+        "embed_batches": snapshot["embed_batches"],
+        "errors": snapshot["errors"],
+        "peak_rss_mb": rss.peak / 1024 / 1024,
+        "stages": {stage: after[stage] - before[stage] for stage in STAGES},
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(report: dict, baseline: dict) -> dict:
+    """各情境相對 baseline 的比值（>1 表示變快 / 記憶體變多）。"""
+    old = {s["scenario"]: s for s in baseline.get("scenarios", [])}
+    comparison = {}
+    for s in report["scenarios"]:
+        base = old.get(s["scenario"])
+        if not base:
+            continue
+        comparison[s["scenario"]] = {
+            "speedup": base["seconds"] / s["seconds"] if s["seconds"] else None,
+            "peak_rss_ratio": s["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] else None,
+            "baseline_commit": baseline.get("commit"),
+        }
+    return comparison
+
+
+def open_qdrant(target: str, workdir: Path) -> QdrantStorage:
+    if target == "memory":
+        return QdrantStorage(client=QdrantClient(location=":memory:"))
+    if target == "local":
+        return QdrantStorage(client=QdrantClient(path=str(workdir / "qdrant")))
+    # 遠端 Qdrant：使用獨立的 collection，結束後刪除
+    settings.qdrant_collection = f"bench_{int(time.time())}"
+    return QdrantStorage(location=target)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Indexing throughput benchmark")
+    parser.add_argument("--files", type=int, default=500, help="合成 repository 的檔案數")
+    parser.add_argument("--languages", nargs="+", default=["python", "typescript", "go"], choices=LANGUAGES)
+    parser.add_argument("--file-kb", type=float, default=4.0, help="平均檔案大小（KB）")
+    parser.add_argument("--depth", type=int, default=4, help="最大目錄深度")
+    parser.add_argument("--noise-files", type=int, default=200, help="node_modules / .git 下的雜訊檔案數")
+    parser.add_argument("--delta", type=float, default=0.02, help="delta 情境修改的檔案比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dims", type=int, default=256, help="embedding 維度")
+    parser.add_argument("--backend", choices=["fake-ollama", "hashing"], default="fake-ollama")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="模擬 Ollama 每個請求的延遲")
+    parser.add_argument("--per-text-ms", type=float, default=0.5, help="模擬 Ollama 每段文字的延遲")
+    parser.add_argument("--ollama-concurrency", type=int, default=1, help="模擬 Ollama 同時處理的請求數")
+    parser.add_argument(
+        "--qdrant", default="memory",
+        help="memory（行程內）、local（暫存目錄的 local mode）或 Qdrant URL",
+    )
+    parser.add_argument("--repo", type=Path, default=None, help="改用既有目錄（不產生合成 repository）")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON 輸出路徑")
+    parser.add_argument("--baseline", type=Path, default=None, help="先前的結果 JSON，附上比較")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # local mode 不支援 payload 索引，略過對應的警告
+    warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+    settings.embedding_dims = args.dims
+    settings.hnsw_autotune = False
+
+    with tempfile.TemporaryDirectory(prefix="code-rag-bench-") as tmp:
+        workdir = Path(tmp)
+        if args.repo:
+            repo = args.repo
+            repo_info = {"path": str(repo)}
+        else:
+            repo = workdir / "repo"
+            repo_info = generate_repo(
+                repo,
+                files=args.files,
+                languages=tuple(args.languages),
+                file_kb=args.file_kb,
+                depth=args.depth,
+                noise_files=args.noise_files,
+                seed=args.seed,
+            )
+
+        qdrant = open_qdrant(args.qdrant, workdir)
+        state_db = StateDB(str(workdir / "state.db"))
+        with ExitStack() as stack:
+            if args.backend == "fake-ollama":
+                fake = stack.enter_context(
+                    FakeOllama(args.dims, args.latency_ms, args.per_text_ms, args.ollama_concurrency)
+                )
+                backend: Embedder = OllamaEmbedder(urls=[fake.url])
+            else:
+                backend = HashingEmbedder(args.dims)
+            embedder = EmbeddingScheduler(backend)
+            stack.callback(embedder.close)
+            stack.callback(qdrant.client.close)
+            if args.qdrant not in ("memory", "local"):
+                stack.callback(qdrant.client.delete_collection, qdrant.summary_collection)
+                stack.callback(qdrant.client.delete_collection, qdrant.collection)
+
+            scenarios = [_run_scenario("full", repo, qdrant, state_db, embedder, None)]
+            scenarios.append(_run_scenario("noop", repo, qdrant, state_db, embedder, 0))
+            if not args.repo:
+                changed = mutate_repo(repo, args.delta, seed=args.seed + 1)
+                scenarios.append(
+                    _run_scenario("delta", repo, qdrant, state_db, embedder, len(changed))
+                )
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            **{
+                k: str(v) if isinstance(v, Path) else v
+                for k, v in vars(args).items()
+                if k not in ("output", "baseline")
+            },
+            "embedding_batch_size": settings.embedding_batch_size,
+            "summary_vectors": settings.summary_vectors,
+            "dedup_chunks": settings.dedup_chunks,
+            "chunk_max_chars": settings.chunk_max_chars,
+        },
+        "repository": repo_info,
+        "scenarios": scenarios,
+    }
+    if args.baseline:
+        report["comparison"] = _compare(report, json.loads(args.baseline.read_text()))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
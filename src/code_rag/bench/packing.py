@@ -0,0 +1,121 @@
+"""小型語意節點合併的 benchmark：比較合併前後的 chunk 數與檢索品質。
+
+檢索品質以「符號查詢命中率」估計：抽樣函式/類別名稱作為查詢，
+檢查 top-k 結果中是否有包含該符號（同一檔案）的 chunk。
+
+用法：
+    python -m code_rag.bench.packing /path/to/corpus --retrieval 200 -k 5
+    python -m code_rag.bench.packing /path/to/corpus --retrieval 200 --backend hashing  # 離線
+"""
+
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from code_rag.config import settings
+from code_rag.indexer.chunker import chunk_code
+from code_rag.indexer.embedder import Embedder, create_embedder
+from code_rag.indexer.records import Chunk
+from code_rag.indexer.scanner import scan_files
+from code_rag.utils.language import supports_treesitter
+
+
+def _chunk_corpus(files: list[dict], pack: bool) -> list[Chunk]:
+    # 暫時切換全域設定，結束後還原，避免影響同一行程中的其他程式
+    previous = settings.chunk_pack_siblings
+    settings.chunk_pack_siblings = pack
+    try:
+        chunks: list[Chunk] = []
+        for f in files:
+            source = Path(f["path"]).read_bytes()
+            chunks.extend(chunk_code(source, f["language"], f["relative_path"], "bench"))
+        return chunks
+    finally:
+        settings.chunk_pack_siblings = previous
+
+
+def _symbol_hit_rate(
+    chunks: list[Chunk],
+    queries: list[tuple[str, str]],
+    embedder: Embedder,
+    k: int,
+) -> float:
+    vectors = embedder.embed_batch([c.content for c in chunks])
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        collection_name="bench",
+        vectors_config=VectorParams(size=len(vectors[0]), distance=Distance.COSINE),
+    )
+    client.upsert(
+        collection_name="bench",
+        points=[PointStruct(id=i, vector=v) for i, v in enumerate(vectors.tolist())],
+    )
+    hits = 0
+    for symbol, file_path in queries:
+        results = client.query_points(
+            collection_name="bench", query=embedder.embed_single(symbol).tolist(), limit=k
+        ).points
+        if any(
+            chunks[r.id].file_path == file_path and symbol in chunks[r.id].to_payload()["symbols"]
+            for r in results
+        ):
+            hits += 1
+    client.close()
+    return hits / len(queries) if queries else 0.0
+
+
+def _summary(chunks: list[Chunk]) -> dict:
+    sizes = [len(c.content) for c in chunks]
+    return {
+        "chunks": len(chunks),
+        "avg_chars": sum(sizes) / len(sizes) if sizes else 0,
+        "multi_symbol_chunks": sum(1 for c in chunks if c.symbols and len(c.symbols) > 1),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Sibling packing benchmark")
+    parser.add_argument("corpus", type=Path, help="要切分的原始碼目錄")
+    parser.add_argument("--retrieval", type=int, default=0, help="抽樣幾個符號評估檢索（需 embedding 服務）")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument(
+        "--backend", choices=["ollama", "onnx", "hashing"], default=None,
+        help="embedding backend（預設 EMBEDDING_BACKEND；hashing 可離線執行）",
+    )
+    args = parser.parse_args(argv)
+
+    files = [f for f in scan_files(args.corpus) if supports_treesitter(f["language"])]
+    if not files:
+        print("No tree-sitter files found in corpus", file=sys.stderr)
+        return 1
+
+    unpacked = _chunk_corpus(files, pack=False)
+    packed = _chunk_corpus(files, pack=True)
+    report = {
+        "files": len(files),
+        "unpacked": _summary(unpacked),
+        "packed": _summary(packed),
+        "reduction": 1 - len(packed) / len(unpacked) if unpacked else 0.0,
+    }
+
+    if args.retrieval:
+        symbols = sorted({(c.name, c.file_path) for c in unpacked if c.name})
+        queries = random.Random(0).sample(symbols, min(args.retrieval, len(symbols)))
+        embedder = create_embedder(args.backend)
+        try:
+            report["unpacked"]["symbol_hit_rate"] = _symbol_hit_rate(unpacked, queries, embedder, args.k)
+            report["packed"]["symbol_hit_rate"] = _symbol_hit_rate(packed, queries, embedder, args.k)
+        finally:
+            embedder.close()
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
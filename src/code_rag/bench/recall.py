@@ -0,0 +1,62 @@
+"""離線 recall 檢查：比較量化搜尋與 exact 搜尋的 recall@k。
+
+用法：
+    python -m code_rag.bench.recall --project my-project --sample 200 -k 10
+"""
+
+import argparse
+import json
+import sys
+
+from code_rag.config import settings
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.recall import evaluate_recall
+
+# 每個維度佔用的 bytes
+_BYTES_PER_DIM = {"none": 4.0, "scalar": 1.0, "binary": 1 / 8}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Quantized vs exact search recall check")
+    parser.add_argument("--project", default=None, help="限定專案")
+    parser.add_argument("--sample", type=int, default=100, help="查詢樣本數")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--oversampling", type=float, default=None)
+    parser.add_argument("--no-rescore", action="store_true")
+    parser.add_argument("--target", type=float, default=settings.recall_target)
+    args = parser.parse_args(argv)
+
+    qdrant = QdrantStorage()
+    try:
+        samples = qdrant.sample_vectors(args.sample, project_name=args.project)
+        if not samples:
+            print("No vectors found to sample", file=sys.stderr)
+            return 1
+
+        report = evaluate_recall(
+            qdrant,
+            [vector for _, vector in samples],
+            k=args.k,
+            project_name=args.project,
+            query_keys=[key for key, _ in samples],
+            oversampling=args.oversampling,
+            rescore=False if args.no_rescore else None,
+        )
+        points = qdrant.client.get_collection(qdrant.collection).points_count or 0
+        dims = settings.stored_dims
+        report.update({
+            "quantization": settings.quantization,
+            "points": points,
+            "vector_ram_bytes": int(points * dims * _BYTES_PER_DIM[settings.quantization]),
+            "original_bytes": points * dims * 4,
+            "target": args.target,
+            "passed": report["recall"] >= args.target,
+        })
+        print(json.dumps(report, indent=2))
+        return 0 if report["passed"] else 2
+    finally:
+        qdrant.client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""搜尋延遲與 recall 負載測試：以固定並行數或 QPS 對 /api/v1/search 重播查詢。
+
+請求透過 ASGI transport 直接送進 FastAPI app（不經網路），延遲依 Server-Timing
+header 拆成 embed 與 query（Qdrant）階段；recall@k 以同一 collection 的
+exact=true 搜尋結果為基準。預設以 hashing embedder 索引合成 repository，完全離線。
+
+注意：行程內（memory / local）Qdrant 一律暴力搜尋，HNSW 與量化設定不影響結果；
+比較 ANN 設定時請以 --qdrant 指定 Qdrant 服務。
+
+用法：
+    python -m code_rag.bench.search --files 1000 --concurrency 8 --requests 2000
+    python -m code_rag.bench.search --qdrant http://localhost:6335 --quantization scalar --ef 64
+    python -m code_rag.bench.search --qdrant http://localhost:6335 --project my-project --qps 50
+    python -m code_rag.bench.search --qdrant http://localhost:6335 --project my-project --path-prefix services/billing
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import httpx
+
+import code_rag.main as app_main
+from code_rag.bench.indexing import git_commit, open_qdrant
+from code_rag.bench.synthetic import LANGUAGES, generate_repo
+from code_rag.config import settings
+from code_rag.indexer.embedder import HashingEmbedder
+from code_rag.indexer.pipeline import run_index
+from code_rag.indexer.scheduler import EmbeddingScheduler
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.recall import percentile
+from code_rag.storage.state import StateDB
+
+PROJECT = "bench"
+PHASES = ("total", "embed", "query")
+
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def _parse_server_timing(header: str | None) -> dict[str, float]:
+    """解析 Server-Timing header，回傳各階段毫秒數。"""
+    timings: dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value)
+    return timings
+
+
+def _load_queries(qdrant: QdrantStorage, project: str, count: int, seed: int) -> list[str]:
+    """以 chunk 的函式 / 類別名稱產生查詢（底線與 camelCase 拆成單字）。"""
+    names: set[str] = set()
+    offset = None
+    while len(names) < count * 10:
+        points, offset = qdrant.client.scroll(
+            qdrant.collection,
+            limit=256,
+            offset=offset,
+            with_payload=["project_name", "name"],
+            with_vectors=False,
+        )
+        for p in points:
+            name = p.payload.get("name")
+            if name and p.payload.get("project_name") == project:
+                names.add(name)
+        if offset is None:
+            break
+    words = [
+        " ".join(_CAMEL_BOUNDARY.sub(" ", name).replace("_", " ").split()).lower()
+        for name in sorted(names)
+    ]
+    return random.Random(seed).sample(words, min(count, len(words)))
+
+
+class _Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {phase: [] for phase in PHASES}
+        self.errors = 0
+
+    def record(self, total_ms: float, response: httpx.Response | None):
+        if response is None or response.status_code != 200:
+            self.errors += 1
+            return
+        timings = _parse_server_timing(response.headers.get("server-timing"))
+        self.latencies["total"].append(total_ms)
+        for phase in PHASES[1:]:
+            if phase in timings:
+                self.latencies[phase].append(timings[phase])
+
+    def summary(self) -> dict:
+        report = {}
+        for phase, values in self.latencies.items():
+            values.sort()
+            report[phase] = {
+                "p50_ms": percentile(values, 0.50),
+                "p95_ms": percentile(values, 0.95),
+                "p99_ms": percentile(values, 0.99),
+                "max_ms": values[-1] if values else 0.0,
+            }
+        return report
+
+
+async def _request(client: httpx.AsyncClient, params: dict) -> httpx.Response | None:
+    try:
+        return await client.get("/api/v1/search", params=params)
+    except httpx.HTTPError:
+        return None
+
+
+async def _closed_loop(
+    client: httpx.AsyncClient, params: list[dict], concurrency: int, recorder: _Recorder
+):
+    """concurrency 個 worker 各自連續送出請求。"""
+    pending = iter(params)
+
+    async def worker():
+        for p in pending:
+            started = time.perf_counter()
+            response = await _request(client, p)
+            recorder.record((time.perf_counter() - started) * 1000, response)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def _open_loop(client: httpx.AsyncClient, params: list[dict], qps: float, recorder: _Recorder):
+    """依固定到達率送出請求；延遲從預定送出時間起算，避免 coordinated omission。"""
+    start = time.perf_counter()
+
+    async def one(i: int, p: dict):
+        scheduled = start + i / qps
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        response = await _request(client, p)
+        recorder.record((time.perf_counter() - scheduled) * 1000, response)
+
+    await asyncio.gather(*(one(i, p) for i, p in enumerate(params)))
+
+
+def _hits(response: httpx.Response, k: int) -> dict[tuple, float]:
+    return {
+        (r["project_name"], r["file_path"], r["start_line"], r["end_line"]): r["score"]
+        for r in response.json()[:k]
+    }
+
+
+async def _recall(client: httpx.AsyncClient, params: list[dict], k: int) -> dict:
+    """逐一比較 ANN 與 exact=true 的 top-k。
+
+    分數與 exact 第 k 名同分的結果也算命中（同分時兩者可能回傳不同的 chunk）。
+    """
+    recalls = []
+    for p in params:
+        approx = await client.get("/api/v1/search", params=p)
+        exact = await client.get("/api/v1/search", params={**p, "exact": "true"})
+        if approx.status_code != 200 or exact.status_code != 200:
+            continue
+        truth = _hits(exact, k)
+        if not truth:
+            continue
+        threshold = min(truth.values()) - 1e-6
+        found = sum(1 for key, score in _hits(approx, k).items() if key in truth or score >= threshold)
+        recalls.append(min(found, len(truth)) / len(truth))
+    return {
+        "k": k,
+        "queries": len(recalls),
+        "recall_at_k": sum(recalls) / len(recalls) if recalls else 0.0,
+        "min_recall": min(recalls) if recalls else 0.0,
+    }
+
+
+async def _run(args, client: httpx.AsyncClient, queries: list[str]) -> dict:
+    base = {"limit": args.k, "project": args.project or PROJECT}
+    for key, value in (
+        ("language", args.language),
+        ("ef", args.ef),
+        ("oversampling", args.oversampling),
+        ("mode", args.mode),
+    ):
+        if value is not None:
+            base[key] = value
+    if args.no_rescore:
+        base["rescore"] = "false"
+    if args.path_prefix:
+        base["path_prefix"] = args.path_prefix
+    if args.exclude:
+        base["exclude"] = args.exclude
+
+    rng = random.Random(args.seed)
+    params = [{**base, "q": rng.choice(queries)} for _ in range(args.requests)]
+
+    for p in params[: args.warmup]:
+        await _request(client, p)
+
+    recorder = _Recorder()
+    started = time.perf_counter()
+    if args.qps:
+        await _open_loop(client, params, args.qps, recorder)
+    else:
+        await _closed_loop(client, params, args.concurrency, recorder)
+    duration = time.perf_counter() - started
+
+    recall_params = [{**base, "q": q} for q in queries[: args.recall_queries]]
+    return {
+        "load": {
+            "requests": len(params),
+            "errors": recorder.errors,
+            "seconds": duration,
+            "achieved_qps": len(params) / duration if duration else 0.0,
+            "latency": recorder.summary(),
+        },
+        "recall": await _recall(client, recall_params, args.k),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Search latency and recall load test")
+    parser.add_argument("--files", type=int, default=500, help="合成 repository 的檔案數")
+    parser.add_argument("--languages", nargs="+", default=["python", "typescript", "go"], choices=LANGUAGES)
+    parser.add_argument("--file-kb", type=float, default=4.0)
+    parser.add_argument("--dims", type=int, default=256, help="embedding 維度")
+    parser.add_argument("--qdrant", default="memory", help="memory、local 或 Qdrant URL")
+    parser.add_argument("--project", default=None, help="改用既有專案（需 --qdrant URL 與相同的 EMBEDDING_DIMS）")
+    parser.add_argument("--quantization", default=None, choices=["none", "scalar", "binary"])
+    parser.add_argument("--hnsw-m", type=int, default=None)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=None)
+    parser.add_argument("--queries", type=Path, default=None, help="查詢檔（每行一個）；預設由 chunk 名稱產生")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000, help="負載測試的請求數")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="固定並行數（closed loop）")
+    parser.add_argument("--qps", type=float, default=None, help="固定到達率（open loop），指定時忽略 --concurrency")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--language", default=None, help="以語言過濾")
+    parser.add_argument("--path-prefix", action="append", default=[], help="限定目錄（可重複）")
+    parser.add_argument("--exclude", action="append", default=[], help="排除的路徑 glob（可重複）")
+    parser.add_argument("--ef", type=int, default=None)
+    parser.add_argument("--oversampling", type=float, default=None)
+    parser.add_argument("--no-rescore", action="store_true")
+    parser.add_argument("--mode", choices=["flat", "hierarchical"], default=None)
+    parser.add_argument("--recall-queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON 輸出路徑")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+    settings.embedding_dims = args.dims
+    settings.hnsw_autotune = False
+    settings.embedding_backend = "hashing"
+    if args.quantization:
+        settings.quantization = args.quantization
+    if args.hnsw_m:
+        settings.hnsw_m = args.hnsw_m
+    if args.hnsw_ef_construct:
+        settings.hnsw_ef_construct = args.hnsw_ef_construct
+
+    with tempfile.TemporaryDirectory(prefix="code-rag-bench-") as tmp:
+        workdir = Path(tmp)
+        if args.project:
+            qdrant = QdrantStorage(location=args.qdrant)
+        else:
+            qdrant = open_qdrant(args.qdrant, workdir)
+        state_db = StateDB(str(workdir / "state.db"))
+        embedder = EmbeddingScheduler(HashingEmbedder(args.dims))
+        try:
+            if not args.project:
+                repo = workdir / "repo"
+                generate_repo(
+                    repo, files=args.files, languages=tuple(args.languages),
+                    file_kb=args.file_kb, seed=args.seed,
+                )
+                run_index(PROJECT, str(repo), qdrant, state_db, embedder)
+
+            if args.queries:
+                queries = [q for q in args.queries.read_text().splitlines() if q.strip()]
+            else:
+                queries = _load_queries(qdrant, args.project or PROJECT, args.num_queries, args.seed)
+            if not queries:
+                print("No queries available", file=sys.stderr)
+                return 1
+
+            app_main._qdrant, app_main._state_db, app_main._embedder = qdrant, state_db, embedder
+            transport = httpx.ASGITransport(app=app_main.app)
+
+            async def run():
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    return await _run(args, client, queries)
+
+            results = asyncio.run(run())
+            points = qdrant.client.count(qdrant.collection).count
+        finally:
+            embedder.close()
+            if not args.project and args.qdrant not in ("memory", "local"):
+                qdrant.client.delete_collection(qdrant.collection)
+                qdrant.client.delete_collection(qdrant.summary_collection)
+            qdrant.client.close()
+
+    report = {
+        "commit": git_commit(),
+        "config": {
+            **{k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k != "output"},
+            "quantization": settings.quantization,
+            "hnsw_m": settings.hnsw_m,
+            "hnsw_ef_construct": settings.hnsw_ef_construct,
+            "ann": args.qdrant not in ("memory", "local"),
+        },
+        "points": points,
+        "queries": len(queries),
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""冷啟動 benchmark：量測 import 時間與 API 到達 live / ready 的時間。
+
+每輪啟動一個新的 uvicorn 行程，輪詢 /api/v1/health/live 與 /api/v1/health/ready。
+預設以行程內 Qdrant（QDRANT_URL=:memory:）與 hashing embedder 執行，不需外部服務；
+可用 --env 覆寫環境變數（例如指向實際的 Qdrant / Ollama）。
+
+用法：
+    python -m code_rag.bench.startup --runs 5
+    python -m code_rag.bench.startup --env QDRANT_URL=http://localhost:6335 --env EMBEDDING_BACKEND=ollama
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from code_rag.storage.recall import percentile
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _import_seconds(env: dict[str, str]) -> float:
+    code = "import time; t = time.perf_counter(); import code_rag.main; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _start_once(env: dict[str, str], timeout: float) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}/api/v1/health"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "code_rag.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    live = ready = None
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - started < timeout and ready is None:
+                if proc.poll() is not None:
+                    break
+                try:
+                    if live is None and client.get(f"{base}/live").status_code == 200:
+                        live = time.perf_counter() - started
+                    if live is not None and client.get(f"{base}/ready").status_code == 200:
+                        ready = time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"live_s": live, "ready_s": ready}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="API cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="每輪等待 ready 的上限（秒）")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE 環境變數覆寫")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="code-rag-startup-") as tmp:
+        env = {
+            **os.environ,
+            "QDRANT_URL": ":memory:",
+            "EMBEDDING_BACKEND": "hashing",
+            "STATE_DB_PATH": f"{tmp}/state.db",
+            "PROFILE_DIR": f"{tmp}/profiles",
+        }
+        env.update(item.split("=", 1) for item in args.env)
+
+        imports = sorted(_import_seconds(env) for _ in range(args.runs))
+        runs = [_start_once(env, args.timeout) for _ in range(args.runs)]
+
+    live = sorted(r["live_s"] for r in runs if r["live_s"] is not None)
+    ready = sorted(r["ready_s"] for r in runs if r["ready_s"] is not None)
+    report = {
+        "runs": args.runs,
+        "import_s": {"p50": percentile(imports, 0.5), "max": imports[-1]},
+        "live_s": {"p50": percentile(live, 0.5), "max": live[-1] if live else None},
+        "ready_s": {"p50": percentile(ready, 0.5), "max": ready[-1] if ready else None},
+        "failed_runs": sum(1 for r in runs if r["ready_s"] is None),
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if not report["failed_runs"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""合成 repository 產生器，供 benchmark 使用。
+
+依種子確定性地產生多語言原始碼樹（巢狀目錄、可調整檔案大小），
+並可加入 node_modules 等應被掃描器排除的雜訊目錄。
+"""
+
+import random
+from pathlib import Path
+
+_WORDS = (
+    "user order cache index token parse render query batch stream config client "
+    "server request response buffer vector chunk file path record event worker "
+    "session state result error value item node tree graph score limit offset"
+).split()
+
+
+def _ident(rng: random.Random, parts: int = 2) -> str:
+    return "_".join(rng.choice(_WORDS) for _ in range(parts))
+
+
+def _camel(rng: random.Random, parts: int = 2) -> str:
+    return "".join(rng.choice(_WORDS).capitalize() for _ in range(parts))
+
+
+def _python_unit(rng: random.Random) -> str:
+    name = _ident(rng, 3)
+    args = [_ident(rng, 1) for _ in range(rng.randint(1, 3))]
+    body = [
+        f"{_ident(rng, 1)}_{i} = {_ident(rng, 1)}({rng.randint(0, 999)})"
+        for i in range(rng.randint(3, 12))
+    ]
+    doc = f'"""{" ".join(rng.choices(_WORDS, k=6))}."""'
+    if rng.random() < 0.3:
+        lines = [f"class {_camel(rng)}:", f"    {doc}", "", f"    def {name}(self, {', '.join(args)}):"]
+        lines += [f"        {line}" for line in body] + [f"        return {args[0]}"]
+    else:
+        lines = [f"def {name}({', '.join(args)}):", f"    {doc}"]
+        lines += [f"    {line}" for line in body] + [f"    return {args[0]}"]
+    return "\n".join(lines) + "\n"
+
+
+def _c_like_unit(rng: random.Random, fn: str, var: str) -> str:
+    name = _camel(rng, 3)
+    body = "\n".join(
+        f"    {var}{_ident(rng, 1)}{i} = {_ident(rng, 1)}({rng.randint(0, 999)});"
+        for i in range(rng.randint(3, 12))
+    )
+    comment = " ".join(rng.choices(_WORDS, k=8))
+    return f"// {comment}\n{fn} {name}(input) {{\n{body}\n    return input;\n}}\n"
+
+
+# 每種語言的副檔名與程式碼片段產生器
+_LANGUAGES = {
+    "python": (".py", _python_unit),
+    "javascript": (".js", lambda rng: _c_like_unit(rng, "function", "const ")),
+    "typescript": (".ts", lambda rng: _c_like_unit(rng, "export function", "const ")),
+    "go": (".go", lambda rng: _c_like_unit(rng, "func", "")),
+    "rust": (".rs", lambda rng: _c_like_unit(rng, "pub fn", "let ")),
+    "markdown": (
+        ".md",
+        lambda rng: f"## {_camel(rng)}\n\n{' '.join(rng.choices(_WORDS, k=60))}.\n",
+    ),
+}
+LANGUAGES = tuple(_LANGUAGES)
+
+
+def _source(rng: random.Random, language: str, target_bytes: int) -> str:
+    unit = _LANGUAGES[language][1]
+    parts: list[str] = []
+    size = 0
+    while size < target_bytes:
+        part = unit(rng)
+        parts.append(part)
+        size += len(part) + 1
+    return "\n".join(parts)
+
+
+def generate_repo(
+    root: Path,
+    files: int = 500,
+    languages: tuple[str, ...] = ("python", "typescript", "go"),
+    file_kb: float = 4.0,
+    depth: int = 4,
+    noise_files: int = 200,
+    seed: int = 0,
+) -> dict:
+    """產生合成 repository，回傳檔案數與總大小。
+
+    檔案大小在 file_kb 的 0.25～2 倍之間隨機分布；noise_files 個檔案放在
+    node_modules 與 .git 之下（掃描器應排除）。
+    """
+    rng = random.Random(seed)
+    total_bytes = 0
+    for i in range(files):
+        language = languages[i % len(languages)]
+        ext = _LANGUAGES[language][0]
+        dirs = [f"{_ident(rng, 1)}{rng.randint(0, 9)}" for _ in range(rng.randint(0, depth))]
+        path = root.joinpath(*dirs, f"{_ident(rng, 2)}_{i}{ext}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        source = _source(rng, language, int(file_kb * 1024 * rng.uniform(0.25, 2.0)))
+        path.write_text(source)
+        total_bytes += len(source)
+
+    for i in range(noise_files):
+        noise_dir = "node_modules" if i % 4 else ".git"
+        path = root / noise_dir / f"pkg{i % 20}" / "lib" / f"index_{i}.js"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(_source(rng, "javascript", 2048))
+
+    return {"files": files, "bytes": total_bytes, "noise_files": noise_files}
+
+
+def mutate_repo(root: Path, fraction: float, seed: int = 1) -> list[str]:
+    """修改 fraction 比例的檔案（在檔尾加入新的程式碼單元），回傳被修改的路徑。"""
+    rng = random.Random(seed)
+    candidates = sorted(
+        p for p in root.rglob("*")
+        if p.is_file() and p.suffix in {ext for ext, _ in _LANGUAGES.values()}
+        and "node_modules" not in p.parts and ".git" not in p.parts
+    )
+    by_ext = {ext: language for language, (ext, _) in _LANGUAGES.items()}
+    changed = rng.sample(candidates, max(1, int(len(candidates) * fraction))) if candidates else []
+    for path in changed:
+        with path.open("a") as f:
+            f.write("\n" + _LANGUAGES[by_ext[path.suffix]][1](rng))
+    return [str(p.relative_to(root)) for p in changed]
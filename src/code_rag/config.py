@@ -7,15 +7,126 @@ class Settings(BaseSettings):
     qdrant_url: str = "http://localhost:6335"
     qdrant_collection: str = "code_chunks"
     ollama_url: str = "http://localhost:11434"
+    # 多個 Ollama endpoint（JSON 清單）；空白時只使用 ollama_url
+    ollama_urls: list[str] = []
+    # 每個 endpoint 同時進行的請求數
+    ollama_max_inflight: int = 2
+    # 模型在 Ollama 保持載入的時間，啟動時並先送一次 warm-up 請求
+    ollama_keep_alive: str = "30m"
+    ollama_warmup: bool = True
+    # 連續失敗幾次後暫時剔除 endpoint，重試間隔以指數 backoff 增加
+    ollama_eject_after: int = 3
+    ollama_backoff_s: float = 1.0
+    ollama_backoff_max_s: float = 60.0
     embedding_model: str = "mxbai-embed-large"
     embedding_dims: int = 1024
+    # Matryoshka 截斷維度（0 = 不截斷，儲存模型完整輸出）
+    embedding_truncate_dims: int = 0
+    # 兩階段搜尋：先以截斷向量取候選，再以完整向量重新排序
+    embedding_two_stage: bool = False
+    two_stage_oversampling: int = 4
     embedding_batch_size: int = 32
+    # 嵌入結果整批做 L2 正規化（模型輸出未正規化時開啟）
+    embedding_normalize: bool = False
+    # Embedding 排程：搜尋查詢優先；索引批次的同時執行數上限（0 = backend 平行度 - 1）
+    embed_bulk_max_concurrency: int = 0
+    # 搜尋流量高（embed_busy_window_s 內平均 >= embed_busy_qps）時索引降到的並行數與批次大小
+    embed_bulk_min_concurrency: int = 1
+    embed_busy_window_s: float = 5.0
+    embed_busy_qps: float = 1.0
+    embed_busy_batch_size: int = 8
+    # Embedding backend：ollama / onnx（行程內 CPU）/ hashing（確定性，測試與 benchmark 用）
+    embedding_backend: str = "ollama"
+    # ONNX backend：本地模型與 tokenizer.json
+    onnx_model_path: str = ""
+    onnx_tokenizer_path: str = ""
+    onnx_pooling: str = "cls"
+    onnx_max_length: int = 512
+    # 平行推論的子批次數與每個 session 的執行緒數（0 = onnxruntime 預設）
+    onnx_workers: int = 2
+    onnx_intra_op_threads: int = 0
+    # 查詢 micro-batching 的等待時間窗
+    onnx_batch_wait_ms: float = 2.0
     state_db_path: str = "/app/data/state.db"
     projects_base_path: str = "/data/projects"
     # 用戶本地的絕對路徑前綴（容器內無法 expanduser，必須是絕對路徑）
     projects_host_prefix: str = "/Users/chc/Development"
     chunk_max_chars: int = 800
     chunk_overlap_chars: int = 80
+    # 合併同一 scope 內相鄰的小型語意節點，減少 embedding 數量
+    chunk_pack_siblings: bool = True
+    # 檔案大小上限（bytes）；可依語言覆寫，例如大型 SQL migration 或文件
+    max_file_size: int = 500 * 1024
+    max_file_size_by_language: dict[str, int] = {
+        "sql": 20 * 1024 * 1024,
+        "markdown": 10 * 1024 * 1024,
+        "text": 10 * 1024 * 1024,
+    }
+    # 超過此大小的檔案改用 mmap 串流分塊（不做 tree-sitter 解析）
+    streaming_chunk_threshold: int = 500 * 1024
+    # 近似重複 chunk 抑制：SimHash Hamming 距離不超過 dedup_max_distance 的 chunk
+    # 只嵌入並寫入一個代表，其他位置記錄在 StateDB
+    dedup_chunks: bool = False
+    dedup_max_distance: int = 3
+    dedup_min_chars: int = 200
+    # 另外產生檔案 / class 摘要向量，供 coarse-to-fine 搜尋（存於 <collection>_summaries）
+    summary_vectors: bool = False
+    summary_max_chars: int = 2000
+    # 儲存層級：ram / balanced / disk（建立 collection 時套用）
+    storage_profile: str = "ram"
+    # 向量量化：none / scalar（int8）/ binary；量化向量常駐 RAM，原始向量放磁碟
+    quantization: str = "none"
+    quantization_always_ram: bool = True
+    quantization_oversampling: float = 2.0
+    quantization_rescore: bool = True
+    # 量化後 recall@10 的最低目標（離線 recall 檢查與 HNSW 自動調校用）
+    recall_target: float = 0.95
+    # HNSW 索引參數（建立 collection 時套用）
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    # 搜尋時的 hnsw_ef（0 = 使用 Qdrant 預設值）
+    hnsw_ef: int = 0
+    # 索引完成後自動為專案挑選符合 p95 延遲預算的 hnsw_ef
+    hnsw_autotune: bool = False
+    hnsw_latency_budget_ms: float = 50.0
+    hnsw_autotune_sample: int = 50
+    hnsw_ef_candidates: list[int] = [16, 32, 64, 128, 256, 512]
+    # 含萬用字元的 exclude glob 以專案的目錄 / 檔案清單展開；清單快取秒數與取得上限
+    path_glob_cache_s: float = 30.0
+    path_glob_max_values: int = 20000
+    # /index/{project}/events 推送進度的間隔（秒）
+    index_events_interval_s: float = 1.0
+    # profile=true 的索引 / 搜尋 profile：sample（取樣，speedscope JSON）或 cprofile（pstats）
+    profile_mode: str = "sample"
+    profile_sample_interval_ms: float = 10.0
+    profile_dir: str = "/app/data/profiles"
+    profile_max_files: int = 50
+    # 啟動時 Qdrant 尚未可用的重試間隔（秒）
+    startup_retry_s: float = 2.0
+    # 索引執行方式：inline（API 行程內背景執行）/ queue（寫入 StateDB，由 python -m code_rag.worker 執行）
+    index_mode: str = "inline"
+    # index worker 檢查佇列的間隔；執行中任務的心跳間隔與逾時（逾時視為 worker 已停止）
+    worker_poll_s: float = 1.0
+    job_heartbeat_s: float = 2.0
+    job_lease_s: float = 60.0
+    # StateDB 等待其他行程寫入鎖的上限（秒）
+    state_db_busy_timeout_s: float = 10.0
+    # Prometheus 指標（GET /metrics）
+    metrics_enabled: bool = True
+
+    @property
+    def ollama_endpoints(self) -> list[str]:
+        return self.ollama_urls or [self.ollama_url]
+
+    @property
+    def stored_dims(self) -> int:
+        """實際寫入 collection 的（截斷後）向量維度。"""
+        if 0 < self.embedding_truncate_dims < self.embedding_dims:
+            return self.embedding_truncate_dims
+        return self.embedding_dims
+
+    def max_file_size_for(self, language: str) -> int:
+        return self.max_file_size_by_language.get(language, self.max_file_size)
 
     def to_container_path(self, host_path: str) -> Path:
         """將用戶本地路徑轉換為容器內路徑。"""
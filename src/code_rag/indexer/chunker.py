@@ -1,49 +1,61 @@
 """AST-based code chunker using tree-sitter."""
 
+import importlib
 import logging
+import threading
 
-import tree_sitter_python
-import tree_sitter_javascript
-import tree_sitter_typescript
-import tree_sitter_go
-import tree_sitter_c_sharp
-import tree_sitter_rust
-from tree_sitter import Language, Parser, Node
+from tree_sitter import Language, Node, Parser
 
 from code_rag.config import settings
+from code_rag.indexer.records import Chunk, FileMeta
 
 logger = logging.getLogger(__name__)
 
-# tree-sitter 語言映射
-_LANGUAGES: dict[str, Language] = {}
+# tree-sitter 語法：(模組, 取得 language 的函式)。模組在第一次分塊該語言時才載入
+_GRAMMARS: dict[str, tuple[str, str]] = {
+    "python": ("tree_sitter_python", "language"),
+    "javascript": ("tree_sitter_javascript", "language"),
+    # tree_sitter_typescript 內含 typescript 與 tsx 兩個語法，沒有 language()
+    "typescript": ("tree_sitter_typescript", "language_typescript"),
+    "go": ("tree_sitter_go", "language"),
+    "c_sharp": ("tree_sitter_c_sharp", "language"),
+    "rust": ("tree_sitter_rust", "language"),
+}
+
+# 已載入的語言；載入失敗記為 None，不重複嘗試
+_LANGUAGES: dict[str, Language | None] = {}
+_languages_lock = threading.Lock()
 
 
 def _get_language(lang: str) -> Language | None:
-    if lang in _LANGUAGES:
+    try:
         return _LANGUAGES[lang]
-
-    lang_modules = {
-        "python": tree_sitter_python,
-        "javascript": tree_sitter_javascript,
-        "typescript": tree_sitter_typescript,
-        "go": tree_sitter_go,
-        "c_sharp": tree_sitter_c_sharp,
-        "rust": tree_sitter_rust,
-    }
-
-    module = lang_modules.get(lang)
-    if module is None:
+    except KeyError:
+        pass
+    grammar = _GRAMMARS.get(lang)
+    if grammar is None:
         return None
+    with _languages_lock:
+        if lang not in _LANGUAGES:
+            _LANGUAGES[lang] = _load_language(lang, *grammar)
+    return _LANGUAGES[lang]
 
+
+def _load_language(lang: str, module_name: str, attr: str) -> Language | None:
     try:
-        language = Language(module.language())
-        _LANGUAGES[lang] = language
-        return language
+        module = importlib.import_module(module_name)
+        return Language(getattr(module, attr)())
     except Exception as e:
         logger.warning("Failed to load tree-sitter language '%s': %s", lang, e)
         return None
 
 
+def preload_grammars():
+    """預先載入所有 tree-sitter 語法（啟動後在背景執行，避免第一次索引時載入）。"""
+    for lang in _GRAMMARS:
+        _get_language(lang)
+
+
 # 每個語言中代表語意單元的 node 類型
 SEMANTIC_NODE_TYPES: dict[str, set[str]] = {
     "python": {
@@ -91,11 +103,14 @@ SEMANTIC_NODE_TYPES: dict[str, set[str]] = {
 }
 
 
-def _extract_name(node: Node) -> str | None:
+_NAME_NODE_TYPES = ("identifier", "name", "type_identifier", "property_identifier")
+
+
+def extract_name(node: Node, src: bytes) -> str | None:
     """從 AST node 提取名稱。"""
     for child in node.children:
-        if child.type in ("identifier", "name", "type_identifier", "property_identifier"):
-            return child.text.decode("utf-8") if child.text else None
+        if child.type in _NAME_NODE_TYPES:
+            return src[child.start_byte : child.end_byte].decode("utf-8", errors="ignore")
     return None
 
 
@@ -107,132 +122,279 @@ _TYPE_MAP = {
 }
 
 
-def _node_chunk_type(node_type: str) -> str:
+def node_chunk_type(node_type: str) -> str:
     return next((v for k, v in _TYPE_MAP.items() if k in node_type), "code")
 
 
-def _collect_semantic_nodes(node: Node, language: str) -> list[Node]:
-    """遞迴收集語意節點。"""
-    semantic_types = SEMANTIC_NODE_TYPES.get(language, set())
-    results = []
+# Parser 不是 thread-safe，每個執行緒各自快取
+_parsers = threading.local()
 
-    if node.type in semantic_types:
-        results.append(node)
-    else:
-        for child in node.children:
-            results.extend(_collect_semantic_nodes(child, language))
 
-    return results
+def _get_parser(language: str, lang_obj: Language) -> Parser:
+    cache = getattr(_parsers, "by_language", None)
+    if cache is None:
+        cache = _parsers.by_language = {}
+    parser = cache.get(language)
+    if parser is None:
+        parser = cache[language] = Parser(lang_obj)
+    return parser
 
 
-def chunk_code(
-    source: str,
+# 每個語言的語意節點 kind id（依 grammar 解析一次，走訪時只做整數比對）
+_SEMANTIC_KIND_IDS: dict[str, frozenset[int]] = {}
+
+
+def _semantic_kind_ids(language: str, lang_obj: Language) -> frozenset[int]:
+    if language in _SEMANTIC_KIND_IDS:
+        return _SEMANTIC_KIND_IDS[language]
+
+    kind_ids = set()
+    for node_type in SEMANTIC_NODE_TYPES.get(language, ()):
+        kind_id = lang_obj.id_for_node_kind(node_type, True)
+        if kind_id:
+            kind_ids.add(kind_id)
+        else:
+            # 此 grammar 版本沒有這個節點類型
+            logger.debug("Node type '%s' not in %s grammar", node_type, language)
+    _SEMANTIC_KIND_IDS[language] = frozenset(kind_ids)
+    return _SEMANTIC_KIND_IDS[language]
+
+
+def _collect_semantic_nodes(root: Node, language: str, lang_obj: Language) -> list[Node]:
+    """以 TreeCursor 迭代走訪，收集最外層的語意節點（不進入語意節點的子樹）。"""
+    kind_ids = _semantic_kind_ids(language, lang_obj)
+    results = []
+    cursor = root.walk()
+    while True:
+        node = cursor.node
+        if node.kind_id in kind_ids:
+            results.append(node)
+        elif cursor.goto_first_child():
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return results
+
+
+class ParsedSource:
+    """tree-sitter 解析一次的結果，供分塊與檔案 / class 摘要（outline）共用。"""
+
+    __slots__ = ("src", "meta", "language", "lang_obj", "root", "semantic_nodes")
+
+    def __init__(self, src: bytes, meta: FileMeta, lang_obj: Language, root: Node):
+        self.src = src
+        self.meta = meta
+        self.language = meta.language
+        self.lang_obj = lang_obj
+        self.root = root
+        self.semantic_nodes = _collect_semantic_nodes(root, meta.language, lang_obj)
+
+    def chunks(self) -> list[Chunk]:
+        """在語意邊界切分的 chunk（同 chunk_code）。"""
+        return _chunk_tree(self.src, self.meta, self.language, self.lang_obj, self.semantic_nodes)
+
+    def semantic_children(self, node: Node) -> list[Node]:
+        """node 底下最外層的語意節點（不含 node 本身），例如 class 的成員。"""
+        members: list[Node] = []
+        for child in node.children:
+            members.extend(_collect_semantic_nodes(child, self.language, self.lang_obj))
+        return members
+
+
+def parse_source(
+    source: str | bytes,
     language: str,
     file_path: str,
     project_name: str,
-) -> list[dict]:
-    """使用 tree-sitter 在語意邊界切分程式碼。"""
+) -> ParsedSource | None:
+    """以 tree-sitter 解析原始碼；語言沒有可用的語法時回傳 None。"""
     lang_obj = _get_language(language)
     if lang_obj is None:
-        return []
+        return None
+
+    src = source.encode("utf-8") if isinstance(source, str) else source
+    meta = FileMeta(file_path, project_name, language)
+    tree = _get_parser(language, lang_obj).parse(src)
+    return ParsedSource(src, meta, lang_obj, tree.root_node)
 
-    parser = Parser(lang_obj)
-    tree = parser.parse(source.encode("utf-8"))
-    root = tree.root_node
 
-    semantic_nodes = _collect_semantic_nodes(root, language)
+def chunk_code(
+    source: str | bytes,
+    language: str,
+    file_path: str,
+    project_name: str,
+) -> list[Chunk]:
+    """使用 tree-sitter 在語意邊界切分程式碼。"""
+    parsed = parse_source(source, language, file_path, project_name)
+    return parsed.chunks() if parsed is not None else []
+
 
+def _chunk_tree(
+    src: bytes,
+    meta: FileMeta,
+    language: str,
+    lang_obj: Language,
+    semantic_nodes: list[Node],
+) -> list[Chunk]:
     if not semantic_nodes:
+        text = src.decode("utf-8", errors="ignore")
         # 沒有語意節點，整個檔案作為一個 chunk
-        if len(source) <= settings.chunk_max_chars:
-            return [
-                {
-                    "content": source,
-                    "file_path": file_path,
-                    "project_name": project_name,
-                    "language": language,
-                    "chunk_index": 0,
-                    "start_line": 1,
-                    "end_line": source.count("\n") + 1,
-                    "chunk_type": "code",
-                    "name": None,
-                }
-            ]
+        if len(text) <= settings.chunk_max_chars:
+            return [Chunk(meta, text, 0, 1, text.count("\n") + 1)]
         # 太大，fallback 到固定大小切分
-        return split_lines(source, file_path, project_name, language, chunk_type="code")
-
-    chunks = []
-    lines = source.split("\n")
-    last_end = 0  # 上一個 chunk 結束的行號（0-indexed）
-
-    for node in sorted(semantic_nodes, key=lambda n: n.start_point[0]):
-        node_start_line = node.start_point[0]
-        node_end_line = node.end_point[0]
-
-        # 收集 node 之前的「間隙」程式碼（imports, 全域變數等）
-        if node_start_line > last_end:
-            gap_text = "\n".join(lines[last_end:node_start_line]).strip()
-            if gap_text and len(gap_text) > 20:
-                chunks.append({
-                    "content": gap_text,
-                    "file_path": file_path,
-                    "project_name": project_name,
-                    "language": language,
-                    "chunk_index": len(chunks),
-                    "start_line": last_end + 1,
-                    "end_line": node_start_line,
-                    "chunk_type": "code",
-                    "name": None,
-                })
-
-        # 語意節點本身
-        node_text = node.text.decode("utf-8") if node.text else ""
-
-        if len(node_text) <= settings.chunk_max_chars:
-            chunks.append({
-                "content": node_text,
-                "file_path": file_path,
-                "project_name": project_name,
-                "language": language,
-                "chunk_index": len(chunks),
-                "start_line": node_start_line + 1,
-                "end_line": node_end_line + 1,
-                "chunk_type": _node_chunk_type(node.type),
-                "name": _extract_name(node),
-            })
-        else:
-            # 節點太大，按固定大小切分
-            sub_chunks = split_lines(
-                node_text,
-                file_path=file_path,
-                project_name=project_name,
-                language=language,
-                chunk_type=_node_chunk_type(node.type),
-                name=_extract_name(node),
-                base_line=node_start_line,
-                start_index=len(chunks),
-            )
-            chunks.extend(sub_chunks)
+        return split_lines(
+            text, meta.file_path, meta.project_name, language, chunk_type="code", meta=meta
+        )
+
+    packer = _ScopeChunker(src, meta, language, lang_obj)
+    total_lines = src.count(b"\n") + (0 if src.endswith(b"\n") else 1)
+    packer.chunk_scope(semantic_nodes, 0, 0, len(src), total_lines)
+    return packer.chunks
+
+
+class _ScopeChunker:
+    """在同一個 scope（模組或過大的 class）內依序產生 chunk。
 
-        last_end = node_end_line + 1
+    相鄰且只隔著瑣碎間隙的小型語意節點會合併成一個 chunk（不超過
+    chunk_max_chars），單獨能放入上限的節點不會被切開；過大的容器節點
+    若含有語意子節點，則進入其內部以子節點為單位切分。
+    """
 
-    # 收集最後的間隙
-    if last_end < len(lines):
-        gap_text = "\n".join(lines[last_end:]).strip()
+    def __init__(self, src: bytes, meta: FileMeta, language: str, lang_obj: Language):
+        self.src = src
+        self.meta = meta
+        self.language = language
+        self.lang_obj = lang_obj
+        self.chunks: list[Chunk] = []
+        self.max_chars = settings.chunk_max_chars
+        self.pack = settings.chunk_pack_siblings
+
+    def chunk_scope(
+        self,
+        nodes: list[Node],
+        start_byte: int,
+        start_line: int,
+        end_byte: int,
+        end_line: int,
+        scope_name: str | None = None,
+    ):
+        last_end = start_line  # 上一個節點結束的下一行（0-indexed）
+        last_end_byte = start_byte  # 該行起始的 byte offset
+        run: list[Node] = []
+
+        for node in nodes:
+            node_start_line = node.start_point[0]
+            if node_start_line > last_end:
+                # 行首 offset 由節點的 byte offset 與欄位（byte 計）推回，不需逐行切分
+                gap_end = node.start_byte - node.start_point[1]
+                if self._is_significant_gap(last_end_byte, gap_end):
+                    self._flush(run)
+                    run = []
+                    self._add_gap(last_end_byte, gap_end, last_end, node_start_line, scope_name)
+
+            size = len(self.src[node.start_byte : node.end_byte].decode("utf-8", errors="ignore"))
+            if size <= self.max_chars:
+                # 合併後的大小以 bytes 估算（不小於字元數，偏保守）
+                if run and (
+                    not self.pack or node.end_byte - run[0].start_byte > self.max_chars
+                ):
+                    self._flush(run)
+                    run = []
+                run.append(node)
+            else:
+                self._flush(run)
+                run = []
+                self._add_large_node(node)
+
+            last_end = node.end_point[0] + 1
+            newline = self.src.find(b"\n", node.end_byte)
+            last_end_byte = newline + 1 if newline != -1 else len(self.src)
+
+        self._flush(run)
+
+        # 收集最後的間隙
+        if last_end < end_line and last_end_byte < end_byte:
+            self._add_gap(last_end_byte, end_byte, last_end, end_line, scope_name)
+
+    def _gap_text(self, start_byte: int, end_byte: int) -> str:
+        return self.src[start_byte:end_byte].decode("utf-8", errors="ignore").strip()
+
+    def _is_significant_gap(self, start_byte: int, end_byte: int) -> bool:
+        return len(self._gap_text(start_byte, end_byte)) > 20
+
+    def _add_gap(
+        self,
+        start_byte: int,
+        end_byte: int,
+        start_line: int,
+        end_line: int,
+        scope_name: str | None,
+    ):
+        # 節點之間的「間隙」程式碼（imports, 全域變數, class 標頭等）
+        gap_text = self._gap_text(start_byte, end_byte)
         if gap_text and len(gap_text) > 20:
-            chunks.append({
-                "content": gap_text,
-                "file_path": file_path,
-                "project_name": project_name,
-                "language": language,
-                "chunk_index": len(chunks),
-                "start_line": last_end + 1,
-                "end_line": len(lines),
-                "chunk_type": "code",
-                "name": None,
-            })
+            self.chunks.append(
+                Chunk(
+                    self.meta, gap_text, len(self.chunks), start_line + 1, end_line,
+                    name=scope_name, symbols=[],
+                )
+            )
 
-    return chunks
+    def _flush(self, run: list[Node]):
+        if not run:
+            return
+        first, last = run[0], run[-1]
+        # 直接從 source bytes 切出（合併時包含節點之間的瑣碎間隙）
+        content = self.src[first.start_byte : last.end_byte].decode("utf-8", errors="ignore")
+        names = [n for n in (extract_name(node, self.src) for node in run) if n]
+        chunk_types = {node_chunk_type(node.type) for node in run}
+        self.chunks.append(
+            Chunk(
+                self.meta,
+                content,
+                len(self.chunks),
+                first.start_point[0] + 1,
+                last.end_point[0] + 1,
+                chunk_types.pop() if len(chunk_types) == 1 else "code",
+                names[0] if len(run) == 1 and names else None,
+                names,
+            )
+        )
+
+    def _add_large_node(self, node: Node):
+        chunk_type = node_chunk_type(node.type)
+        name = extract_name(node, self.src)
+
+        children: list[Node] = []
+        for child in node.children:
+            children.extend(_collect_semantic_nodes(child, self.language, self.lang_obj))
+        if children:
+            # 過大的容器（class、impl、module 等）：以內部語意節點為單位切分
+            self.chunk_scope(
+                children,
+                node.start_byte - node.start_point[1],
+                node.start_point[0],
+                node.end_byte,
+                node.end_point[0] + 1,
+                scope_name=name,
+            )
+            return
+
+        # 沒有可切分的子節點，按固定大小切分
+        node_text = self.src[node.start_byte : node.end_byte].decode("utf-8", errors="ignore")
+        self.chunks.extend(
+            split_lines(
+                node_text,
+                file_path=self.meta.file_path,
+                project_name=self.meta.project_name,
+                language=self.language,
+                chunk_type=chunk_type,
+                name=name,
+                base_line=node.start_point[0],
+                start_index=len(self.chunks),
+                meta=self.meta,
+            )
+        )
 
 
 def split_lines(
@@ -245,15 +407,17 @@ def split_lines(
     name: str | None = None,
     base_line: int = 0,
     start_index: int = 0,
-) -> list[dict]:
+    meta: FileMeta | None = None,
+) -> list[Chunk]:
     """將文字按固定大小在行邊界切分，帶 overlap。
 
     同時用於 tree-sitter 過大節點的子切分和非程式碼檔案的 fallback 切分。
     """
     max_chars = settings.chunk_max_chars
     overlap = settings.chunk_overlap_chars
+    meta = meta or FileMeta(file_path, project_name, language)
     lines = source.split("\n") if isinstance(source, str) else source
-    chunks: list[dict] = []
+    chunks: list[Chunk] = []
     current_lines: list[str] = []
     current_chars = 0
     start_line = 0
@@ -261,18 +425,17 @@ def split_lines(
     for i, line in enumerate(lines):
         line_len = len(line) + 1  # +1 for newline
         if current_chars + line_len > max_chars and current_lines:
-            chunk_text = "\n".join(current_lines)
-            chunks.append({
-                "content": chunk_text,
-                "file_path": file_path,
-                "project_name": project_name,
-                "language": language,
-                "chunk_index": start_index + len(chunks),
-                "start_line": base_line + start_line + 1,
-                "end_line": base_line + i,
-                "chunk_type": chunk_type,
-                "name": name,
-            })
+            chunks.append(
+                Chunk(
+                    meta,
+                    "\n".join(current_lines),
+                    start_index + len(chunks),
+                    base_line + start_line + 1,
+                    base_line + i,
+                    chunk_type,
+                    name,
+                )
+            )
             # overlap：保留最後幾行
             overlap_chars = 0
             overlap_start = len(current_lines)
@@ -291,16 +454,16 @@ def split_lines(
     if current_lines:
         chunk_text = "\n".join(current_lines)
         if chunk_text.strip():
-            chunks.append({
-                "content": chunk_text,
-                "file_path": file_path,
-                "project_name": project_name,
-                "language": language,
-                "chunk_index": start_index + len(chunks),
-                "start_line": base_line + start_line + 1,
-                "end_line": base_line + len(lines),
-                "chunk_type": chunk_type,
-                "name": name,
-            })
+            chunks.append(
+                Chunk(
+                    meta,
+                    chunk_text,
+                    start_index + len(chunks),
+                    base_line + start_line + 1,
+                    base_line + len(lines),
+                    chunk_type,
+                    name,
+                )
+            )
 
     return chunks
@@ -1,45 +1,241 @@
-"""Ollama embedding 客戶端。"""
+"""Embedding backend：Ollama（HTTP）、ONNX Runtime（行程內 CPU）與 hashing（測試用）。
 
+由 settings.embedding_backend 選擇，透過 create_embedder 建立。
+"""
+
+import hashlib
 import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 import httpx
+import numpy as np
+import orjson
 
 from code_rag.config import settings
+from code_rag.indexer.endpoints import EndpointPool
+from code_rag.utils.vectors import as_matrix, normalize
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_BACKENDS = ("ollama", "onnx", "hashing")
 
-class Embedder:
-    def __init__(self):
-        self.url = f"{settings.ollama_url}/api/embed"
-        self.model = settings.embedding_model
-        self.batch_size = settings.embedding_batch_size
-        self.client = httpx.Client(timeout=120.0)
-
-    def embed_batch(self, texts: list[str]) -> list[list[float]]:
-        """批次嵌入文字，回傳向量清單。"""
-        all_vectors = []
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i : i + self.batch_size]
-            resp = self.client.post(
-                self.url,
-                json={"model": self.model, "input": batch},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            all_vectors.extend(data["embeddings"])
-        return all_vectors
-
-    def embed_single(self, text: str) -> list[float]:
+
+class Embedder(ABC):
+    """Embedding backend 介面。
+
+    向量以 float32 NumPy 矩陣（每列一個向量）回傳，一路傳到 QdrantStorage，
+    不轉成 Python float 清單。
+    """
+
+    name: str = ""
+    batch_size: int = 32
+
+    @abstractmethod
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        """批次嵌入文字，回傳 (len(texts), dims) 的 float32 矩陣。"""
+
+    def embed_single(self, text: str) -> np.ndarray:
         """嵌入單一文字。"""
         return self.embed_batch([text])[0]
 
+    def _finish(self, matrix) -> np.ndarray:
+        """轉為 float32 矩陣，並依設定整批正規化。"""
+        matrix = as_matrix(matrix)
+        return normalize(matrix) if settings.embedding_normalize else matrix
+
+    @property
+    def parallelism(self) -> int:
+        """可同時處理的批次數；pipeline 依此決定一次送出多少文字。"""
+        return 1
+
+    @property
+    def batch_capacity(self) -> int:
+        return self.batch_size * self.parallelism
+
+    def dimensions(self) -> int | None:
+        """模型輸出維度；無法得知（例如服務未啟動）時回傳 None。"""
+        return len(self.embed_single("dimension probe"))
+
+    def warmup(self):
+        """啟動時預先載入模型。"""
+
     def health_check(self) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+    def close(self):
+        pass
+
+
+class OllamaEmbedder(Embedder):
+    """Ollama /api/embed 客戶端，批次分散到一或多個 endpoint。"""
+
+    name = "ollama"
+
+    def __init__(self, urls: list[str] | None = None):
+        self.model = settings.embedding_model
+        self.batch_size = settings.embedding_batch_size
+        self.pool = EndpointPool(
+            urls or settings.ollama_endpoints,
+            eject_after=settings.ollama_eject_after,
+            backoff=settings.ollama_backoff_s,
+            backoff_max=settings.ollama_backoff_max_s,
+        )
+        self.client = httpx.Client(
+            timeout=120.0,
+            limits=httpx.Limits(max_connections=self.parallelism * 2),
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.parallelism, thread_name_prefix="ollama-embed"
+        )
+
+    @property
+    def parallelism(self) -> int:
+        return len(self.pool) * settings.ollama_max_inflight
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        batches = [
+            texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)
+        ]
+        if not batches:
+            return np.empty((0, settings.embedding_dims), dtype=np.float32)
+        if len(batches) == 1:
+            return self._finish(self._post(batches[0]))
+        return self._finish(np.concatenate(list(self.executor.map(self._post, batches))))
+
+    def _post(self, batch: list[str]) -> np.ndarray:
+        """送到負載最低的 endpoint；失敗時換其他 endpoint 重試。"""
+        tried: set[str] = set()
+        error: Exception | None = None
+        for _ in range(len(self.pool)):
+            endpoint = self.pool.acquire(exclude=tried)
+            tried.add(endpoint.url)
+            started = time.perf_counter()
+            try:
+                resp = self.client.post(
+                    f"{endpoint.url}/api/embed",
+                    json={
+                        "model": self.model,
+                        "input": batch,
+                        "keep_alive": settings.ollama_keep_alive,
+                    },
+                )
+                resp.raise_for_status()
+                # orjson 直接解析 bytes，再整批轉成 float32 矩陣
+                vectors = np.array(orjson.loads(resp.content)["embeddings"], dtype=np.float32)
+            except (httpx.HTTPError, KeyError, ValueError, orjson.JSONDecodeError) as e:
+                self.pool.release(endpoint, time.perf_counter() - started, len(batch), e)
+                logger.warning("Embedding request to %s failed: %s", endpoint.url, e)
+                error = e
+                continue
+            self.pool.release(endpoint, time.perf_counter() - started, len(batch))
+            return vectors
+        raise error
+
+    def warmup(self):
+        """對每個 endpoint 送一次請求，讓模型載入並以 keep_alive 保持常駐。"""
+        def _warm(endpoint_url: str):
+            started = time.perf_counter()
+            try:
+                resp = self.client.post(
+                    f"{endpoint_url}/api/embed",
+                    json={
+                        "model": self.model,
+                        "input": ["warmup"],
+                        "keep_alive": settings.ollama_keep_alive,
+                    },
+                )
+                resp.raise_for_status()
+                logger.info(
+                    "Warmed up %s on %s in %.0f ms",
+                    self.model, endpoint_url, (time.perf_counter() - started) * 1000,
+                )
+            except httpx.HTTPError as e:
+                logger.warning("Warm-up of %s failed: %s", endpoint_url, e)
+
+        list(self.executor.map(_warm, [e.url for e in self.pool.endpoints]))
+
+    def dimensions(self) -> int | None:
         try:
-            resp = self.client.get(settings.ollama_url)
-            return resp.status_code == 200
-        except Exception:
-            return False
+            return super().dimensions()
+        except httpx.HTTPError as e:
+            logger.warning("Cannot probe Ollama embedding dims: %s", e)
+            return None
+
+    def health_check(self) -> bool:
+        """任一 endpoint 可連線即視為健康。"""
+        for endpoint in self.pool.endpoints:
+            try:
+                if self.client.get(endpoint.url).status_code == 200:
+                    return True
+            except Exception:
+                continue
+        return False
+
+    def stats(self) -> dict:
+        return {**super().stats(), "endpoints": self.pool.stats()}
 
     def close(self):
+        self.executor.shutdown(wait=False)
         self.client.close()
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbedder(Embedder):
+    """確定性的 feature hashing 向量（token 詞袋），供測試與 benchmark 使用。
+
+    不需要模型或網路；共享 token 越多的文字 cosine 相似度越高。
+    """
+
+    name = "hashing"
+
+    def __init__(self, dims: int | None = None):
+        self.dims = dims or settings.embedding_dims
+        self.batch_size = settings.embedding_batch_size
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest())
+                matrix[row, digest % self.dims] += 1.0 if digest >> 63 else -1.0
+        # 沒有 token 的文字給固定向量，避免零向量
+        matrix[~matrix.any(axis=1), 0] = 1.0
+        return normalize(matrix)
+
+    def dimensions(self) -> int | None:
+        return self.dims
+
+
+def create_embedder(backend: str | None = None) -> Embedder:
+    """依設定建立 embedding backend。"""
+    backend = backend or settings.embedding_backend
+    if backend == "ollama":
+        return OllamaEmbedder()
+    if backend == "hashing":
+        return HashingEmbedder()
+    if backend == "onnx":
+        # onnxruntime / tokenizers 為選用依賴，只在使用時載入
+        from code_rag.indexer.onnx_embedder import OnnxEmbedder
+
+        return OnnxEmbedder()
+    raise ValueError(f"Unknown embedding backend: {backend!r}")
+
+
+def validate_dims(embedder: Embedder):
+    """確認 backend 輸出維度與 EMBEDDING_DIMS（即 collection 的設定）一致。"""
+    dims = embedder.dimensions()
+    if dims is None:
+        return
+    if dims != settings.embedding_dims:
+        raise RuntimeError(
+            f"Embedding backend '{embedder.name}' produces {dims} dims, "
+            f"but EMBEDDING_DIMS is {settings.embedding_dims}"
+        )
@@ -0,0 +1,117 @@
+"""多個 embedding endpoint 的負載平衡與健康追蹤。
+
+請求分派到進行中請求數最少的 endpoint；連續失敗達門檻的 endpoint 會被
+暫時剔除，並以指數 backoff 延後重試，成功一次即恢復。
+"""
+
+import threading
+import time
+
+from code_rag.metrics import OLLAMA_REQUEST_ERRORS, OLLAMA_REQUEST_SECONDS
+
+
+class _Endpoint:
+    __slots__ = (
+        "url", "outstanding", "failures", "ejections", "retry_at",
+        "requests", "texts", "errors", "busy_seconds", "last_latency", "last_error",
+    )
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0  # 連續失敗次數
+        self.ejections = 0  # 連續剔除次數（決定 backoff）
+        self.retry_at = 0.0  # 剔除到此時間（monotonic）
+        self.requests = 0
+        self.texts = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.last_latency = 0.0
+        self.last_error: str | None = None
+
+
+class EndpointPool:
+    def __init__(
+        self,
+        urls: list[str],
+        eject_after: int = 3,
+        backoff: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        if not urls:
+            raise ValueError("At least one endpoint URL is required")
+        self.endpoints = [_Endpoint(url.rstrip("/")) for url in urls]
+        self.eject_after = eject_after
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def acquire(self, exclude: set[str] | None = None) -> _Endpoint:
+        """選出進行中請求最少的可用 endpoint。
+
+        全部被剔除時選最早可重試的一個，讓請求仍有機會成功。
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                e for e in self.endpoints if not exclude or e.url not in exclude
+            ] or self.endpoints
+            available = [e for e in candidates if e.retry_at <= now]
+            if available:
+                endpoint = min(available, key=lambda e: (e.outstanding, e.last_latency))
+            else:
+                endpoint = min(candidates, key=lambda e: e.retry_at)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(
+        self,
+        endpoint: _Endpoint,
+        latency: float,
+        texts: int,
+        error: Exception | None = None,
+    ):
+        OLLAMA_REQUEST_SECONDS.labels(endpoint.url).observe(latency)
+        if error is not None:
+            OLLAMA_REQUEST_ERRORS.labels(endpoint.url).inc()
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.requests += 1
+            endpoint.busy_seconds += latency
+            endpoint.last_latency = latency
+            if error is None:
+                endpoint.texts += texts
+                endpoint.failures = 0
+                endpoint.ejections = 0
+                endpoint.retry_at = 0.0
+                return
+            endpoint.errors += 1
+            endpoint.failures += 1
+            endpoint.last_error = str(error)
+            if endpoint.failures >= self.eject_after:
+                delay = min(self.backoff_max, self.backoff * 2 ** endpoint.ejections)
+                endpoint.ejections += 1
+                endpoint.retry_at = time.monotonic() + delay
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": e.url,
+                    "healthy": e.retry_at <= now,
+                    "retry_in_s": max(0.0, e.retry_at - now),
+                    "outstanding": e.outstanding,
+                    "requests": e.requests,
+                    "texts": e.texts,
+                    "errors": e.errors,
+                    "avg_latency_ms": e.busy_seconds / e.requests * 1000 if e.requests else 0.0,
+                    "last_latency_ms": e.last_latency * 1000,
+                    "texts_per_second": e.texts / e.busy_seconds if e.busy_seconds else 0.0,
+                    "last_error": e.last_error,
+                }
+                for e in self.endpoints
+            ]
@@ -0,0 +1,76 @@
+"""執行 StateDB index_jobs 中的一筆索引任務。
+
+API（INDEX_MODE=inline）與 index worker（python -m code_rag.worker）共用：
+執行期間背景執行緒每 job_heartbeat_s 秒把心跳與進度快照寫回任務，
+其他行程的 /index/{project}/events 由此讀取；心跳逾時的任務會被判定失敗。
+"""
+
+import logging
+import threading
+import traceback
+
+from code_rag.config import settings
+from code_rag.indexer.embedder import Embedder
+from code_rag.indexer.pipeline import run_index
+from code_rag.indexer.progress import IndexProgress, start_job
+from code_rag.profiling import Profiler
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.state import StateDB, ref_state_key
+
+logger = logging.getLogger(__name__)
+
+
+def _heartbeat(state_db: StateDB, job_id: int, progress: IndexProgress, stop: threading.Event):
+    while not stop.wait(settings.job_heartbeat_s):
+        try:
+            state_db.heartbeat_job(job_id, progress.export())
+        except Exception as e:
+            logger.warning("Heartbeat failed for job %d: %s", job_id, e)
+
+
+def run_job(
+    job: dict,
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    embedder: Embedder,
+    progress: IndexProgress | None = None,
+    profiler: Profiler | None = None,
+) -> str:
+    """在目前執行緒執行任務，回傳最終狀態（completed / failed）。
+
+    cProfile 只量測進入它的執行緒，因此 profiler 在這裡（索引執行緒內）啟動；
+    未指定且任務要求 profile 時自行建立。
+    """
+    project_name = job["project_name"]
+    progress = progress or start_job(project_name, job["id"])
+    if profiler is None and job["profile"]:
+        profiler = Profiler("index", project_name)
+
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat, args=(state_db, job["id"], progress, stop),
+        name=f"job-heartbeat-{job['id']}", daemon=True,
+    )
+    beat.start()
+    status, error = "completed", None
+    try:
+        if profiler is None:
+            run_index(
+                project_name, job["path"], qdrant, state_db, embedder,
+                force=job["force"], progress=progress, ref=job["ref"],
+            )
+        else:
+            with profiler:
+                run_index(
+                    project_name, job["path"], qdrant, state_db, embedder,
+                    force=job["force"], progress=progress, ref=job["ref"],
+                )
+    except Exception as e:
+        logger.error("Index failed for '%s': %s\n%s", project_name, e, traceback.format_exc())
+        state_db.set_index_status(ref_state_key(project_name, job["ref"]), "failed", error=str(e))
+        status, error = "failed", str(e)
+    finally:
+        stop.set()
+        beat.join()
+    state_db.finish_job(job["id"], status, error, progress.export())
+    return status
@@ -0,0 +1,152 @@
+"""ONNX Runtime 行程內 CPU embedding backend。
+
+模型與 tokenizer 由本地檔案提供（ONNX_MODEL_PATH、ONNX_TOKENIZER_PATH，
+tokenizer 為 Hugging Face tokenizers 的 tokenizer.json）。索引的批次拆成
+多個子批次在 thread pool 中平行推論；查詢的 embed_single 則由 micro-batcher
+在短時間窗內合併成一批，減少突發查詢時逐筆推論的開銷。
+
+需要安裝選用依賴：uv sync --extra onnx
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import onnxruntime as ort
+from tokenizers import Tokenizer
+
+from code_rag.config import settings
+from code_rag.indexer.embedder import Embedder
+
+logger = logging.getLogger(__name__)
+
+ONNX_POOLING_MODES = ("cls", "mean")
+
+
+class OnnxEmbedder(Embedder):
+    name = "onnx"
+
+    def __init__(self):
+        if not settings.onnx_model_path or not settings.onnx_tokenizer_path:
+            raise ValueError("ONNX backend requires ONNX_MODEL_PATH and ONNX_TOKENIZER_PATH")
+        if settings.onnx_pooling not in ONNX_POOLING_MODES:
+            raise ValueError(f"Unknown ONNX pooling mode: {settings.onnx_pooling!r}")
+
+        options = ort.SessionOptions()
+        if settings.onnx_intra_op_threads:
+            options.intra_op_num_threads = settings.onnx_intra_op_threads
+        # InferenceSession.run 可由多個執行緒同時呼叫
+        self.session = ort.InferenceSession(
+            settings.onnx_model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(settings.onnx_tokenizer_path)
+        self.tokenizer.enable_truncation(settings.onnx_max_length)
+        self.tokenizer.enable_padding()
+
+        self.batch_size = settings.embedding_batch_size
+        self.pool = ThreadPoolExecutor(
+            max_workers=settings.onnx_workers, thread_name_prefix="onnx-embed"
+        )
+        self._batcher = _MicroBatcher(
+            self._infer, self.batch_size, settings.onnx_batch_wait_ms / 1000
+        )
+        logger.info(
+            "ONNX embedder loaded: %s (%d workers, pooling=%s)",
+            settings.onnx_model_path, settings.onnx_workers, settings.onnx_pooling,
+        )
+
+    def _infer(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        if output.ndim == 3:
+            # (batch, seq, dims) 的 token 向量：依設定池化
+            if settings.onnx_pooling == "cls":
+                output = output[:, 0]
+            else:
+                mask = attention_mask[..., None].astype(output.dtype)
+                output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    @property
+    def parallelism(self) -> int:
+        return settings.onnx_workers
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        futures = [
+            self.pool.submit(self._infer, texts[i : i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if not futures:
+            return np.empty((0, settings.embedding_dims), dtype=np.float32)
+        return np.concatenate([future.result() for future in futures])
+
+    def embed_single(self, text: str) -> np.ndarray:
+        return self._batcher.submit(text).result()
+
+    def dimensions(self) -> int | None:
+        dims = self.session.get_outputs()[0].shape[-1]
+        if isinstance(dims, int):
+            return dims
+        # 動態維度：實際推論一次
+        return super().dimensions()
+
+    def close(self):
+        self._batcher.close()
+        self.pool.shutdown(wait=False)
+
+
+class _MicroBatcher:
+    """把同時到達的單筆查詢在 max_wait 秒內合併成一批推論。"""
+
+    def __init__(self, infer, max_batch: int, max_wait: float):
+        self._infer = infer
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._queue: queue.Queue[tuple[str, Future] | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="onnx-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self._max_wait
+            try:
+                while len(batch) < self._max_batch:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    if nxt is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(nxt)
+            except queue.Empty:
+                pass
+            try:
+                vectors = self._infer([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def close(self):
+        self._queue.put(None)
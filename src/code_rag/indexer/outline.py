@@ -0,0 +1,184 @@
+"""檔案 / class 摘要（粗粒度向量）。
+
+由 tree-sitter 節點擷取簽名、docstring 與大綱，每個檔案產生一個 file
+摘要，每個含成員的 class（interface、struct、impl 等）產生一個 class
+摘要，供 coarse-to-fine 搜尋先找出相關檔案。
+"""
+
+from pathlib import Path
+
+from tree_sitter import Node
+
+from code_rag.config import settings
+from code_rag.indexer.chunker import ParsedSource, extract_name, node_chunk_type, parse_source
+from code_rag.indexer.records import Chunk, FileMeta
+
+# 產生 class 摘要的容器類型（node_chunk_type 的結果）
+_CONTAINER_TYPES = {"class", "interface", "struct", "impl", "module"}
+
+# 單一簽名的長度上限（多行參數列會壓成一行）
+_MAX_SIGNATURE_CHARS = 200
+
+
+def chunk_code_with_summaries(
+    source: str | bytes,
+    language: str,
+    file_path: str,
+    project_name: str,
+) -> tuple[list[Chunk], list[Chunk]]:
+    """解析一次，同時產生細粒度 chunk 與檔案 / class 摘要。"""
+    parsed = parse_source(source, language, file_path, project_name)
+    if parsed is None:
+        return [], []
+    chunks = parsed.chunks()
+    if not chunks:
+        return [], []
+    summaries = _Outline(parsed).build(parsed.root, parsed.semantic_nodes)
+    return chunks, summaries
+
+
+def text_summary(text: str, meta: FileMeta) -> list[Chunk]:
+    """非程式碼檔案的摘要：路徑加上 markdown 標題，沒有標題時取開頭內容。"""
+    lines = text.split("\n")
+    headings = [line.strip() for line in lines if line.lstrip().startswith("#")]
+    body = "\n".join(headings) if headings else text.strip()
+    if not body:
+        return []
+    content = _truncate(f"{meta.file_path}\n{body}")
+    return [Chunk(meta, content, 0, 1, len(lines), "file_summary", meta.file_path, [])]
+
+
+def file_head_summary(file_path: str, meta: FileMeta) -> list[Chunk]:
+    """串流分塊的大型檔案：只讀開頭一段產生摘要。"""
+    with open(file_path, "rb") as f:
+        head = f.read(settings.summary_max_chars * 4)
+    return text_summary(head.decode("utf-8", errors="ignore"), meta)
+
+
+def _truncate(text: str) -> str:
+    return text[: settings.summary_max_chars]
+
+
+class _Outline:
+    def __init__(self, parsed: ParsedSource):
+        self.parsed = parsed
+        self.src = parsed.src
+        self.meta = parsed.meta
+        self.language = parsed.language
+
+    def build(self, root: Node, nodes: list[Node]) -> list[Chunk]:
+        summaries: list[Chunk] = []
+        outline: list[str] = []
+        names: list[str] = []
+        classes: list[tuple[Node, list[Node]]] = []
+
+        for node in nodes:
+            outline.append(self._describe(node))
+            name = extract_name(node, self.src)
+            if name:
+                names.append(name)
+            if node_chunk_type(self._definition(node).type) in _CONTAINER_TYPES:
+                members = self._members(node)
+                if members:
+                    classes.append((node, members))
+
+        header = [self.meta.file_path]
+        module_doc = self._module_doc(root)
+        if module_doc:
+            header.append(module_doc)
+        summaries.append(
+            Chunk(
+                self.meta,
+                _truncate("\n".join(header + outline)),
+                0,
+                1,
+                root.end_point[0] + 1,
+                "file_summary",
+                Path(self.meta.file_path).name,
+                names,
+            )
+        )
+
+        for node, members in classes:
+            name = extract_name(node, self.src)
+            lines = [f"{self.meta.file_path}", self._describe(node)]
+            lines.extend(f"    {self._describe(m)}" for m in members)
+            summaries.append(
+                Chunk(
+                    self.meta,
+                    _truncate("\n".join(lines)),
+                    len(summaries),
+                    node.start_point[0] + 1,
+                    node.end_point[0] + 1,
+                    "class_summary",
+                    name,
+                    [n for n in (extract_name(m, self.src) for m in members) if n],
+                )
+            )
+        return summaries
+
+    def _members(self, node: Node) -> list[Node]:
+        return self.parsed.semantic_children(self._definition(node))
+
+    def _definition(self, node: Node) -> Node:
+        """decorated_definition / export_statement 取出實際的定義節點。"""
+        inner = node.child_by_field_name("definition") or node.child_by_field_name("declaration")
+        return inner or node
+
+    def _text(self, start: int, end: int) -> str:
+        return self.src[start:end].decode("utf-8", errors="ignore")
+
+    def _signature(self, node: Node) -> str:
+        definition = self._definition(node)
+        body = definition.child_by_field_name("body")
+        if body is not None:
+            text = self._text(definition.start_byte, body.start_byte)
+        else:
+            text = self._text(definition.start_byte, definition.end_byte).split("\n", 1)[0]
+        signature = " ".join(text.split()).rstrip("{:= ")
+        return signature[:_MAX_SIGNATURE_CHARS]
+
+    def _doc(self, node: Node) -> str | None:
+        """Python 取 docstring 第一行，其他語言取節點前的註解第一行。"""
+        definition = self._definition(node)
+        if self.language == "python":
+            body = definition.child_by_field_name("body")
+            if body is not None and body.named_child_count:
+                return self._string_statement(body.named_children[0])
+            return None
+        prev = node.prev_named_sibling
+        if prev is not None and "comment" in prev.type and prev.end_point[0] + 1 >= node.start_point[0]:
+            return _first_line(self._text(prev.start_byte, prev.end_byte))
+        return None
+
+    def _module_doc(self, root: Node) -> str | None:
+        if not root.named_child_count:
+            return None
+        first = root.named_children[0]
+        if self.language == "python":
+            return self._string_statement(first)
+        if "comment" in first.type:
+            return _first_line(self._text(first.start_byte, first.end_byte))
+        return None
+
+    def _string_statement(self, node: Node) -> str | None:
+        if node.type != "expression_statement" or not node.named_child_count:
+            return None
+        string = node.named_children[0]
+        if string.type != "string":
+            return None
+        return _first_line(self._text(string.start_byte, string.end_byte))
+
+    def _describe(self, node: Node) -> str:
+        doc = self._doc(node)
+        signature = self._signature(node)
+        return f"{signature}  # {doc}" if doc else signature
+
+
+def _first_line(text: str) -> str | None:
+    """去掉引號與註解符號後的第一個非空行。"""
+    for line in text.split("\n"):
+        line = line.strip().strip("\"'`").lstrip("/*#!").rstrip("*/").strip()
+        if line:
+            return line
+    return None
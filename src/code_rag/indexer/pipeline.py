@@ -1,114 +1,624 @@
 """索引 pipeline：掃描 → 分塊 → 嵌入 → 寫入。"""
 
 import logging
+import time
 from pathlib import Path
 
+import numpy as np
+
 from code_rag.config import settings
 from code_rag.indexer.scanner import scan_files
 from code_rag.indexer.chunker import chunk_code, split_lines
 from code_rag.indexer.embedder import Embedder
 from code_rag.indexer.hasher import file_hash
+from code_rag.indexer.outline import chunk_code_with_summaries, file_head_summary, text_summary
+from code_rag.indexer.progress import IndexProgress, start_job
+from code_rag.indexer.records import Chunk, FileMeta
+from code_rag.indexer.refs import RefScope
+from code_rag.indexer.streaming import stream_chunks
+from code_rag.metrics import INDEX_CHUNKS, INDEX_FILES, INDEX_JOBS_RUNNING, index_stage
+from code_rag.storage.autotune import tune_hnsw_ef
 from code_rag.storage.qdrant import QdrantStorage
 from code_rag.storage.state import StateDB
 from code_rag.utils.language import supports_treesitter
+from code_rag.utils.simhash import SimHashIndex, simhash
 
 logger = logging.getLogger(__name__)
 
 
+def _chunk_file(file_path: str, relative_path: str, language: str, project_name: str) -> list[Chunk]:
+    if supports_treesitter(language):
+        # tree-sitter 直接解析 bytes，chunk 內容由 bytes 切出
+        return chunk_code(Path(file_path).read_bytes(), language, relative_path, project_name)
+    source = Path(file_path).read_text(encoding="utf-8", errors="ignore")
+    return split_lines(source, relative_path, project_name, language)
+
+
+def _chunk_file_with_summaries(
+    file_path: str, relative_path: str, language: str, project_name: str
+) -> tuple[list[Chunk], list[Chunk]]:
+    """分塊並產生檔案 / class 摘要（tree-sitter 語言只解析一次）。"""
+    if supports_treesitter(language):
+        return chunk_code_with_summaries(
+            Path(file_path).read_bytes(), language, relative_path, project_name
+        )
+    source = Path(file_path).read_text(encoding="utf-8", errors="ignore")
+    chunks = split_lines(source, relative_path, project_name, language)
+    if not chunks:
+        return [], []
+    return chunks, text_summary(source, chunks[0].file)
+
+
+def _embed(embedder: Embedder, texts: list[str], progress: IndexProgress) -> np.ndarray:
+    """嵌入並記錄 embed 階段耗時與任務進度。"""
+    started = time.perf_counter()
+    with index_stage("embed"):
+        vectors = embedder.embed_batch(texts)
+    progress.embedded(len(texts), time.perf_counter() - started)
+    return vectors
+
+
+def _index_summaries(
+    summaries: list[Chunk],
+    vectors: np.ndarray,
+    project_name: str,
+    relative_path: str,
+    qdrant: QdrantStorage,
+    scope: RefScope | None = None,
+):
+    # 摘要數量會隨 class 增減，先刪除舊摘要再寫入（ref-aware 的舊版本由 release 處理）
+    if scope is None:
+        qdrant.delete_summaries(project_name, relative_path)
+    qdrant.upsert_summaries(summaries, vectors)
+
+
+def _index_large_file(
+    file_path: str,
+    relative_path: str,
+    language: str,
+    project_name: str,
+    qdrant: QdrantStorage,
+    embedder: Embedder,
+    progress: IndexProgress,
+    scope: RefScope | None = None,
+    hash_val: str | None = None,
+) -> int:
+    """大型檔案：串流分塊並分批嵌入寫入，記憶體只保留一批 chunk。
+
+    point ID 是確定性的，新 chunk 直接覆寫舊 chunk，最後再刪除多出的舊 chunk。
+    ref-aware 時新版本的 point ID 與舊版本不同，舊版本由呼叫端 release。
+    """
+    # 至少湊滿 backend 可平行處理的量（多 endpoint 時同時送出）
+    batch_size = max(settings.embedding_batch_size * 4, embedder.batch_capacity)
+    count = 0
+    batch: list[Chunk] = []
+    for chunk in stream_chunks(file_path, relative_path, project_name, language):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            if scope is not None:
+                scope.tag(batch, relative_path, hash_val)
+            qdrant.upsert_chunks(batch, _embed(embedder, [c.content for c in batch], progress))
+            count += len(batch)
+            progress.add_chunks(len(batch))
+            batch = []
+    if batch:
+        if scope is not None:
+            scope.tag(batch, relative_path, hash_val)
+        qdrant.upsert_chunks(batch, _embed(embedder, [c.content for c in batch], progress))
+        count += len(batch)
+        progress.add_chunks(len(batch))
+    if scope is None:
+        qdrant.delete_by_file(project_name, relative_path, from_chunk_index=count)
+    return count
+
+
+def _load_dedup_index(project_name: str, state_db: StateDB) -> SimHashIndex:
+    index = SimHashIndex(settings.dedup_max_distance)
+    for value, cluster_id in state_db.get_cluster_representatives(project_name):
+        index.add(value, cluster_id)
+    return index
+
+
+def _release_clusters(
+    project_name: str,
+    relative_path: str,
+    index: SimHashIndex,
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    embedder: Embedder,
+    progress: IndexProgress,
+    files_by_path: dict[str, dict],
+    pending: list["_PendingFile"],
+) -> int:
+    """檔案變更或刪除前，把它代表的 cluster 交接給其他成員，再移除檔案的 cluster 紀錄。
+
+    每個 cluster 只嵌入新代表這一個 chunk，成員所在的檔案不重新索引：優先選等待嵌入
+    的批次中的重複 chunk（加入該檔案的批次一起嵌入），其次為其他檔案中已記錄的成員
+    （重新分塊該檔案取得內容）。嵌入失敗時不修改任何狀態並拋出例外，此檔案下次重新處理。
+    回傳新代表數。
+    """
+    released = state_db.get_file_representatives(project_name, relative_path)
+
+    # 批次中的重複 chunk：其 cluster 紀錄尚未寫入 StateDB
+    in_batch: dict[str, tuple[_PendingFile, int]] = {}
+    for f in pending:
+        for i, row in enumerate(f.cluster_rows or ()):
+            if row[4] in released and not row[5]:
+                in_batch.setdefault(row[4], (f, i))
+
+    # 其他檔案中已記錄的成員；批次中的檔案在 StateDB 的紀錄已過期，不列入
+    from_db: dict[str, tuple[int, Chunk]] = {}
+    chunked: dict[str, dict[int, Chunk]] = {}
+    exclude = {f.relative_path for f in pending} | {relative_path}
+    for row in state_db.get_cluster_candidates(project_name, released - in_batch.keys(), exclude):
+        cluster_id, path = row["cluster_id"], row["file_path"]
+        if cluster_id in from_db:
+            continue
+        if path not in chunked:
+            chunked[path] = {}
+            info = files_by_path.get(path)
+            if info is not None:
+                try:
+                    chunked[path] = {
+                        c.chunk_index: c
+                        for c in _chunk_file(info["path"], path, info["language"], project_name)
+                    }
+                except OSError as e:
+                    logger.warning("Cannot read %s to promote a duplicate chunk: %s", path, e)
+        chunk = chunked[path].get(row["chunk_index"])
+        # 內容已變更的成員不適用，該檔案本身會在此次執行中重新處理
+        if chunk is not None and simhash(chunk.content) == row["simhash"]:
+            from_db[cluster_id] = (row["simhash"], chunk)
+
+    if from_db:
+        chunks = [chunk for _, chunk in from_db.values()]
+        qdrant.upsert_chunks(chunks, _embed(embedder, [c.content for c in chunks], progress))
+
+    # 以下只修改狀態（嵌入成功後才執行）
+    for cluster_id, (value, chunk) in from_db.items():
+        new_id = qdrant.make_point_id(project_name, chunk.file_path, chunk.chunk_index)
+        state_db.promote_cluster_member(
+            project_name, cluster_id, new_id, chunk.file_path, chunk.chunk_index
+        )
+        # 專案統計由 file_stats 彙總，升為代表的 chunk 也要計入（批次中的檔案寫入時才計算）
+        state_db.add_file_chunk(project_name, chunk.file_path, chunk.chunk_type)
+        index.add(value, new_id)
+    for cluster_id, (f, i) in in_batch.items():
+        chunk_index, start_line, end_line, value, _, _ = f.cluster_rows[i]
+        chunk = f.duplicates.pop(chunk_index)
+        new_id = qdrant.make_point_id(project_name, chunk.file_path, chunk_index)
+        for g in pending:
+            if g.cluster_rows:
+                g.cluster_rows = [
+                    (*row[:4], new_id, row[5]) if row[4] == cluster_id else row
+                    for row in g.cluster_rows
+                ]
+        f.cluster_rows[i] = (chunk_index, start_line, end_line, value, new_id, True)
+        f.chunks.append(chunk)
+        state_db.promote_cluster_member(project_name, cluster_id, new_id)
+        index.add(value, new_id)
+
+    index.remove_clusters(released)
+    state_db.remove_file_clusters(project_name, relative_path)
+    promoted = len(from_db) + len(in_batch)
+    INDEX_CHUNKS.labels("promoted").inc(promoted)
+    return promoted
+
+
+def _dedup_chunks(
+    chunks: list[Chunk],
+    index: SimHashIndex,
+    qdrant: QdrantStorage,
+) -> tuple[list[Chunk], list[tuple], dict[int, Chunk]]:
+    """挑出要嵌入的 chunk：近似重複的 chunk 只記錄位置，由 cluster 的代表 chunk 寫入 Qdrant。
+
+    cluster_id 即代表 chunk 的 point ID。回傳 (要寫入的 chunk, cluster 紀錄,
+    未寫入的重複 chunk)；後者在代表被移除時可直接升為新代表。
+    """
+    unique: list[Chunk] = []
+    rows: list[tuple] = []
+    duplicates: dict[int, Chunk] = {}
+    for chunk in chunks:
+        if len(chunk.content) < settings.dedup_min_chars:
+            # 太短的 chunk（getter、空函式等）重複也不代表複製貼上
+            unique.append(chunk)
+            continue
+        value = simhash(chunk.content)
+        cluster_id = index.find(value)
+        representative = cluster_id is None
+        if representative:
+            cluster_id = qdrant.make_point_id(chunk.project_name, chunk.file_path, chunk.chunk_index)
+            index.add(value, cluster_id)
+            unique.append(chunk)
+        else:
+            duplicates[chunk.chunk_index] = chunk
+        rows.append(
+            (chunk.chunk_index, chunk.start_line, chunk.end_line, value, cluster_id, representative)
+        )
+    return unique, rows, duplicates
+
+
+class _PendingFile:
+    """已分塊、等待與其他檔案一起嵌入的檔案。"""
+
+    __slots__ = (
+        "relative_path", "language", "size_bytes", "hash", "chunks", "summaries", "cluster_rows",
+        "duplicates", "stored_hash",
+    )
+
+    def __init__(
+        self,
+        relative_path: str,
+        language: str,
+        size_bytes: int,
+        hash_val: str,
+        chunks: list[Chunk],
+        summaries: list[Chunk],
+        cluster_rows: list[tuple] | None,
+        duplicates: dict[int, Chunk] | None = None,
+        stored_hash: str | None = None,
+    ):
+        self.relative_path = relative_path
+        self.language = language
+        self.size_bytes = size_bytes
+        self.hash = hash_val
+        self.chunks = chunks
+        self.summaries = summaries
+        self.cluster_rows = cluster_rows
+        self.duplicates = duplicates or {}
+        # 索引前的 hash（ref-aware 寫入後 release 舊版本）
+        self.stored_hash = stored_hash
+
+    @property
+    def texts(self) -> list[str]:
+        return [c.content for c in self.chunks] + [s.content for s in self.summaries]
+
+
+def _flush_pending(
+    pending: list[_PendingFile],
+    project_name: str,
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    embedder: Embedder,
+    dedup: SimHashIndex | None,
+    progress: IndexProgress,
+    scope: RefScope | None = None,
+) -> int:
+    """一次嵌入多個小檔案的 chunk（讓多個 embedding endpoint 同時工作），再逐檔寫入。
+
+    回傳寫入的 chunk 數。嵌入失敗時整組檔案都不更新 hash，下次重新索引。
+    ref-aware 時狀態記錄在 scope.state_key，舊版本在新版本寫入後才 release。
+    """
+    state_key = scope.state_key if scope else project_name
+    if not pending:
+        return 0
+    texts = [text for f in pending for text in f.texts]
+    try:
+        vectors = _embed(embedder, texts, progress)
+    except Exception as e:
+        logger.error(
+            "Embedding failed for %d file(s) (%s, ...): %s",
+            len(pending), pending[0].relative_path, e,
+        )
+        for f in pending:
+            progress.error(f.relative_path, f"Embedding failed: {e}")
+        if dedup is not None:
+            # 撤回這些檔案新增的代表，避免其他檔案指向不存在的 point
+            dedup.remove_clusters({
+                row[4] for f in pending for row in f.cluster_rows or () if row[5]
+            })
+        INDEX_FILES.labels("failed").inc(len(pending))
+        return 0
+
+    written = 0
+    offset = 0
+    failed_clusters: set[str] = set()
+    for f in pending:
+        file_vectors = vectors[offset : offset + len(f.chunks) + len(f.summaries)]
+        offset += len(file_vectors)
+        if failed_clusters and any(
+            row[4] in failed_clusters for row in f.cluster_rows or () if not row[5]
+        ):
+            # 重複 chunk 指向寫入失敗的代表：不更新 hash，下次重新分塊時由此檔案成為代表
+            failed_clusters.update(row[4] for row in f.cluster_rows if row[5])
+            if dedup is not None:
+                dedup.remove_clusters({row[4] for row in f.cluster_rows if row[5]})
+            INDEX_FILES.labels("failed").inc()
+            progress.error(f.relative_path, "Write skipped: duplicate of a failed representative")
+            continue
+        try:
+            # 刪除此檔案的舊向量（含摘要），再寫入新的
+            with index_stage("write"):
+                if scope is None:
+                    qdrant.delete_by_file(project_name, f.relative_path)
+                qdrant.upsert_chunks(f.chunks, file_vectors[: len(f.chunks)])
+                if f.summaries:
+                    qdrant.upsert_summaries(f.summaries, file_vectors[len(f.chunks) :])
+                if scope is not None and f.stored_hash not in (None, f.hash):
+                    scope.release(f.relative_path, f.stored_hash)
+
+            # 更新 hash、cluster 紀錄與檔案統計
+            with index_stage("state"):
+                if f.cluster_rows is not None:
+                    state_db.set_file_clusters(project_name, f.relative_path, f.cluster_rows)
+                state_db.set_file_hash(state_key, f.relative_path, f.hash)
+                state_db.set_file_stats(
+                    state_key, f.relative_path, f.language, f.size_bytes,
+                    _count_chunk_types(f.chunks),
+                )
+            written += len(f.chunks)
+            progress.add_chunks(len(f.chunks))
+            INDEX_FILES.labels("indexed").inc()
+        except Exception as e:
+            # 與嵌入失敗相同：撤回此檔案未寫入的代表
+            representatives = {row[4] for row in f.cluster_rows or () if row[5]}
+            failed_clusters.update(representatives)
+            if dedup is not None:
+                dedup.remove_clusters(representatives)
+            INDEX_FILES.labels("failed").inc()
+            progress.error(f.relative_path, f"Write failed: {e}")
+            logger.error("Error writing %s: %s", f.relative_path, e)
+    return written
+
+
+def _count_chunk_types(chunks: list[Chunk]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for c in chunks:
+        counts[c.chunk_type] = counts.get(c.chunk_type, 0) + 1
+    return counts
+
+
 def run_index(
     project_name: str,
     project_path: str,
     qdrant: QdrantStorage,
     state_db: StateDB,
     embedder: Embedder,
+    force: bool = False,
+    progress: IndexProgress | None = None,
+    ref: str | None = None,
+):
+    """執行完整的索引 pipeline。
+
+    force 時忽略 hash 重新處理所有檔案（例如啟用 summary_vectors 後補齊摘要）。
+    啟用 dedup_chunks 時，代表 chunk 被移除的 cluster 由其他成員之一接任代表，
+    只嵌入該 chunk（見 _release_clusters）。
+    指定 ref 時以 ref-aware 模式索引（見 code_rag.indexer.refs）：與專案其他 ref
+    內容相同的檔案共用既有向量，不重新 embedding。
+    即時進度寫入 progress（未指定時建立新的任務進度）。
+    """
+    progress = progress or start_job(project_name)
+    try:
+        with INDEX_JOBS_RUNNING.track_inprogress():
+            _run_index(project_name, project_path, qdrant, state_db, embedder, force, progress, ref)
+    except Exception as e:
+        progress.finish("failed", str(e))
+        raise
+    progress.finish("completed")
+
+
+def _run_index(
+    project_name: str,
+    project_path: str,
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    embedder: Embedder,
+    force: bool,
+    progress: IndexProgress,
+    ref: str | None = None,
 ):
-    """執行完整的索引 pipeline。"""
+    started = time.perf_counter()
     path = Path(project_path)
     if not path.exists():
         raise FileNotFoundError(f"Project path not found: {project_path}")
 
     qdrant.ensure_collection()
+    scope = RefScope(project_name, ref, qdrant, state_db) if ref is not None else None
+    # ref-aware 時檔案狀態、統計與 index_status 記錄在 <project>@<ref>
+    state_key = scope.state_key if scope else project_name
 
     # 掃描檔案
-    files = scan_files(path)
+    progress.set_stage("scan")
+    with index_stage("scan"):
+        files = scan_files(path)
     total_files = len(files)
-    state_db.set_index_status(project_name, "running", total_files=total_files)
+    state_db.set_index_status(state_key, "running", total_files=total_files)
 
     # 取得已知的檔案清單（用於偵測刪除）
-    known_files = state_db.get_all_file_paths(project_name)
-    current_files = set()
+    known_files = state_db.get_all_file_paths(state_key)
+    # 尚無檔案統計的既有檔案（升級前索引的專案）需補算統計
+    files_with_stats = state_db.get_stats_file_paths(state_key)
+    files_by_path = {f["relative_path"]: f for f in files}
+    current_files = set(files_by_path)
+
+    # 近似重複的 cluster 以 point ID 指向代表 chunk，無法跨 ref 共用，ref-aware 時不啟用
+    dedup = (
+        _load_dedup_index(project_name, state_db)
+        if settings.dedup_chunks and scope is None
+        else None
+    )
+    # 小檔案累積到 backend 的批次容量再一起嵌入
+    batch: list[_PendingFile] = []
+    batch_texts = 0
+
+    # 刪除已不存在的檔案對應的向量
+    deleted_files = known_files - current_files
+    progress.set_stage("delete", total_files)
+    for deleted_path in deleted_files:
+        if scope is None:
+            qdrant.delete_by_file(project_name, deleted_path)
+        else:
+            scope.release(deleted_path, state_db.get_file_hash(state_key, deleted_path))
+        if dedup is not None:
+            _release_clusters(
+                project_name, deleted_path, dedup, qdrant, state_db, embedder, progress,
+                files_by_path, batch,
+            )
+        state_db.remove_file(state_key, deleted_path)
+        INDEX_FILES.labels("deleted").inc()
+        logger.info("Removed deleted file from index: %s", deleted_path)
 
     processed = 0
     total_chunks = 0
 
+    progress.set_stage("index", total_files)
     for file_info in files:
         file_path = file_info["path"]
         relative_path = file_info["relative_path"]
         language = file_info["language"]
-        current_files.add(relative_path)
 
         try:
             # 增量檢查：hash 沒變就跳過
-            current_hash = file_hash(file_path)
-            stored_hash = state_db.get_file_hash(project_name, relative_path)
-            if stored_hash == current_hash:
-                processed += 1
+            with index_stage("hash"):
+                current_hash = file_hash(file_path)
+                stored_hash = state_db.get_file_hash(state_key, relative_path)
+            size_bytes = Path(file_path).stat().st_size
+            streaming = size_bytes > settings.streaming_chunk_threshold
+            if stored_hash == current_hash and not force:
+                if relative_path not in files_with_stats:
+                    if streaming:
+                        count = sum(
+                            1 for _ in stream_chunks(file_path, relative_path, project_name, language)
+                        )
+                        chunk_types = {"text": count} if count else {}
+                    else:
+                        chunk_types = _count_chunk_types(
+                            _chunk_file(file_path, relative_path, language, project_name)
+                        )
+                    state_db.set_file_stats(state_key, relative_path, language, size_bytes, chunk_types)
+                INDEX_FILES.labels("unchanged").inc()
                 continue
 
-            # 讀取檔案內容
-            source = Path(file_path).read_text(encoding="utf-8", errors="ignore")
+            if scope is not None and not force and scope.share(relative_path, current_hash):
+                # 其他 ref 已索引相同內容：只更新 refs，不分塊、不 embedding
+                if stored_hash is not None:
+                    scope.release(relative_path, stored_hash)
+                INDEX_FILES.labels("shared").inc()
+                continue
 
-            # 分塊
-            if supports_treesitter(language):
-                chunks = chunk_code(source, language, relative_path, project_name)
-            else:
-                chunks = split_lines(source, relative_path, project_name, language)
+            if dedup is not None:
+                _release_clusters(
+                    project_name, relative_path, dedup, qdrant, state_db, embedder, progress,
+                    files_by_path, batch,
+                )
 
-            if not chunks:
-                processed += 1
-                state_db.set_file_hash(project_name, relative_path, current_hash)
+            if streaming:
+                # 大型檔案走 mmap 串流分塊，不把整個檔案載入記憶體
+                count = _index_large_file(
+                    file_path, relative_path, language, project_name, qdrant, embedder, progress,
+                    scope, current_hash,
+                )
+                if settings.summary_vectors and count:
+                    summaries = file_head_summary(
+                        file_path, FileMeta(relative_path, project_name, language)
+                    )
+                    if scope is not None:
+                        scope.tag(summaries, relative_path, current_hash)
+                    _index_summaries(
+                        summaries,
+                        _embed(embedder, [c.content for c in summaries], progress),
+                        project_name, relative_path, qdrant, scope,
+                    )
+                if scope is not None and stored_hash not in (None, current_hash):
+                    scope.release(relative_path, stored_hash)
+                state_db.set_file_hash(state_key, relative_path, current_hash)
+                state_db.set_file_stats(
+                    state_key, relative_path, language, size_bytes,
+                    {"text": count} if count else {},
+                )
+                total_chunks += count
+                INDEX_FILES.labels("indexed").inc()
+                INDEX_CHUNKS.labels("representative").inc(count)
                 continue
 
-            # 嵌入（先完成嵌入，確認成功後才刪除舊資料）
-            texts = [c["content"] for c in chunks]
-            vectors = embedder.embed_batch(texts)
+            with index_stage("chunk"):
+                if settings.summary_vectors:
+                    chunks, summaries = _chunk_file_with_summaries(
+                        file_path, relative_path, language, project_name
+                    )
+                else:
+                    chunks = _chunk_file(file_path, relative_path, language, project_name)
+                    summaries = []
 
-            # 刪除此檔案的舊向量，再寫入新的
-            qdrant.delete_by_file(project_name, relative_path)
-            qdrant.upsert_chunks(chunks, vectors)
+            if not chunks:
+                if scope is None:
+                    qdrant.delete_by_file(project_name, relative_path)
+                elif stored_hash not in (None, current_hash):
+                    scope.release(relative_path, stored_hash)
+                state_db.set_file_hash(state_key, relative_path, current_hash)
+                state_db.set_file_stats(state_key, relative_path, language, size_bytes, {})
+                INDEX_FILES.labels("indexed").inc()
+                continue
 
-            # 更新 hash
-            state_db.set_file_hash(project_name, relative_path, current_hash)
-            total_chunks += len(chunks)
+            cluster_rows = None
+            duplicates = None
+            chunk_count = len(chunks)
+            if dedup is not None:
+                with index_stage("dedup"):
+                    chunks, cluster_rows, duplicates = _dedup_chunks(chunks, dedup, qdrant)
+            INDEX_CHUNKS.labels("representative").inc(len(chunks))
+            INDEX_CHUNKS.labels("duplicate").inc(chunk_count - len(chunks))
+            if scope is not None:
+                scope.tag(chunks + summaries, relative_path, current_hash)
+
+            # 先完成嵌入，確認成功後才刪除舊資料（摘要與 chunk 共用 embedding batch）
+            batch.append(
+                _PendingFile(
+                    relative_path, language, size_bytes, current_hash,
+                    chunks, summaries, cluster_rows, duplicates, stored_hash,
+                )
+            )
+            batch_texts += len(chunks) + len(summaries)
+            if batch_texts >= embedder.batch_capacity:
+                total_chunks += _flush_pending(
+                    batch, project_name, qdrant, state_db, embedder, dedup, progress, scope
+                )
+                batch = []
+                batch_texts = 0
 
         except Exception as e:
+            INDEX_FILES.labels("failed").inc()
+            progress.error(relative_path, str(e))
             logger.error("Error processing %s: %s", file_path, e)
 
-        processed += 1
-        if processed % 50 == 0:
-            state_db.set_index_status(
-                project_name, "running",
-                total_files=total_files,
-                processed_files=processed,
-                total_chunks=total_chunks,
-            )
+        finally:
+            processed += 1
+            progress.file_done()
+            if processed % 50 == 0:
+                state_db.set_index_status(
+                    state_key, "running",
+                    total_files=total_files,
+                    processed_files=processed,
+                    total_chunks=total_chunks,
+                )
 
-    # 刪除已不存在的檔案對應的向量
-    deleted_files = known_files - current_files
-    for deleted_path in deleted_files:
-        qdrant.delete_by_file(project_name, deleted_path)
-        state_db.remove_file(project_name, deleted_path)
-        logger.info("Removed deleted file from index: %s", deleted_path)
+    total_chunks += _flush_pending(
+        batch, project_name, qdrant, state_db, embedder, dedup, progress, scope
+    )
 
-    # 最終統計
-    stats = qdrant.get_project_stats(project_name)
+    progress.set_stage("finalize")
+
+    # 最終統計（由 file_stats 本地彙總，不再對 Qdrant 做 exact count）
+    stats = state_db.refresh_project_stats(
+        state_key,
+        path=settings.to_host_path(project_path),
+        last_index_duration=time.perf_counter() - started,
+    )
     state_db.set_index_status(
-        project_name, "completed",
+        state_key, "completed",
         total_files=total_files,
         processed_files=processed,
         total_chunks=stats["chunk_count"],
     )
     logger.info(
         "Indexing complete for '%s': %d files, %d chunks",
-        project_name, processed, stats["chunk_count"],
+        state_key, processed, stats["chunk_count"],
     )
+
+    # 調校以專案的 point 量測，ref 之間共用 point，只在一般專案執行
+    if settings.hnsw_autotune and scope is None:
+        progress.set_stage("tune")
+        try:
+            tune_hnsw_ef(qdrant, state_db, project_name)
+        except Exception as e:
+            logger.warning("HNSW auto-tuning failed for '%s': %s", project_name, e)
@@ -0,0 +1,208 @@
+"""索引任務的即時進度（行程內記憶體）。
+
+run_index 在處理過程中更新 IndexProgress；/index/{project}/events 以 SSE
+直接讀取這份狀態，不需輪詢 SQLite。每個專案只保留最近一次任務。
+任務在其他行程（index worker 或另一個 API worker）執行時，改由 StoredProgress
+讀取該行程定期寫入 index_jobs 的進度快照。
+"""
+
+import threading
+import time
+from collections import deque
+
+# 計算即時速率的時間窗（秒）
+RATE_WINDOW_S = 10.0
+MAX_ERRORS = 200
+
+
+class IndexProgress:
+    __slots__ = (
+        "project_name", "status", "stage", "started", "finished",
+        "total_files", "processed_files", "total_chunks",
+        "embedded_texts", "embed_batches", "embed_seconds",
+        "errors", "error_count", "version", "job_id", "_samples", "_lock",
+    )
+
+    def __init__(self, project_name: str, job_id: int | None = None):
+        self.project_name = project_name
+        self.job_id = job_id
+        self.status = "pending"
+        self.stage = "pending"
+        self.started = time.time()
+        self.finished: float | None = None
+        self.total_files = 0
+        self.processed_files = 0
+        self.total_chunks = 0
+        self.embedded_texts = 0
+        self.embed_batches = 0
+        self.embed_seconds = 0.0
+        # (序號, 時間, 檔案, 訊息)；序號供 SSE 只送出新錯誤
+        self.errors: deque[tuple[int, float, str | None, str]] = deque(maxlen=MAX_ERRORS)
+        self.error_count = 0
+        self.version = 0  # 每次更新遞增，SSE 據此判斷是否有新狀態
+        # (monotonic 時間, processed_files, total_chunks, embedded_texts, embed_batches)
+        self._samples: deque[tuple[float, int, int, int, int]] = deque()
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str, total_files: int | None = None):
+        with self._lock:
+            self.status = "running"
+            self.stage = stage
+            if total_files is not None:
+                self.total_files = total_files
+            self.version += 1
+
+    def file_done(self):
+        with self._lock:
+            self.processed_files += 1
+            self._sample()
+
+    def add_chunks(self, chunks: int):
+        with self._lock:
+            self.total_chunks += chunks
+            self._sample()
+
+    def embedded(self, texts: int, seconds: float):
+        with self._lock:
+            self.embedded_texts += texts
+            self.embed_batches += 1
+            self.embed_seconds += seconds
+            self._sample()
+
+    def error(self, file_path: str | None, message: str):
+        with self._lock:
+            self.error_count += 1
+            self.errors.append((self.error_count, time.time(), file_path, message))
+            self.version += 1
+
+    def finish(self, status: str, error: str | None = None):
+        if error:
+            self.error(None, error)
+        with self._lock:
+            self.status = status
+            self.stage = status
+            self.finished = time.time()
+            self.version += 1
+
+    def _sample(self):
+        now = time.monotonic()
+        self.version += 1
+        sample = (
+            now, self.processed_files, self.total_chunks, self.embedded_texts, self.embed_batches
+        )
+        # 最多每 0.5 秒記錄一筆，並丟掉時間窗外的舊樣本
+        if not self._samples or now - self._samples[-1][0] >= 0.5:
+            self._samples.append(sample)
+        while len(self._samples) > 2 and self._samples[1][0] < now - RATE_WINDOW_S:
+            self._samples.popleft()
+
+    def errors_after(self, seq: int) -> list[dict]:
+        with self._lock:
+            return [
+                {"seq": s, "time": t, "file_path": f, "message": m}
+                for s, t, f, m in self.errors
+                if s > seq
+            ]
+
+    def refresh(self):
+        """行程內的進度即時更新，不需重新載入（與 StoredProgress 介面一致）。"""
+
+    def export(self) -> dict:
+        """寫入 index_jobs 的進度快照。"""
+        return {"snapshot": self.snapshot(), "errors": self.errors_after(0)}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            current = (
+                now, self.processed_files, self.total_chunks, self.embedded_texts, self.embed_batches
+            )
+            rates = [0.0, 0.0, 0.0, 0.0]
+            if self._samples and self.finished is None:
+                oldest = self._samples[0]
+                span = now - oldest[0]
+                if span > 0:
+                    rates = [(current[i] - oldest[i]) / span for i in range(1, 5)]
+            files_per_s, chunks_per_s, texts_per_s, batches_per_s = rates
+            remaining = max(0, self.total_files - self.processed_files)
+            eta = remaining / files_per_s if files_per_s > 0 else None
+            end = self.finished or time.time()
+            return {
+                "project_name": self.project_name,
+                "status": self.status,
+                "stage": self.stage,
+                "started_at": self.started,
+                "elapsed_s": end - self.started,
+                "total_files": self.total_files,
+                "processed_files": self.processed_files,
+                "total_chunks": self.total_chunks,
+                "embedded_texts": self.embedded_texts,
+                "embed_batches": self.embed_batches,
+                "files_per_second": files_per_s,
+                "chunks_per_second": chunks_per_s,
+                "embed_texts_per_second": texts_per_s,
+                "embed_batches_per_second": batches_per_s,
+                "avg_embed_batch_ms": (
+                    self.embed_seconds / self.embed_batches * 1000 if self.embed_batches else 0.0
+                ),
+                "eta_s": 0.0 if self.finished else eta,
+                "errors": self.error_count,
+            }
+
+
+class StoredProgress:
+    """其他行程執行中任務的進度，每次 refresh 從 StateDB 的 index_jobs 重新讀取。"""
+
+    __slots__ = ("state_db", "job_id", "finished", "version", "_job")
+
+    def __init__(self, state_db, job: dict):
+        self.state_db = state_db
+        self.job_id = job["id"]
+        self.finished: float | None = None
+        self.version = 0
+        self._job = job
+        self._apply(job)
+
+    def _apply(self, job: dict):
+        if job["progress"] != self._job["progress"] or job["status"] != self._job["status"]:
+            self.version += 1
+        self._job = job
+        if job["status"] not in ("queued", "running"):
+            self.finished = time.time()
+
+    def refresh(self):
+        job = self.state_db.get_job(self.job_id)
+        if job:
+            self._apply(job)
+
+    def snapshot(self) -> dict:
+        job = self._job
+        snapshot = (job["progress"] or {}).get("snapshot") or {
+            "project_name": job["project_name"],
+            "stage": job["status"],
+        }
+        # 任務狀態以 index_jobs 為準（worker 中斷時快照會停在 running）
+        return {**snapshot, "status": job["status"], "job_id": job["id"], "worker": job["worker"]}
+
+    def errors_after(self, seq: int) -> list[dict]:
+        errors = (self._job["progress"] or {}).get("errors", [])
+        if self._job["error"] and self.finished is not None and not errors:
+            errors = [{"seq": 1, "time": None, "file_path": None, "message": self._job["error"]}]
+        return [e for e in errors if e["seq"] > seq]
+
+
+_jobs: dict[str, IndexProgress] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_job(project_name: str, job_id: int | None = None) -> IndexProgress:
+    """建立專案的新任務進度，取代上一次的紀錄。"""
+    progress = IndexProgress(project_name, job_id)
+    with _jobs_lock:
+        _jobs[project_name] = progress
+    return progress
+
+
+def get_job(project_name: str) -> IndexProgress | None:
+    with _jobs_lock:
+        return _jobs.get(project_name)
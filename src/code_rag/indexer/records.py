@@ -0,0 +1,76 @@
+"""精簡的 chunk 紀錄：同一檔案的 chunk 共用一份檔案 metadata。"""
+
+from code_rag.utils.paths import path_prefixes
+
+
+class FileMeta:
+    __slots__ = ("file_path", "project_name", "language", "path_prefixes", "file_hash", "refs")
+
+    def __init__(self, file_path: str, project_name: str, language: str):
+        self.file_path = file_path
+        self.project_name = project_name
+        self.language = language
+        # 祖先目錄清單（目錄範圍搜尋用），每個檔案只計算一次
+        self.path_prefixes = path_prefixes(file_path)
+        # ref-aware 索引：檔案版本（內容 hash）與包含此版本的 ref；一般專案為 None
+        self.file_hash: str | None = None
+        self.refs: list[str] | None = None
+
+
+class Chunk:
+    __slots__ = (
+        "file", "content", "chunk_index", "start_line", "end_line", "chunk_type", "name", "symbols",
+    )
+
+    def __init__(
+        self,
+        file: FileMeta,
+        content: str,
+        chunk_index: int,
+        start_line: int,
+        end_line: int,
+        chunk_type: str = "code",
+        name: str | None = None,
+        symbols: list[str] | None = None,
+    ):
+        self.file = file
+        self.content = content
+        self.chunk_index = chunk_index
+        self.start_line = start_line
+        self.end_line = end_line
+        self.chunk_type = chunk_type
+        self.name = name
+        # chunk 內包含的語意節點名稱（合併多個小節點時有多個）
+        self.symbols = symbols
+
+    @property
+    def file_path(self) -> str:
+        return self.file.file_path
+
+    @property
+    def project_name(self) -> str:
+        return self.file.project_name
+
+    @property
+    def language(self) -> str:
+        return self.file.language
+
+    def to_payload(self) -> dict:
+        """展開為 Qdrant payload。"""
+        payload = {
+            "content": self.content,
+            "file_path": self.file.file_path,
+            "path_prefixes": self.file.path_prefixes,
+            "project_name": self.file.project_name,
+            "language": self.file.language,
+            "chunk_index": self.chunk_index,
+            "start_line": self.start_line,
+            "end_line": self.end_line,
+            "chunk_type": self.chunk_type,
+            "name": self.name,
+            "symbols": self.symbols if self.symbols is not None else ([self.name] if self.name else []),
+        }
+        if self.file.file_hash is not None:
+            payload["file_hash"] = self.file.file_hash
+            payload["refs"] = self.file.refs
+        return payload
@@ -0,0 +1,85 @@
+"""Ref-aware 索引：同一專案的多個 branch / tag / worktree 共用內容相同的向量。
+
+每個 ref 的 file_hashes / file_stats / index_status 以 `<project>@<ref>` 記錄在 StateDB
+（見 ref_state_key），project_refs 記錄專案有哪些 ref。Qdrant 中的 point 以檔案版本
+（路徑 + 內容 hash）為單位：point ID 含版本，payload 的 refs 陣列列出包含此版本的
+所有 ref，搜尋以 refs 過濾。
+
+新增 branch 時，內容與既有 ref 相同的檔案只把 ref 加入 refs（set_payload），
+不重新分塊與 embedding；只有 diff 中的檔案會產生新的 point。某個版本不再被任何
+ref 使用時才刪除。
+"""
+
+import logging
+
+from code_rag.indexer.records import Chunk
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.state import StateDB
+
+logger = logging.getLogger(__name__)
+
+
+class RefScope:
+    """一次索引任務的目標 ref。"""
+
+    __slots__ = ("project_name", "ref", "state_key", "qdrant", "state_db")
+
+    def __init__(self, project_name: str, ref: str, qdrant: QdrantStorage, state_db: StateDB):
+        self.project_name = project_name
+        self.ref = ref
+        self.qdrant = qdrant
+        self.state_db = state_db
+        self.state_key = state_db.add_ref(project_name, ref)
+
+    def _other_refs(self, file_path: str, hash_val: str) -> dict[str, str]:
+        refs = self.state_db.get_version_refs(self.project_name, file_path, hash_val)
+        refs.pop(self.ref, None)
+        return refs
+
+    def tag(self, chunks: list[Chunk], file_path: str, hash_val: str):
+        """標記要寫入的檔案版本：point ID 含版本，refs 為已有此版本的 ref 加上此 ref。"""
+        refs = sorted({*self._other_refs(file_path, hash_val), self.ref})
+        for chunk in chunks:
+            chunk.file.file_hash = hash_val
+            chunk.file.refs = refs
+
+    def share(self, file_path: str, hash_val: str) -> bool:
+        """其他 ref 已索引相同版本時，把此 ref 加入該版本的 refs 並複製檔案狀態。
+
+        回傳 False 表示此版本尚未被索引，需要分塊與 embedding。
+        """
+        others = self._other_refs(file_path, hash_val)
+        if not others:
+            return False
+        self.qdrant.set_file_refs(self.project_name, file_path, hash_val, [*others, self.ref])
+        self.state_db.copy_file_state(next(iter(others.values())), self.state_key, file_path)
+        return True
+
+    def release(self, file_path: str, hash_val: str):
+        """此 ref 不再使用某個檔案版本：其他 ref 仍使用時只更新 refs，否則刪除 point。"""
+        others = self._other_refs(file_path, hash_val)
+        if others:
+            self.qdrant.set_file_refs(self.project_name, file_path, hash_val, list(others))
+        else:
+            self.qdrant.delete_file_version(self.project_name, file_path, hash_val)
+
+
+def delete_ref(project_name: str, ref: str, qdrant: QdrantStorage, state_db: StateDB) -> int:
+    """移除專案的一個 ref；只有此 ref 使用的檔案版本會從 Qdrant 刪除。回傳處理的檔案數。"""
+    scope = RefScope(project_name, ref, qdrant, state_db)
+    files = state_db.get_all_file_paths(scope.state_key)
+    for file_path in files:
+        hash_val = state_db.get_file_hash(scope.state_key, file_path)
+        if hash_val is not None:
+            scope.release(file_path, hash_val)
+    state_db.remove_ref(project_name, ref)
+    logger.info("Removed ref '%s' of '%s' (%d files)", ref, project_name, len(files))
+    return len(files)
+
+
+def delete_ref_project(project_name: str, qdrant: QdrantStorage, state_db: StateDB):
+    """移除 ref-aware 專案的所有 ref 與 point。"""
+    qdrant.delete_by_project(project_name)
+    for ref in state_db.get_refs(project_name):
+        state_db.remove_ref(project_name, ref)
+    state_db.remove_project(project_name)
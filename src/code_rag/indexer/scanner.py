@@ -42,13 +42,13 @@ def scan_files(project_path: Path) -> list[dict]:
         if gitignore_spec and gitignore_spec.match_file(str(rel_path)):
             continue
 
-        if should_exclude_file(item):
-            continue
-
         language = detect_language(str(item))
         if language == "unknown":
             continue
 
+        if should_exclude_file(item, language):
+            continue
+
         files.append({
             "path": str(item),
             "relative_path": str(rel_path),
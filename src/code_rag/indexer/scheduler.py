@@ -0,0 +1,189 @@
+"""Embedding 排程：搜尋查詢（interactive）優先於索引批次（bulk）。
+
+兩個優先等級共用 backend 的平行處理量（parallelism 個 slot）：
+- interactive 只要有空 slot 就執行，且有 interactive 在等待時 bulk 不會被放行；
+- bulk 的同時執行數有上限（預設保留一個 slot 給 interactive），搜尋流量高時
+  降到 embed_bulk_min_concurrency，並改送較小的批次，縮短查詢排在批次後面的時間。
+
+各等級的排隊等待時間記錄在 stats()。
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from code_rag.config import settings
+from code_rag.indexer.embedder import Embedder
+from code_rag.metrics import (
+    EMBED_BATCH_SECONDS,
+    EMBED_BATCH_SIZE,
+    EMBED_QUEUE_DEPTH,
+    EMBED_QUEUE_WAIT_SECONDS,
+)
+from code_rag.storage.recall import percentile
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class _Admission:
+    def __init__(self, slots: int, bulk_max: int, bulk_min: int, window: float, busy_qps: float):
+        self.slots = slots
+        self.bulk_max = bulk_max
+        self.bulk_min = min(bulk_min, bulk_max)
+        self.window = window
+        self.busy_qps = busy_qps
+        self._cond = threading.Condition()
+        self._inflight = {p: 0 for p in PRIORITIES}
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self._arrivals: deque[float] = deque()  # 近期 interactive 請求時間
+        self._waits = {p: deque(maxlen=1000) for p in PRIORITIES}
+        self._served = {p: 0 for p in PRIORITIES}
+
+    def _busy(self, now: float) -> bool:
+        while self._arrivals and self._arrivals[0] < now - self.window:
+            self._arrivals.popleft()
+        return len(self._arrivals) / self.window >= self.busy_qps
+
+    def bulk_cap(self, now: float) -> int:
+        return self.bulk_min if self._busy(now) else self.bulk_max
+
+    def _can_run(self, priority: str, now: float) -> bool:
+        if sum(self._inflight.values()) >= self.slots:
+            return False
+        if priority == INTERACTIVE:
+            return True
+        return self._waiting[INTERACTIVE] == 0 and self._inflight[BULK] < self.bulk_cap(now)
+
+    def acquire(self, priority: str) -> bool:
+        """取得執行 slot；回傳目前是否處於搜尋高流量狀態。"""
+        started = time.monotonic()
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._arrivals.append(started)
+            self._waiting[priority] += 1
+            EMBED_QUEUE_DEPTH.labels(priority).inc()
+            while not self._can_run(priority, time.monotonic()):
+                # bulk 需要定期重新評估（高流量時段結束後上限會回升）
+                self._cond.wait(timeout=0.05)
+            self._waiting[priority] -= 1
+            EMBED_QUEUE_DEPTH.labels(priority).dec()
+            self._inflight[priority] += 1
+            self._served[priority] += 1
+            wait = time.monotonic() - started
+            self._waits[priority].append(wait)
+            EMBED_QUEUE_WAIT_SECONDS.labels(priority).observe(wait)
+            return self._busy(time.monotonic())
+
+    def release(self, priority: str):
+        with self._cond:
+            self._inflight[priority] -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            classes = {}
+            for p in PRIORITIES:
+                waits = sorted(self._waits[p])
+                classes[p] = {
+                    "served": self._served[p],
+                    "waiting": self._waiting[p],
+                    "inflight": self._inflight[p],
+                    "wait_p50_ms": percentile(waits, 0.50) * 1000,
+                    "wait_p95_ms": percentile(waits, 0.95) * 1000,
+                    "wait_max_ms": (waits[-1] if waits else 0.0) * 1000,
+                }
+            return {
+                "slots": self.slots,
+                "bulk_cap": self.bulk_cap(now),
+                "search_busy": self._busy(now),
+                "classes": classes,
+            }
+
+
+class EmbeddingScheduler(Embedder):
+    """包裝任一 backend，依優先等級排程 embedding 請求。"""
+
+    def __init__(self, backend: Embedder):
+        self.backend = backend
+        self.name = backend.name
+        self.batch_size = backend.batch_size
+        slots = max(1, backend.parallelism)
+        # 預設保留一個 slot 給 interactive
+        bulk_max = settings.embed_bulk_max_concurrency or max(1, slots - 1)
+        self._admission = _Admission(
+            slots,
+            min(bulk_max, slots),
+            max(1, settings.embed_bulk_min_concurrency),
+            settings.embed_busy_window_s,
+            settings.embed_busy_qps,
+        )
+        self.executor = ThreadPoolExecutor(max_workers=slots, thread_name_prefix="embed-bulk")
+
+    @property
+    def parallelism(self) -> int:
+        return self.backend.parallelism
+
+    def embed_batch(self, texts: list[str], priority: str = BULK) -> np.ndarray:
+        if priority == INTERACTIVE:
+            return self._run(INTERACTIVE, self.backend.embed_batch, texts)
+
+        # bulk：每取得一個 slot 才切出下一個子批次，高流量時切小
+        futures = []
+        pos = 0
+        while pos < len(texts):
+            busy = self._admission.acquire(BULK)
+            size = settings.embed_busy_batch_size if busy else self.batch_size
+            batch = texts[pos : pos + size]
+            pos += len(batch)
+            futures.append(
+                self.executor.submit(self._call, BULK, self.backend.embed_batch, batch)
+            )
+        if not futures:
+            return self.backend.embed_batch([])
+        vectors: list[np.ndarray] = []
+        error: Exception | None = None
+        for future in futures:
+            try:
+                vectors.append(future.result())
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return np.concatenate(vectors)
+
+    def embed_single(self, text: str) -> np.ndarray:
+        return self._run(INTERACTIVE, self.backend.embed_single, text)
+
+    def _run(self, priority: str, fn, arg):
+        self._admission.acquire(priority)
+        return self._call(priority, fn, arg)
+
+    def _call(self, priority: str, fn, arg):
+        EMBED_BATCH_SIZE.labels(priority).observe(len(arg) if isinstance(arg, list) else 1)
+        try:
+            with EMBED_BATCH_SECONDS.labels(priority).time():
+                return fn(arg)
+        finally:
+            self._admission.release(priority)
+
+    def dimensions(self) -> int | None:
+        return self.backend.dimensions()
+
+    def warmup(self):
+        self.backend.warmup()
+
+    def health_check(self) -> bool:
+        return self.backend.health_check()
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(), "scheduler": self._admission.stats()}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.backend.close()
@@ -0,0 +1,67 @@
+"""大型檔案的 mmap 串流分塊。
+
+不將整個檔案讀成字串，而是透過 mmap 逐段切出 chunk，行號由 byte offset
+之間的換行數推算，記憶體用量只與單一 chunk 大小相關。
+"""
+
+import mmap
+from collections.abc import Iterator
+
+from code_rag.config import settings
+from code_rag.indexer.records import Chunk, FileMeta
+
+
+def stream_chunks(
+    file_path: str,
+    relative_path: str,
+    project_name: str,
+    language: str,
+    *,
+    chunk_type: str = "text",
+) -> Iterator[Chunk]:
+    """以 mmap 逐一產生 chunk，在行邊界切分並帶 overlap。"""
+    meta = FileMeta(relative_path, project_name, language)
+    max_bytes = settings.chunk_max_chars
+    overlap = settings.chunk_overlap_chars
+
+    with open(file_path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空檔案無法 mmap
+            return
+        with mm:
+            size = len(mm)
+            pos = 0
+            line = 1  # pos 所在的行號（1-indexed）
+            chunk_index = 0
+            prev_cut = 0
+
+            while pos < size:
+                cut = min(pos + max_bytes, size)
+                if cut < size:
+                    # 盡量在行邊界切分；單行超過上限（或只剩 overlap）時直接硬切
+                    newline = mm.rfind(b"\n", pos, cut)
+                    if newline != -1 and newline + 1 > prev_cut:
+                        cut = newline + 1
+                prev_cut = cut
+
+                data = mm[pos:cut]
+                newlines = data.count(b"\n")
+                end_line = line + newlines - (1 if data.endswith(b"\n") else 0)
+                text = data.decode("utf-8", errors="ignore").rstrip("\n")
+                if text.strip():
+                    yield Chunk(meta, text, chunk_index, line, end_line, chunk_type)
+                    chunk_index += 1
+
+                if cut >= size:
+                    break
+
+                # overlap：下一個 chunk 從 cut - overlap 之前的行首開始（必須前進）
+                next_pos = cut
+                if overlap > 0 and cut - overlap > pos:
+                    newline = mm.rfind(b"\n", pos, cut - overlap)
+                    if newline != -1 and newline + 1 > pos:
+                        next_pos = newline + 1
+                line += data.count(b"\n", 0, next_pos - pos)
+                pos = next_pos
@@ -1,28 +1,39 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from code_rag.config import settings
 from code_rag.api.router import api_router
-from code_rag.indexer.embedder import Embedder
-from code_rag.storage.qdrant import QdrantStorage
+from code_rag.metrics import mark_process_dead, metrics_registry
+from code_rag.indexer.embedder import Embedder, create_embedder, validate_dims
+from code_rag.indexer.scheduler import EmbeddingScheduler
 from code_rag.storage.state import StateDB
 
+if TYPE_CHECKING:
+    from code_rag.storage.qdrant import QdrantStorage
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
 logger = logging.getLogger(__name__)
 
-# 全域資源
-_qdrant: QdrantStorage | None = None
+# 全域資源；qdrant_client 與 tree-sitter 語法在 lifespan 才載入，讓 /health/live 盡早可用
+_qdrant: "QdrantStorage | None" = None
 _state_db: StateDB | None = None
 _embedder: Embedder | None = None
 
+# 背景啟動檢查的狀態：pending / ok / 錯誤訊息
+_readiness: dict[str, str] = {"qdrant": "pending", "embedder": "pending"}
+_startup_task: asyncio.Task | None = None
+
 
-def get_qdrant() -> QdrantStorage:
+def get_qdrant() -> "QdrantStorage":
     if _qdrant is None:
         raise RuntimeError("QdrantStorage not initialized")
     return _qdrant
@@ -40,24 +51,70 @@ def get_embedder() -> Embedder:
     return _embedder
 
 
+async def _check_qdrant():
+    """確認 collection 存在且設定一致；Qdrant 尚未啟動時定期重試。"""
+    while True:
+        try:
+            await asyncio.to_thread(_qdrant.ensure_collection)
+        except (RuntimeError, ValueError) as e:
+            # 維度不一致等設定錯誤，重試也不會成功
+            _readiness["qdrant"] = str(e)
+            logger.error("Qdrant collection check failed: %s", e)
+            return
+        except Exception as e:
+            _readiness["qdrant"] = f"unavailable: {e}"
+            logger.warning("Qdrant not ready (%s), retrying in %.0fs", e, settings.startup_retry_s)
+            await asyncio.sleep(settings.startup_retry_s)
+            continue
+        _readiness["qdrant"] = "ok"
+        logger.info("Qdrant connected: %s", settings.qdrant_url)
+        return
+
+
+async def _check_embedder():
+    try:
+        if settings.ollama_warmup:
+            await asyncio.to_thread(_embedder.warmup)
+        await asyncio.to_thread(validate_dims, _embedder)
+    except Exception as e:
+        _readiness["embedder"] = str(e)
+        logger.error("Embedder check failed: %s", e)
+        return
+    _readiness["embedder"] = "ok"
+    logger.info("Embedder initialized: %s (%s)", _embedder.name, settings.embedding_model)
+
+
+async def _startup_checks():
+    """在背景完成需要外部服務的啟動工作；完成前 /health/ready 回傳 503。"""
+    await asyncio.gather(_check_qdrant(), _check_embedder())
+    # 預先載入 tree-sitter 語法，避免第一次索引時才載入
+    from code_rag.indexer.chunker import preload_grammars
+
+    await asyncio.to_thread(preload_grammars)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _qdrant, _state_db, _embedder
+    global _qdrant, _state_db, _embedder, _startup_task
+
+    from code_rag.storage.qdrant import QdrantStorage
 
     logger.info("Starting Code RAG API...")
+    # 建構時不連線外部服務；collection 檢查與模型預熱在背景進行
     _qdrant = QdrantStorage()
-    _qdrant.ensure_collection()
-    logger.info("Qdrant connected: %s", settings.qdrant_url)
 
     _state_db = StateDB(settings.state_db_path)
     logger.info("State DB initialized: %s", settings.state_db_path)
 
-    _embedder = Embedder()
-    logger.info("Embedder initialized: %s @ %s", settings.embedding_model, settings.ollama_url)
+    # 搜尋與索引共用 backend，由排程器讓查詢優先
+    _embedder = EmbeddingScheduler(create_embedder())
+
+    _startup_task = asyncio.create_task(_startup_checks())
 
     yield
 
     logger.info("Shutting down...")
+    _startup_task.cancel()
 
     # 等待背景索引任務完成
     from code_rag.api.index import get_index_tasks
@@ -72,18 +129,48 @@ async def lifespan(app: FastAPI):
         _embedder.close()
     if _state_db:
         _state_db.close()
+    mark_process_dead()
 
 
 app = FastAPI(title="Code RAG", version="0.1.0", lifespan=lifespan)
 app.include_router(api_router)
 
+if settings.metrics_enabled:
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus 指標；設定 PROMETHEUS_MULTIPROC_DIR 時包含所有 uvicorn worker。"""
+        return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/v1/health/live")
+async def health_live():
+    """Liveness：行程可回應請求即可。"""
+    return {"status": "alive"}
+
+
+@app.get("/api/v1/health/ready")
+async def health_ready():
+    """Readiness：collection 檢查與 embedding backend 預熱完成前回傳 503。"""
+    ready = all(state == "ok" for state in _readiness.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": _readiness},
+        status_code=200 if ready else 503,
+    )
+
 
 @app.get("/api/v1/health")
 async def health():
     qdrant_ok = _qdrant.health_check() if _qdrant else False
-    ollama_ok = _embedder.health_check() if _embedder else False
-    return {
-        "status": "ok" if (qdrant_ok and ollama_ok) else "degraded",
+    embedder_ok = _embedder.health_check() if _embedder else False
+    embedder_state = "connected" if embedder_ok else "disconnected"
+    result = {
+        "status": "ok" if (qdrant_ok and embedder_ok) else "degraded",
         "qdrant": "connected" if qdrant_ok else "disconnected",
-        "ollama": "connected" if ollama_ok else "disconnected",
+        "embedder": embedder_state,
+        "embedding_backend": settings.embedding_backend,
     }
+    if settings.embedding_backend == "ollama":
+        # 舊版欄位，保留給既有的監控與 client
+        result["ollama"] = embedder_state
+    return result
@@ -0,0 +1,203 @@
+"""Prometheus 指標。
+
+所有指標都是行程內的 counter / histogram / gauge，更新成本只有一次加鎖
+與 bucket 累加，可在正式環境常駐開啟；由 /metrics 以 Prometheus 文字格式輸出。
+
+uvicorn 以多個 worker 執行時設定 PROMETHEUS_MULTIPROC_DIR（每次啟動前清空的目錄），
+prometheus_client 改以檔案記錄各行程的數值，/metrics 彙總所有行程（見 metrics_registry）。
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+
+# 索引 pipeline 各階段（scan / hash / chunk / dedup / embed / write / state）
+INDEX_STAGE_SECONDS = Histogram(
+    "code_rag_index_stage_seconds",
+    "Time spent in each run_index stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60),
+)
+INDEX_FILES = Counter(
+    "code_rag_index_files_total",
+    "Files seen by run_index by result (unchanged = incremental cache hit, shared = reused from another ref)",
+    ["result"],
+)
+INDEX_CHUNKS = Counter(
+    "code_rag_index_chunks_total",
+    "Chunks produced by run_index (duplicate = suppressed near-duplicate, promoted = duplicate embedded as a new representative)",
+    ["result"],
+)
+# gauge 在多行程模式下加總仍存活的行程
+INDEX_JOBS_RUNNING = Gauge(
+    "code_rag_index_jobs_running", "Index jobs currently running", multiprocess_mode="livesum"
+)
+
+# 搜尋各階段（embed / query / expand / duplicates）
+SEARCH_PHASE_SECONDS = Histogram(
+    "code_rag_search_phase_seconds",
+    "Time spent in each search phase",
+    ["phase"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+# Embedding
+EMBED_BATCH_SECONDS = Histogram(
+    "code_rag_embed_batch_seconds",
+    "Embedding backend call latency by priority class",
+    ["priority"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+EMBED_BATCH_SIZE = Histogram(
+    "code_rag_embed_batch_size",
+    "Texts per embedding backend call",
+    ["priority"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+EMBED_QUEUE_DEPTH = Gauge(
+    "code_rag_embed_queue_depth",
+    "Embedding requests waiting for a scheduler slot",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+EMBED_QUEUE_WAIT_SECONDS = Histogram(
+    "code_rag_embed_queue_wait_seconds",
+    "Time embedding requests wait for a scheduler slot",
+    ["priority"],
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+OLLAMA_REQUEST_SECONDS = Histogram(
+    "code_rag_ollama_request_seconds",
+    "Ollama /api/embed request latency",
+    ["endpoint"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+OLLAMA_REQUEST_ERRORS = Counter(
+    "code_rag_ollama_request_errors_total",
+    "Failed Ollama /api/embed requests",
+    ["endpoint"],
+)
+
+# Qdrant
+QDRANT_REQUEST_SECONDS = Histogram(
+    "code_rag_qdrant_request_seconds",
+    "Qdrant client call latency",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+QDRANT_REQUEST_ERRORS = Counter(
+    "code_rag_qdrant_request_errors_total",
+    "Failed Qdrant client calls",
+    ["operation"],
+)
+
+# StateDB
+STATE_DB_LOCK_WAIT_SECONDS = Histogram(
+    "code_rag_state_db_lock_wait_seconds",
+    "Time spent waiting for the StateDB connection lock",
+    buckets=(0.00001, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """/metrics 輸出的 registry：多行程模式時彙總 PROMETHEUS_MULTIPROC_DIR 中所有行程。"""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_process_dead():
+    """行程結束時移除其 livesum gauge 的數值（多行程模式）。"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def index_stage(stage: str):
+    """計時一個索引階段：with index_stage("chunk"): ..."""
+    return INDEX_STAGE_SECONDS.labels(stage).time()
+
+
+# 目前請求各搜尋階段的耗時（秒），供 Server-Timing header 使用
+_search_timings: ContextVar[dict[str, float] | None] = ContextVar("search_timings", default=None)
+
+
+@contextmanager
+def search_phase(phase: str):
+    """計時一個搜尋階段；請求有呼叫 track_search_phases 時同時記錄到該請求。"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SEARCH_PHASE_SECONDS.labels(phase).observe(elapsed)
+        timings = _search_timings.get()
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + elapsed
+
+
+def track_search_phases() -> dict[str, float]:
+    """開始記錄目前請求（context）的搜尋階段耗時。"""
+    timings: dict[str, float] = {}
+    _search_timings.set(timings)
+    return timings
+
+
+def server_timing(timings: dict[str, float]) -> str:
+    """轉成 Server-Timing header 值（毫秒）。"""
+    return ", ".join(f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in timings.items())
+
+
+class InstrumentedClient:
+    """包裝 QdrantClient，記錄每個方法呼叫的延遲與錯誤。"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def call(*args, **kwargs):
+            with _timed_qdrant(name):
+                return attr(*args, **kwargs)
+
+        return call
+
+
+@contextmanager
+def _timed_qdrant(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        QDRANT_REQUEST_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        QDRANT_REQUEST_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+class TimedLock:
+    """threading.Lock 的包裝：記錄取得鎖前的等待時間。"""
+
+    def __init__(self, lock, histogram: Histogram):
+        self._lock = lock
+        self._histogram = histogram
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self._lock.acquire()
+        self._histogram.observe(time.perf_counter() - started)
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
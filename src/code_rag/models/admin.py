@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+
+class StorageProfileRequest(BaseModel):
+    profile: str  # ram, balanced, disk
@@ -3,8 +3,15 @@ from pydantic import BaseModel
 
 class Project(BaseModel):
     name: str
+    # ref-aware 專案每個 ref 各一筆，name 為專案名稱
+    ref: str | None = None
     path: str
+    status: str | None = None
     languages: list[str] = []
+    language_chunks: dict[str, int] = {}
+    chunk_types: dict[str, int] = {}
     file_count: int = 0
     chunk_count: int = 0
+    bytes_indexed: int = 0
+    last_index_duration: float | None = None
     indexed_at: str | None = None
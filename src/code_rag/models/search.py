@@ -1,4 +1,20 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+class ChunkContext(BaseModel):
+    project_name: str
+    file_path: str
+    content: str
+    start_line: int
+    end_line: int
+    chunk_indices: list[int]
+
+
+class ChunkLocation(BaseModel):
+    file_path: str
+    chunk_index: int
+    start_line: int
+    end_line: int
 
 
 class SearchResult(BaseModel):
@@ -8,20 +24,43 @@ class SearchResult(BaseModel):
     language: str
     chunk_type: str
     name: str | None = None
+    symbols: list[str] = []
     start_line: int
     end_line: int
     score: float
+    context: ChunkContext | None = None
+    # 近似重複、未另外寫入索引的其他位置
+    duplicates: list[ChunkLocation] = []
+    # ref-aware 專案中包含此 chunk 的 ref（branch / tag）
+    refs: list[str] = []
+
+
+class FileGroup(BaseModel):
+    project_name: str
+    file_path: str
+    score: float  # 檔案內最高的 chunk 分數
+    results: list[SearchResult]
 
 
 class IndexRequest(BaseModel):
     project_name: str
     path: str
+    # ref-aware 索引：此路徑（branch 的 checkout / worktree）對應的 ref；
+    # 同一專案的各 ref 共用內容相同的 chunk 向量
+    ref: str | None = Field(None, min_length=1, max_length=200, pattern=r"^\S+$")
+    # 忽略 hash 重新索引所有檔案
+    force: bool = False
+    # 以 profiler 執行此次索引，結果可由 /admin/profiles 下載
+    profile: bool = False
 
 
 class IndexStatus(BaseModel):
     project_name: str
+    ref: str | None = None
     status: str  # pending, running, completed, failed
     total_files: int = 0
     processed_files: int = 0
     total_chunks: int = 0
     error: str | None = None
+    # profile=true 時，此次索引的 profile 檔名
+    profile: str | None = None
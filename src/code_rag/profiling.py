@@ -0,0 +1,269 @@
+"""按需 profiling：索引任務與搜尋請求（profile=true）。
+
+兩種模式（settings.profile_mode）：
+- sample：背景執行緒定期擷取 call stack，彙總成 speedscope JSON
+  （https://www.speedscope.app）。開銷與取樣間隔成正比，可用於正式環境流量；
+  等待鎖、網路的執行緒也會被取樣，能看出時間花在哪裡等待。索引任務取樣所有
+  執行緒；搜尋請求（scope="request"）只取樣此請求：event loop 正在執行此請求的
+  task 時的 loop 執行緒，以及經由 to_thread 執行此請求工作的執行緒。
+- cprofile：cProfile 確定性 profiling，輸出 pstats 檔；只涵蓋啟動它的執行緒，
+  且開銷較大。在 event loop 上啟動時會記錄期間 loop 執行的所有請求，檔名
+  以 `-eventloop` 標示。
+
+結果存於 settings.profile_dir，只保留最近 profile_max_files 個檔案。
+"""
+
+import asyncio
+import cProfile
+import contextvars
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from code_rag.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_SUFFIXES = (".speedscope.json", ".pstats")
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]+")
+# 同一時間只能有一個 cProfile 啟用
+_cprofile_lock = threading.Lock()
+# 目前請求的 profiler（scope="request"），供 to_thread 登記工作執行緒
+_request_profiler: contextvars.ContextVar["Profiler | None"] = contextvars.ContextVar(
+    "request_profiler", default=None
+)
+
+
+def profile_dir() -> Path:
+    return Path(settings.profile_dir)
+
+
+def list_profiles() -> list[dict]:
+    """列出已儲存的 profile（新到舊）。"""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    files = [p for p in directory.iterdir() if p.name.endswith(PROFILE_SUFFIXES)]
+    files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    return [
+        {
+            "name": p.name,
+            "format": "speedscope" if p.name.endswith(".speedscope.json") else "pstats",
+            "size_bytes": p.stat().st_size,
+            "created_at": p.stat().st_mtime,
+        }
+        for p in files
+    ]
+
+
+def get_profile_path(name: str) -> Path | None:
+    """依檔名取得 profile 路徑；不接受目錄跳脫。"""
+    if "/" in name or "\\" in name or not name.endswith(PROFILE_SUFFIXES):
+        return None
+    path = profile_dir() / name
+    return path if path.is_file() else None
+
+
+def _prune():
+    files = sorted(
+        (p for p in profile_dir().iterdir() if p.name.endswith(PROFILE_SUFFIXES)),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for p in files[settings.profile_max_files :]:
+        p.unlink(missing_ok=True)
+
+
+class Profiler:
+    """以 with 包住要 profiling 的區塊，結束時寫檔；檔名在 self.name。
+
+    cprofile 模式必須在要量測的執行緒中進入；已有其他 cProfile 在執行時
+    不做 profiling（name 設為 None）。scope="request" 時須在請求的 coroutine 中
+    進入，sample 模式只取樣此請求（見模組說明）。
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        label: str | None = None,
+        mode: str | None = None,
+        scope: str = "process",
+    ):
+        self.mode = mode or settings.profile_mode
+        if self.mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {self.mode!r}")
+        self.scope = scope
+        if scope == "request" and self.mode == "cprofile":
+            # cProfile 無法區分 event loop 上交錯執行的請求
+            kind = f"{kind}-eventloop"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        label = _UNSAFE_CHARS.sub("_", label or "all")
+        suffix = ".speedscope.json" if self.mode == "sample" else ".pstats"
+        self.name = f"{kind}-{label}-{stamp}-{time.monotonic_ns() % 1_000_000:06d}{suffix}"
+        self._profile: cProfile.Profile | None = None
+        self._sampler: _StackSampler | None = None
+        self._token: contextvars.Token | None = None
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            if not _cprofile_lock.acquire(blocking=False):
+                logger.warning("Another cProfile session is active; %s not profiled", self.name)
+                self.name = None
+                return self
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _StackSampler(settings.profile_sample_interval_ms / 1000)
+            if self.scope == "request":
+                self._sampler.restrict_to_task()
+                self._token = _request_profiler.set(self)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.name is None:
+            return
+        if self._token is not None:
+            _request_profiler.reset(self._token)
+        # 先停止取樣再寫檔：寫入失敗時不能留下仍在執行的 sampler 或 cProfile
+        try:
+            if self._profile is not None:
+                self._profile.disable()
+            elif self._sampler is not None:
+                self._sampler.stop()
+        finally:
+            if self._profile is not None:
+                _cprofile_lock.release()
+        directory = profile_dir()
+        path = directory / self.name
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            if self._profile is not None:
+                self._profile.dump_stats(path)
+            elif self._sampler is not None:
+                path.write_text(json.dumps(self._sampler.speedscope(self.name)))
+            _prune()
+            logger.info("Profile written: %s", path)
+        except OSError as e:
+            logger.warning("Cannot write profile %s: %s", path, e)
+
+
+async def to_thread(func, /, *args, **kwargs):
+    """asyncio.to_thread；目前請求正在 profiling 時，執行期間取樣該工作執行緒。"""
+    profiler = _request_profiler.get()
+    sampler = profiler._sampler if profiler is not None else None
+    if sampler is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def run():
+        ident = threading.get_ident()
+        sampler.threads.add(ident)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.threads.discard(ident)
+
+    return await asyncio.to_thread(run)
+
+
+class _StackSampler:
+    """定期擷取執行緒的 call stack，依 (執行緒, stack) 累加取樣時間。
+
+    相同 stack 合併成一筆，記憶體不隨執行時間成長。預設取樣所有執行緒；
+    restrict_to_task 後只取樣目前的 asyncio task 與 threads 中的執行緒。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.threads: set[int] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._frames: dict[tuple[str, str, int], int] = {}
+        self._stacks: dict[str, dict[tuple[int, ...], float]] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def restrict_to_task(self):
+        """只取樣呼叫端的 task（在 event loop 上執行時）與之後登記到 threads 的執行緒。"""
+        self.threads = set()
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在 event loop 中：取樣呼叫端的執行緒
+            self.threads.add(threading.get_ident())
+            return
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.current_task()
+
+    def _included(self, ident: int) -> bool:
+        if self.threads is None:
+            return True
+        if ident == self._loop_thread:
+            # loop 執行緒只在執行此請求的 task 時計入
+            return asyncio.current_task(self._loop) is self._task
+        return ident in self.threads
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_qualname, code.co_filename, code.co_firstlineno)
+        frame_id = self._frames.get(key)
+        if frame_id is None:
+            frame_id = self._frames[key] = len(self._frames)
+        return frame_id
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or not self._included(ident):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                thread_stacks = self._stacks.setdefault(names.get(ident, str(ident)), {})
+                key = tuple(stack)
+                thread_stacks[key] = thread_stacks.get(key, 0.0) + weight
+
+    def speedscope(self, name: str) -> dict:
+        frames = [None] * len(self._frames)
+        for (func, file, line), frame_id in self._frames.items():
+            frames[frame_id] = {"name": func, "file": file, "line": line}
+        profiles = []
+        for thread, stacks in sorted(self._stacks.items()):
+            weights = list(stacks.values())
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [list(stack) for stack in stacks],
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "code-rag",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
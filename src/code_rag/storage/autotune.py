@@ -0,0 +1,54 @@
+"""依 p95 延遲預算為專案挑選 hnsw_ef。"""
+
+import logging
+
+from code_rag.config import settings
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.recall import evaluate_recall, exact_results
+from code_rag.storage.state import StateDB
+
+logger = logging.getLogger(__name__)
+
+
+def tune_hnsw_ef(
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    project_name: str,
+    k: int = 10,
+) -> dict | None:
+    """對抽樣查詢逐一量測候選 ef 的延遲與 recall，並記錄挑選結果。
+
+    在 p95 延遲預算內取第一個達到 recall 目標的 ef；若都達不到，
+    取預算內 recall 最高者；若全部超出預算，取最小的 ef。
+    """
+    samples = qdrant.sample_vectors(settings.hnsw_autotune_sample, project_name=project_name)
+    if not samples:
+        return None
+
+    keys = [key for key, _ in samples]
+    queries = [vector for _, vector in samples]
+    truth = exact_results(qdrant, queries, k, project_name, keys)
+    measurements = []
+    for ef in sorted(settings.hnsw_ef_candidates):
+        report = evaluate_recall(
+            qdrant, queries, k, project_name, truth=truth, query_keys=keys, hnsw_ef=ef
+        )
+        measurements.append({"hnsw_ef": ef, "recall": report["recall"], "p95_ms": report["p95_ms"]})
+
+    within_budget = [m for m in measurements if m["p95_ms"] <= settings.hnsw_latency_budget_ms]
+    if not within_budget:
+        chosen = measurements[0]
+    else:
+        chosen = next(
+            (m for m in within_budget if m["recall"] >= settings.recall_target),
+            max(within_budget, key=lambda m: m["recall"]),
+        )
+
+    state_db.set_search_tuning(
+        project_name, chosen["hnsw_ef"], p95_ms=chosen["p95_ms"], recall=chosen["recall"]
+    )
+    logger.info(
+        "Tuned hnsw_ef for '%s': ef=%d recall=%.3f p95=%.1fms",
+        project_name, chosen["hnsw_ef"], chosen["recall"], chosen["p95_ms"],
+    )
+    return {**chosen, "project_name": project_name, "measurements": measurements}
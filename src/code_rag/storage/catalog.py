@@ -0,0 +1,23 @@
+"""專案統計的 reconcile：以 Qdrant facet 校正本地 project_stats。"""
+
+import logging
+
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.state import StateDB
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_project_stats(qdrant: QdrantStorage, state_db: StateDB, project_name: str) -> dict:
+    """以 Qdrant 的 facet 計數覆寫專案的 chunk 統計。"""
+    languages = qdrant.facet_counts(project_name, "language")
+    chunk_types = qdrant.facet_counts(project_name, "chunk_type")
+    chunk_count = qdrant.get_project_stats(project_name)["chunk_count"]
+    state_db.update_project_counts(project_name, chunk_count, languages, chunk_types)
+    logger.info("Reconciled stats for '%s': %d chunks", project_name, chunk_count)
+    return {
+        "project_name": project_name,
+        "chunk_count": chunk_count,
+        "languages": languages,
+        "chunk_types": chunk_types,
+    }
@@ -1,127 +1,854 @@
+import time
 import uuid
 import logging
+from collections.abc import Iterator
 
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
+    Batch,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    CollectionParamsDiff,
+    Disabled,
     Distance,
     FieldCondition,
     Filter,
+    HasIdCondition,
+    HnswConfigDiff,
+    KeywordIndexParams,
+    IsEmptyCondition,
+    KeywordIndexType,
+    MatchAny,
     MatchValue,
-    PayloadSchemaType,
-    PointStruct,
+    OptimizersConfigDiff,
+    PayloadField,
+    Prefetch,
+    QuantizationSearchParams,
+    Range,
+    Sample,
+    SampleQuery,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
     VectorParams,
+    VectorParamsDiff,
 )
 
 from code_rag.config import settings
+from code_rag.indexer.records import Chunk
+from code_rag.metrics import InstrumentedClient
+from code_rag.utils.paths import glob_regex, normalize_path, path_prefixes, split_exclude
+from code_rag.utils.vectors import as_matrix, truncate
 
 logger = logging.getLogger(__name__)
 
+QUANTIZATION_MODES = ("none", "scalar", "binary")
+
+# 儲存層級設定：向量 / HNSW / payload 是否放磁碟，以及 segment 與 mmap 門檻（KB）
+# 每個值都必須明確指定：OptimizersConfigDiff 的 None 代表「不變更」，切換層級時
+# 會留下前一個層級的設定。memmap_threshold_kb=0 關閉 mmap，default_segment_number=0
+# 由 Qdrant 依 CPU 數決定。
+STORAGE_PROFILES: dict[str, dict] = {
+    # 全部常駐 RAM：熱門專案、最低延遲
+    "ram": {
+        "vectors_on_disk": False,
+        "hnsw_on_disk": False,
+        "payload_on_disk": False,
+        "memmap_threshold_kb": 0,
+        "default_segment_number": 0,
+        "max_segment_size_kb": 200_000,
+    },
+    # 向量與 payload 走 mmap，HNSW 圖仍在 RAM
+    "balanced": {
+        "vectors_on_disk": True,
+        "hnsw_on_disk": False,
+        "payload_on_disk": True,
+        "memmap_threshold_kb": 20_000,
+        "default_segment_number": 0,
+        "max_segment_size_kb": 200_000,
+    },
+    # 幾乎全部放 NVMe：很少搜尋的封存專案
+    "disk": {
+        "vectors_on_disk": True,
+        "hnsw_on_disk": True,
+        "payload_on_disk": True,
+        "memmap_threshold_kb": 1_000,
+        "default_segment_number": 2,
+        "max_segment_size_kb": 1_000_000,
+    },
+}
+
+
+def get_storage_profile(name: str) -> dict:
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {name!r}")
+    return STORAGE_PROFILES[name]
+
+
+def _optimizers_config(profile: dict) -> OptimizersConfigDiff:
+    return OptimizersConfigDiff(
+        memmap_threshold=profile["memmap_threshold_kb"],
+        default_segment_number=profile["default_segment_number"],
+        max_segment_size=profile["max_segment_size_kb"],
+    )
+
+
+# 建立 keyword 索引的 payload 欄位
+PAYLOAD_INDEX_FIELDS = (
+    "project_name", "language", "file_path", "chunk_type", "path_prefixes", "file_hash", "refs",
+)
+
+# 兩階段搜尋模式下的 named vectors
+FAST_VECTOR = "fast"
+FULL_VECTOR = "full"
+
+
+def quantization_config(mode: str) -> ScalarQuantization | BinaryQuantization | None:
+    """依設定產生 Qdrant 量化設定。"""
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode!r}")
+    if mode == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=0.99,
+                always_ram=settings.quantization_always_ram,
+            )
+        )
+    if mode == "binary":
+        return BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=settings.quantization_always_ram)
+        )
+    return None
+
+
+def _match(key: str, value: str | list[str]) -> FieldCondition:
+    """單一值用 MatchValue，多個值用 MatchAny。"""
+    if isinstance(value, str):
+        return FieldCondition(key=key, match=MatchValue(value=value))
+    if len(value) == 1:
+        return FieldCondition(key=key, match=MatchValue(value=value[0]))
+    return FieldCondition(key=key, match=MatchAny(any=list(value)))
+
 
 class QdrantStorage:
-    def __init__(self):
-        self.client = QdrantClient(url=settings.qdrant_url)
+    def __init__(self, client: QdrantClient | None = None, location: str | None = None):
+        """預設連線到 settings.qdrant_url。
+
+        client 可傳入既有的 QdrantClient；location 可為 URL 或 ":memory:"
+        （benchmark 與離線工具使用行程內的 local mode）。
+        """
+        if client is None:
+            # 版本相容性檢查會在建構時同步連線 Qdrant，略過以免阻塞啟動
+            client = QdrantClient(
+                location=location or settings.qdrant_url, check_compatibility=False
+            )
+        self.client = InstrumentedClient(client)
         self.collection = settings.qdrant_collection
+        # exclude glob 展開用的目錄 / 檔案清單：{(collection, projects): (時間, 目錄, 檔案)}
+        self._path_cache: dict[tuple, tuple[float, list[str], list[str]]] = {}
+        # 摘要 collection 是否存在；None 表示尚未確認（見 has_summaries）
+        self._has_summaries: bool | None = None
+
+    @property
+    def summary_collection(self) -> str:
+        """檔案 / class 摘要向量（粗粒度搜尋）所在的 collection。"""
+        return f"{self.collection}_summaries"
 
     def ensure_collection(self):
         collections = [c.name for c in self.client.get_collections().collections]
-        if self.collection not in collections:
+        quantization = quantization_config(settings.quantization)
+        profile = get_storage_profile(settings.storage_profile)
+        names = [self.collection]
+        if settings.summary_vectors:
+            names.append(self.summary_collection)
+        for name in names:
+            if name not in collections and self._create_collection(name, quantization, profile):
+                continue
+            info = self.client.get_collection(name)
+            self._check_vector_dims(name, info.config.params.vectors)
+            self._sync_quantization(name, info.config.quantization_config, quantization)
+            self._sync_hnsw(name, info.config.hnsw_config)
+            self._ensure_payload_indexes(name, set(info.payload_schema or {}))
+        self._has_summaries = (
+            settings.summary_vectors or self.summary_collection in collections
+        )
+
+    def _create_collection(self, name: str, quantization, profile: dict) -> bool:
+        """建立 collection；其他執行緒或行程同時建立時回傳 False，改走既有 collection 的檢查。"""
+        try:
             self.client.create_collection(
-                collection_name=self.collection,
-                vectors_config=VectorParams(
-                    size=settings.embedding_dims,
-                    distance=Distance.COSINE,
+                collection_name=name,
+                # 啟用量化時原始向量放磁碟，只有量化向量常駐 RAM
+                vectors_config=self._vectors_config(
+                    on_disk=profile["vectors_on_disk"] or quantization is not None
+                ),
+                hnsw_config=HnswConfigDiff(
+                    m=settings.hnsw_m,
+                    ef_construct=settings.hnsw_ef_construct,
+                    on_disk=profile["hnsw_on_disk"],
                 ),
+                optimizers_config=_optimizers_config(profile),
+                on_disk_payload=profile["payload_on_disk"],
+                quantization_config=quantization,
+            )
+        except Exception:
+            if not self.client.collection_exists(name):
+                raise
+            return False
+        self._ensure_payload_indexes(name, set())
+        logger.info("Created collection '%s' with payload indexes", name)
+        return True
+
+    def _ensure_payload_indexes(self, collection: str, existing: set[str]):
+        """建立缺少的 payload 索引加速過濾與 facet（索引本身固定常駐 RAM）。"""
+        for field in PAYLOAD_INDEX_FIELDS:
+            if field in existing:
+                continue
+            self.client.create_payload_index(
+                collection_name=collection,
+                field_name=field,
+                field_schema=KeywordIndexParams(type=KeywordIndexType.KEYWORD, on_disk=False),
             )
-            # 建立 payload 索引加速過濾
-            for field, schema in [
-                ("project_name", PayloadSchemaType.KEYWORD),
-                ("language", PayloadSchemaType.KEYWORD),
-                ("file_path", PayloadSchemaType.KEYWORD),
-            ]:
-                self.client.create_payload_index(
-                    collection_name=self.collection,
-                    field_name=field,
-                    field_schema=schema,
+
+    def apply_storage_profile(self, profile_name: str, collection: str | None = None) -> dict:
+        """將既有 collection 切換到指定的儲存層級。
+
+        Qdrant 會由 optimizer 在背景重寫 segment；on_disk_payload 只影響
+        之後重建的 segment。
+        """
+        profile = get_storage_profile(profile_name)
+        collection = collection or self.collection
+        info = self.client.get_collection(collection)
+        vectors = info.config.params.vectors
+        names = [""] if isinstance(vectors, VectorParams) else list(vectors or {})
+        self.client.update_collection(
+            collection_name=collection,
+            vectors_config={
+                name: VectorParamsDiff(
+                    # 已量化或兩階段的完整向量維持在磁碟
+                    on_disk=(
+                        profile["vectors_on_disk"]
+                        or info.config.quantization_config is not None
+                        or name == FULL_VECTOR
+                    ),
+                    hnsw_config=HnswConfigDiff(on_disk=profile["hnsw_on_disk"]),
                 )
-            logger.info("Created collection '%s' with payload indexes", self.collection)
+                for name in names
+            },
+            hnsw_config=HnswConfigDiff(on_disk=profile["hnsw_on_disk"]),
+            optimizers_config=_optimizers_config(profile),
+            collection_params=CollectionParamsDiff(on_disk_payload=profile["payload_on_disk"]),
+        )
+        logger.info("Applied storage profile '%s' to collection '%s'", profile_name, collection)
+        return {"collection": collection, "profile": profile_name, **profile}
+
+    def _vectors_config(self, on_disk: bool) -> VectorParams | dict[str, VectorParams]:
+        if settings.embedding_two_stage:
+            return {
+                FAST_VECTOR: VectorParams(
+                    size=settings.stored_dims, distance=Distance.COSINE, on_disk=on_disk
+                ),
+                # 完整向量只用於重新排序，固定放磁碟
+                FULL_VECTOR: VectorParams(
+                    size=settings.embedding_dims, distance=Distance.COSINE, on_disk=True
+                ),
+            }
+        return VectorParams(size=settings.stored_dims, distance=Distance.COSINE, on_disk=on_disk)
+
+    def _check_vector_dims(self, collection: str, vectors: VectorParams | dict[str, VectorParams]):
+        """確認既有 collection 的向量維度與目前的 embedding 設定一致。"""
+        expected = self._vectors_config(on_disk=False)
+        if isinstance(expected, VectorParams):
+            expected_dims = {"": expected.size}
+        else:
+            expected_dims = {name: p.size for name, p in expected.items()}
+        if isinstance(vectors, VectorParams):
+            actual_dims = {"": vectors.size}
+        else:
+            actual_dims = {name: p.size for name, p in (vectors or {}).items()}
+        if actual_dims != expected_dims:
+            raise RuntimeError(
+                f"Collection '{collection}' has vector dims {actual_dims}, "
+                f"but settings expect {expected_dims}; use a new collection or reindex"
+            )
+
+    def _point_vectors(self, vectors) -> np.ndarray | dict[str, np.ndarray]:
+        """索引與查詢共用的向量轉換（Matryoshka 截斷 + 重新正規化），整批在 NumPy 中完成。"""
+        full = as_matrix(vectors)
+        fast = truncate(full, settings.stored_dims)
+        if settings.embedding_two_stage:
+            return {FAST_VECTOR: fast, FULL_VECTOR: full}
+        return fast
+
+    def _sync_quantization(
+        self,
+        collection: str,
+        current,
+        quantization: ScalarQuantization | BinaryQuantization | None,
+    ):
+        """既有 collection 的量化設定與組態不一致時更新。"""
+        if type(current) is type(quantization):
+            return
+        self.client.update_collection(
+            collection_name=collection,
+            quantization_config=quantization if quantization is not None else Disabled.DISABLED,
+        )
+        logger.info(
+            "Updated quantization of collection '%s' to '%s'",
+            collection, settings.quantization,
+        )
+
+    def _sync_hnsw(self, collection: str, current):
+        """既有 collection 的 HNSW 參數與組態不一致時更新（Qdrant 會在背景重建索引）。"""
+        if current.m == settings.hnsw_m and current.ef_construct == settings.hnsw_ef_construct:
+            return
+        self.client.update_collection(
+            collection_name=collection,
+            hnsw_config=HnswConfigDiff(m=settings.hnsw_m, ef_construct=settings.hnsw_ef_construct),
+        )
+        logger.info(
+            "Updated HNSW config of collection '%s': m=%d ef_construct=%d",
+            collection, settings.hnsw_m, settings.hnsw_ef_construct,
+        )
 
-    def make_point_id(self, project: str, file_path: str, chunk_index: int) -> str:
+    def _search_params(
+        self,
+        exact: bool,
+        hnsw_ef: int | None,
+        oversampling: float | None,
+        rescore: bool | None,
+    ) -> SearchParams | None:
+        if exact:
+            # 精確搜尋作為 recall 基準：略過量化，直接比對原始向量
+            return SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+        quantization = None
+        if settings.quantization != "none" or oversampling is not None or rescore is not None:
+            quantization = QuantizationSearchParams(
+                ignore=False,
+                rescore=settings.quantization_rescore if rescore is None else rescore,
+                oversampling=settings.quantization_oversampling if oversampling is None else oversampling,
+            )
+        ef = hnsw_ef or settings.hnsw_ef or None
+        if quantization is None and ef is None:
+            return None
+        return SearchParams(hnsw_ef=ef, quantization=quantization)
+
+    def make_point_id(
+        self, project: str, file_path: str, chunk_index: int, file_hash: str | None = None
+    ) -> str:
+        """確定性 point ID；ref-aware 專案另含檔案版本，同一版本在所有 ref 共用同一組 point。"""
+        if file_hash is not None:
+            file_path = f"{file_path}@{file_hash}"
         key = f"{project}:{file_path}:{chunk_index}"
         return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
 
+    def make_summary_id(
+        self, project: str, file_path: str, index: int, file_hash: str | None = None
+    ) -> str:
+        if file_hash is not None:
+            file_path = f"{file_path}@{file_hash}"
+        key = f"{project}:{file_path}:summary:{index}"
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
     def upsert_chunks(
         self,
-        chunks: list[dict],
-        vectors: list[list[float]],
+        chunks: list[Chunk],
+        vectors: np.ndarray,
     ):
-        points = []
-        for chunk, vector in zip(chunks, vectors):
-            point_id = self.make_point_id(
-                chunk["project_name"], chunk["file_path"], chunk["chunk_index"]
-            )
-            points.append(
-                PointStruct(
-                    id=point_id,
-                    vector=vector,
-                    payload=chunk,
-                )
+        ids = [
+            self.make_point_id(chunk.project_name, chunk.file_path, chunk.chunk_index, chunk.file.file_hash)
+            for chunk in chunks
+        ]
+        self._upsert(self.collection, ids, chunks, vectors)
+
+    def upsert_summaries(
+        self,
+        summaries: list[Chunk],
+        vectors: np.ndarray,
+    ):
+        """寫入檔案 / class 摘要向量。"""
+        ids = [
+            self.make_summary_id(s.project_name, s.file_path, s.chunk_index, s.file.file_hash)
+            for s in summaries
+        ]
+        self._upsert(self.summary_collection, ids, summaries, vectors)
+        self._has_summaries = True
+
+    def _upsert(
+        self,
+        collection: str,
+        ids: list[str],
+        chunks: list[Chunk],
+        vectors: np.ndarray,
+    ):
+        """以欄位式 Batch 寫入：向量矩陣每批只在送出前做一次 tolist()，不逐點建立 PointStruct。"""
+        if not ids:
+            return
+        point_vectors = self._point_vectors(vectors)
+        # 分批 upsert，每批 100 個
+        batch_size = 100
+        for i in range(0, len(ids), batch_size):
+            if isinstance(point_vectors, dict):
+                batch_vectors = {
+                    name: matrix[i : i + batch_size].tolist()
+                    for name, matrix in point_vectors.items()
+                }
+            else:
+                batch_vectors = point_vectors[i : i + batch_size].tolist()
+            self.client.upsert(
+                collection_name=collection,
+                points=Batch(
+                    ids=ids[i : i + batch_size],
+                    vectors=batch_vectors,
+                    payloads=[c.to_payload() for c in chunks[i : i + batch_size]],
+                ),
             )
-        if points:
-            # 分批 upsert，每批 100 個
-            batch_size = 100
-            for i in range(0, len(points), batch_size):
-                self.client.upsert(
-                    collection_name=self.collection,
-                    points=points[i : i + batch_size],
-                )
 
-    def search(
+    def _build_filter(
         self,
-        query_vector: list[float],
-        limit: int = 10,
-        project_name: str | None = None,
-        language: str | None = None,
-    ) -> list[dict]:
+        project_name: str | list[str] | None,
+        language: str | list[str] | None,
+        files: list[tuple[str, str]] | None = None,
+        path_prefix: list[str] | None = None,
+        exclude: list[str] | None = None,
+        collection: str | None = None,
+        ref: list[str] | None = None,
+        ids: list[str] | None = None,
+    ) -> Filter | None:
+        """組合搜尋條件；所有條件都走 payload 索引，在 Qdrant 的 filtered HNSW 內評估。
+
+        project_name / language 可為多個值（MatchAny）。path_prefix 限定在任一目錄
+        （或檔案）之下；exclude 為 glob 清單，轉成 must_not 條件；ref 限定在
+        ref-aware 專案的任一 ref（branch / tag）內；ids 限定在指定的 point 內。
+        """
         conditions = []
+        if ids is not None:
+            conditions.append(HasIdCondition(has_id=ids))
         if project_name:
-            conditions.append(
-                FieldCondition(
-                    key="project_name", match=MatchValue(value=project_name)
+            conditions.append(_match("project_name", project_name))
+        if ref:
+            conditions.append(_match("refs", ref))
+        if language:
+            conditions.append(_match("language", language))
+        if path_prefix:
+            paths = sorted({normalize_path(p) for p in path_prefix} - {""})
+            if paths:
+                # 目錄以 path_prefixes 比對，也允許直接指定檔案
+                conditions.append(Filter(should=[
+                    FieldCondition(key="path_prefixes", match=MatchAny(any=paths)),
+                    FieldCondition(key="file_path", match=MatchAny(any=paths)),
+                ]))
+        must_not = self._exclude_conditions(
+            exclude or [], project_name, collection or self.collection
+        )
+        should = None
+        if files is not None:
+            # 限定在 (project_name, file_path) 清單內
+            should = [
+                Filter(must=[
+                    FieldCondition(key="project_name", match=MatchValue(value=project)),
+                    FieldCondition(key="file_path", match=MatchValue(value=path)),
+                ])
+                for project, path in files
+            ]
+        if not conditions and not should and not must_not:
+            return None
+        return Filter(must=conditions or None, should=should, must_not=must_not or None)
+
+    def _exclude_conditions(
+        self,
+        patterns: list[str],
+        project_name: str | list[str] | None,
+        collection: str,
+    ) -> list[FieldCondition]:
+        """exclude glob → must_not 條件。
+
+        `dir/**` 與一般檔案路徑直接對應 path_prefixes / file_path；含萬用字元的
+        glob 先對專案的目錄與檔案清單（facet，快取 path_glob_cache_s 秒）展開成 MatchAny。
+        """
+        dirs: set[str] = set()
+        files: set[str] = set()
+        dir_globs: list[str] = []
+        file_globs: list[str] = []
+        for pattern in patterns:
+            kind, value = split_exclude(pattern)
+            if not value:
+                continue
+            if kind == "dir":
+                dirs.add(value)
+            elif kind == "file":
+                files.add(value)
+            elif kind == "dir_glob":
+                dir_globs.append(value)
+            elif kind == "file_glob":
+                file_globs.append(value)
+        if dir_globs or file_globs:
+            known_dirs, known_files = self._known_paths(collection, project_name)
+            for pattern in dir_globs:
+                regex = glob_regex(pattern)
+                dirs.update(d for d in known_dirs if regex.match(d))
+            for pattern in file_globs:
+                regex = glob_regex(pattern)
+                files.update(f for f in known_files if regex.match(f))
+        conditions = []
+        if dirs:
+            conditions.append(FieldCondition(key="path_prefixes", match=MatchAny(any=sorted(dirs))))
+        if files:
+            conditions.append(FieldCondition(key="file_path", match=MatchAny(any=sorted(files))))
+        return conditions
+
+    def _known_paths(
+        self, collection: str, project_name: str | list[str] | None
+    ) -> tuple[list[str], list[str]]:
+        """專案內所有目錄與檔案路徑（由 payload 索引的 facet 取得）。"""
+        projects = tuple(sorted([project_name] if isinstance(project_name, str) else project_name or []))
+        key = (collection, projects)
+        cached = self._path_cache.get(key)
+        if cached and time.monotonic() - cached[0] < settings.path_glob_cache_s:
+            return cached[1], cached[2]
+        facet_filter = Filter(must=[_match("project_name", list(projects))]) if projects else None
+        values = []
+        for field in ("path_prefixes", "file_path"):
+            result = self.client.facet(
+                collection_name=collection,
+                key=field,
+                facet_filter=facet_filter,
+                limit=settings.path_glob_max_values,
+                exact=False,
+            )
+            if len(result.hits) >= settings.path_glob_max_values:
+                logger.warning(
+                    "More than %d distinct %s values; exclude globs may miss some",
+                    settings.path_glob_max_values, field,
+                )
+            values.append([str(hit.value) for hit in result.hits])
+        self._path_cache[key] = (time.monotonic(), values[0], values[1])
+        return values[0], values[1]
+
+    def backfill_path_prefixes(self, project_name: str | None = None) -> int:
+        """為升級前寫入、缺少 path_prefixes 的 point 補上欄位（不需重新 embedding）。
+
+        回傳更新的 point 數；根目錄的檔案本來就是空清單，也會被計入。
+        """
+        updated = 0
+        collections = [self.collection]
+        if self.has_summaries():
+            collections.append(self.summary_collection)
+        for collection in collections:
+            must = [IsEmptyCondition(is_empty=PayloadField(key="path_prefixes"))]
+            if project_name:
+                must.append(_match("project_name", project_name))
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=collection,
+                    scroll_filter=Filter(must=must),
+                    limit=1000,
+                    offset=offset,
+                    with_payload=["file_path"],
+                    with_vectors=False,
                 )
+                by_file: dict[str, list] = {}
+                for point in points:
+                    by_file.setdefault(point.payload["file_path"], []).append(point.id)
+                for file_path, ids in by_file.items():
+                    self.client.set_payload(
+                        collection_name=collection,
+                        payload={"path_prefixes": path_prefixes(file_path)},
+                        points=ids,
+                    )
+                    updated += len(ids)
+                if offset is None:
+                    break
+        self._path_cache.clear()
+        return updated
+
+    def _query(
+        self,
+        collection: str,
+        query_vector: np.ndarray | list[float],
+        query_filter: Filter | None,
+        limit: int,
+        search_params: SearchParams | None,
+        exact: bool,
+    ) -> list[dict]:
+        full = as_matrix(query_vector)
+        if not settings.embedding_two_stage:
+            results = self.client.query_points(
+                collection_name=collection,
+                query=truncate(full, settings.stored_dims).tolist(),
+                query_filter=query_filter,
+                limit=limit,
+                search_params=search_params,
             )
-        if language:
-            conditions.append(
-                FieldCondition(key="language", match=MatchValue(value=language))
+        elif exact:
+            results = self.client.query_points(
+                collection_name=collection,
+                query=full.tolist(),
+                using=FULL_VECTOR,
+                query_filter=query_filter,
+                limit=limit,
+                search_params=search_params,
+            )
+        else:
+            # 先以截斷向量取候選，再以完整向量重新排序
+            results = self.client.query_points(
+                collection_name=collection,
+                prefetch=Prefetch(
+                    query=truncate(full, settings.stored_dims).tolist(),
+                    using=FAST_VECTOR,
+                    filter=query_filter,
+                    limit=limit * settings.two_stage_oversampling,
+                    params=search_params,
+                ),
+                query=full.tolist(),
+                using=FULL_VECTOR,
+                query_filter=query_filter,
+                limit=limit,
             )
+        return [
+            {**point.payload, "score": point.score}
+            for point in results.points
+        ]
 
-        query_filter = Filter(must=conditions) if conditions else None
+    def search(
+        self,
+        query_vector: np.ndarray | list[float],
+        limit: int = 10,
+        project_name: str | list[str] | None = None,
+        language: str | list[str] | None = None,
+        *,
+        files: list[tuple[str, str]] | None = None,
+        path_prefix: list[str] | None = None,
+        exclude: list[str] | None = None,
+        ref: list[str] | None = None,
+        ids: list[str] | None = None,
+        exact: bool = False,
+        hnsw_ef: int | None = None,
+        oversampling: float | None = None,
+        rescore: bool | None = None,
+    ) -> list[dict]:
+        return self._query(
+            self.collection,
+            query_vector,
+            self._build_filter(project_name, language, files, path_prefix, exclude, ref=ref, ids=ids),
+            limit,
+            self._search_params(exact, hnsw_ef, oversampling, rescore),
+            exact,
+        )
+
+    def search_files(
+        self,
+        query_vector: np.ndarray | list[float],
+        limit: int = 10,
+        project_name: str | list[str] | None = None,
+        language: str | list[str] | None = None,
+        *,
+        path_prefix: list[str] | None = None,
+        exclude: list[str] | None = None,
+        ref: list[str] | None = None,
+        exact: bool = False,
+        hnsw_ef: int | None = None,
+        oversampling: float | None = None,
+        rescore: bool | None = None,
+    ) -> list[dict]:
+        """以摘要向量找出最相關的檔案，每個檔案只保留分數最高的摘要。"""
+        # class 摘要也會指向檔案，多取一些再去重
+        hits = self._query(
+            self.summary_collection,
+            query_vector,
+            self._build_filter(
+                project_name, language, path_prefix=path_prefix, exclude=exclude,
+                collection=self.summary_collection, ref=ref,
+            ),
+            limit * 3,
+            self._search_params(exact, hnsw_ef, oversampling, rescore),
+            exact,
+        )
+        files: dict[tuple[str, str], dict] = {}
+        for hit in hits:
+            files.setdefault((hit["project_name"], hit["file_path"]), hit)
+            if len(files) >= limit:
+                break
+        return list(files.values())
 
-        results = self.client.query_points(
+    def search_hierarchical(
+        self,
+        query_vector: np.ndarray | list[float],
+        limit: int = 10,
+        project_name: str | list[str] | None = None,
+        language: str | list[str] | None = None,
+        *,
+        top_files: int = 20,
+        **search_kwargs,
+    ) -> list[dict]:
+        """先以摘要向量找出 top 檔案，再只在這些檔案內搜尋細粒度 chunk。
+
+        search_kwargs 同 search（path_prefix、exclude、ref、exact、hnsw_ef、oversampling、
+        rescore），兩個階段共用。
+        """
+        summaries = self.search_files(
+            query_vector, top_files, project_name, language, **search_kwargs
+        )
+        if not summaries:
+            return []
+        files = [(s["project_name"], s["file_path"]) for s in summaries]
+        return self.search(
+            query_vector, limit, project_name, language, files=files, **search_kwargs
+        )
+
+    def get_neighbor_chunks(
+        self,
+        hits: list[dict],
+        radius: int,
+    ) -> list[list[dict]]:
+        """以確定性 point ID 一次 retrieve 每個命中 chunk 前後 radius 個 chunk。
+
+        回傳與 hits 對應的清單，每項依 chunk_index 排序並包含命中的 chunk 本身。
+        """
+        wanted: list[list[str]] = []
+        for hit in hits:
+            start = max(0, hit["chunk_index"] - radius)
+            wanted.append([
+                self.make_point_id(hit["project_name"], hit["file_path"], i, hit.get("file_hash"))
+                for i in range(start, hit["chunk_index"] + radius + 1)
+            ])
+
+        ids = list({pid for group in wanted for pid in group})
+        if not ids:
+            return [[] for _ in hits]
+        points = self.client.retrieve(
             collection_name=self.collection,
-            query=query_vector,
-            query_filter=query_filter,
-            limit=limit,
+            ids=ids,
+            with_payload=True,
+            with_vectors=False,
         )
+        by_id = {str(p.id): p.payload for p in points}
         return [
-            {**point.payload, "score": point.score}
-            for point in results.points
+            sorted(
+                (by_id[pid] for pid in group if pid in by_id),
+                key=lambda c: c["chunk_index"],
+            )
+            for group in wanted
         ]
 
-    def delete_by_file(self, project_name: str, file_path: str):
+    def delete_by_file(
+        self,
+        project_name: str,
+        file_path: str,
+        from_chunk_index: int | None = None,
+    ):
+        """刪除檔案的 chunk；指定 from_chunk_index 時只刪除該索引之後的 chunk。"""
+        conditions = [
+            FieldCondition(
+                key="project_name", match=MatchValue(value=project_name)
+            ),
+            FieldCondition(
+                key="file_path", match=MatchValue(value=file_path)
+            ),
+        ]
+        if from_chunk_index is not None:
+            conditions.append(
+                FieldCondition(key="chunk_index", range=Range(gte=from_chunk_index))
+            )
         self.client.delete(
             collection_name=self.collection,
-            points_selector=Filter(
-                must=[
-                    FieldCondition(
-                        key="project_name", match=MatchValue(value=project_name)
-                    ),
-                    FieldCondition(
-                        key="file_path", match=MatchValue(value=file_path)
-                    ),
-                ]
-            ),
+            points_selector=Filter(must=conditions),
+        )
+        if from_chunk_index is None:
+            self.delete_summaries(project_name, file_path)
+
+    def _file_version_filter(self, project_name: str, file_path: str, file_hash: str) -> Filter:
+        return Filter(must=[
+            FieldCondition(key="project_name", match=MatchValue(value=project_name)),
+            FieldCondition(key="file_path", match=MatchValue(value=file_path)),
+            FieldCondition(key="file_hash", match=MatchValue(value=file_hash)),
+        ])
+
+    def _version_collections(self) -> list[str]:
+        collections = [self.collection]
+        if self.has_summaries():
+            collections.append(self.summary_collection)
+        return collections
+
+    def set_file_refs(self, project_name: str, file_path: str, file_hash: str, refs: list[str]):
+        """更新 ref-aware 專案中某個檔案版本（chunk 與摘要）所屬的 ref，不重新 embedding。"""
+        for collection in self._version_collections():
+            self.client.set_payload(
+                collection_name=collection,
+                payload={"refs": sorted(refs)},
+                points=self._file_version_filter(project_name, file_path, file_hash),
+            )
+
+    def delete_file_version(self, project_name: str, file_path: str, file_hash: str):
+        """刪除 ref-aware 專案中已沒有任何 ref 使用的檔案版本。"""
+        for collection in self._version_collections():
+            self.client.delete(
+                collection_name=collection,
+                points_selector=self._file_version_filter(project_name, file_path, file_hash),
+            )
+
+    def delete_summaries(self, project_name: str, file_path: str | None = None):
+        """刪除檔案（或整個專案）的摘要向量。"""
+        if not self.has_summaries():
+            return
+        conditions = [
+            FieldCondition(key="project_name", match=MatchValue(value=project_name))
+        ]
+        if file_path is not None:
+            conditions.append(
+                FieldCondition(key="file_path", match=MatchValue(value=file_path))
+            )
+        self.client.delete(
+            collection_name=self.summary_collection,
+            points_selector=Filter(must=conditions),
         )
 
+    def has_summaries(self) -> bool:
+        """摘要 collection 是否存在；結果快取在實例上，避免每次刪除都查詢 Qdrant。"""
+        if settings.summary_vectors:
+            return True
+        if self._has_summaries is None:
+            self._has_summaries = self.client.collection_exists(self.summary_collection)
+        return self._has_summaries
+
+    def scroll_project(
+        self, collection: str, project_name: str, batch_size: int = 256
+    ) -> Iterator[list]:
+        """逐批讀出專案的 point（含向量與 payload），供 snapshot 匯出。"""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection,
+                scroll_filter=Filter(must=[_match("project_name", project_name)]),
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                yield points
+            if offset is None:
+                return
+
+    def upsert_raw(
+        self,
+        collection: str,
+        ids: list[str],
+        vectors: list[list[float]] | dict[str, list[list[float]]],
+        payloads: list[dict],
+    ):
+        """直接寫入已處理好的向量與 payload（snapshot 匯入，不經過截斷 / 正規化）。"""
+        self.client.upsert(
+            collection_name=collection,
+            points=Batch(ids=ids, vectors=vectors, payloads=payloads),
+        )
+        if collection == self.summary_collection:
+            self._has_summaries = True
+
     def delete_by_project(self, project_name: str):
         self.client.delete(
             collection_name=self.collection,
@@ -133,6 +860,9 @@ class QdrantStorage:
                 ]
             ),
         )
+        self.delete_summaries(project_name)
+        # 專案整個移除後重新確認（collection 可能已在外部刪除）
+        self._has_summaries = None
 
     def get_project_stats(self, project_name: str) -> dict:
         result = self.client.count(
@@ -148,6 +878,48 @@ class QdrantStorage:
         )
         return {"chunk_count": result.count}
 
+    def sample_vectors(
+        self, sample_size: int, project_name: str | None = None
+    ) -> list[tuple[tuple, list[float]]]:
+        """隨機抽取已儲存的向量作為 recall 評估的查詢樣本。
+
+        回傳 (point 的 (project_name, file_path, chunk_index), 向量)；評估時以此
+        排除查詢自己的 point，否則每個查詢都會找到自己而高估 recall。
+        """
+        query_filter = None
+        if project_name:
+            query_filter = Filter(
+                must=[FieldCondition(key="project_name", match=MatchValue(value=project_name))]
+            )
+        points = self.client.query_points(
+            collection_name=self.collection,
+            query=SampleQuery(sample=Sample.RANDOM),
+            query_filter=query_filter,
+            limit=sample_size,
+            with_payload=["project_name", "file_path", "chunk_index"],
+            with_vectors=[FULL_VECTOR] if settings.embedding_two_stage else True,
+        ).points
+        samples = []
+        for p in points:
+            vector = p.vector[FULL_VECTOR] if settings.embedding_two_stage else p.vector
+            if vector:
+                key = (p.payload["project_name"], p.payload["file_path"], p.payload["chunk_index"])
+                samples.append((key, vector))
+        return samples
+
+    def facet_counts(self, project_name: str, key: str, limit: int = 1000) -> dict[str, int]:
+        """以 Qdrant facet API 統計專案內某 payload 欄位各值的 chunk 數。"""
+        result = self.client.facet(
+            collection_name=self.collection,
+            key=key,
+            facet_filter=Filter(
+                must=[FieldCondition(key="project_name", match=MatchValue(value=project_name))]
+            ),
+            limit=limit,
+            exact=True,
+        )
+        return {str(hit.value): hit.count for hit in result.hits}
+
     def health_check(self) -> bool:
         try:
             self.client.get_collections()
@@ -0,0 +1,95 @@
+"""近似搜尋 vs 精確搜尋的 recall 評估。"""
+
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # percentile 也供 scheduler 使用，不在 import 時載入 qdrant_client
+    from code_rag.storage.qdrant import QdrantStorage
+
+
+def _result_key(result: dict) -> tuple:
+    return (result["project_name"], result["file_path"], result["chunk_index"])
+
+
+def recall_at_k(approx: list[dict], exact: list[dict], k: int) -> float:
+    """計算單一查詢的 recall@k（以精確搜尋結果為基準）。"""
+    truth = {_result_key(r) for r in exact[:k]}
+    if not truth:
+        return 1.0
+    found = {_result_key(r) for r in approx[:k]}
+    return len(truth & found) / len(truth)
+
+
+def _search(
+    qdrant: "QdrantStorage",
+    vector: list[float],
+    k: int,
+    project_name: str | None,
+    key: tuple | None,
+    **search_kwargs,
+) -> list[dict]:
+    """搜尋 top-k；key 為查詢向量本身的 point 時多取一筆並排除它。"""
+    if key is None:
+        return qdrant.search(vector, limit=k, project_name=project_name, **search_kwargs)
+    results = qdrant.search(vector, limit=k + 1, project_name=project_name, **search_kwargs)
+    return [r for r in results if _result_key(r) != key][:k]
+
+
+def exact_results(
+    qdrant: "QdrantStorage",
+    queries: list[list[float]],
+    k: int = 10,
+    project_name: str | None = None,
+    query_keys: list[tuple] | None = None,
+) -> list[list[dict]]:
+    """以 exact 搜尋取得 recall 基準結果；query_keys 見 evaluate_recall。"""
+    keys = query_keys or [None] * len(queries)
+    return [
+        _search(qdrant, vector, k, project_name, key, exact=True)
+        for vector, key in zip(queries, keys)
+    ]
+
+
+def evaluate_recall(
+    qdrant: "QdrantStorage",
+    queries: list[list[float]],
+    k: int = 10,
+    project_name: str | None = None,
+    truth: list[list[dict]] | None = None,
+    query_keys: list[tuple] | None = None,
+    **search_kwargs,
+) -> dict:
+    """以一組查詢向量比較近似搜尋與 exact 搜尋，回傳平均 recall 與延遲。
+
+    truth 可傳入 exact_results 的結果重複使用；query_keys 為各查詢向量所屬的 point
+    （sample_vectors 的結果），兩種搜尋都排除它；search_kwargs 直接傳給
+    QdrantStorage.search（例如 hnsw_ef、oversampling、rescore）。
+    """
+    keys = query_keys or [None] * len(queries)
+    if truth is None:
+        truth = exact_results(qdrant, queries, k, project_name, query_keys)
+    recalls: list[float] = []
+    latencies: list[float] = []
+    for vector, key, exact in zip(queries, keys, truth):
+        start = time.perf_counter()
+        approx = _search(qdrant, vector, k, project_name, key, **search_kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k(approx, exact, k))
+
+    latencies.sort()
+    return {
+        "queries": len(queries),
+        "k": k,
+        "recall": sum(recalls) / len(recalls) if recalls else 0.0,
+        "min_recall": min(recalls) if recalls else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,412 @@
+"""專案 snapshot：匯出 / 匯入向量、payload 與增量索引狀態。
+
+格式為 gzip 壓縮的 JSONL，可邊產生邊傳送、邊讀邊寫入：
+- header：格式版本、embedding 模型與向量維度（匯入端必須相同）
+- row：StateDB 的 file_hashes / file_stats / chunk_clusters / project_stats
+- point：chunk 或摘要的 payload 與向量（float32 little-endian，base64）
+- end：各類紀錄數，用於偵測截斷的檔案
+
+匯入後 file_hashes 與專案檔案一致，下一次 POST /index 只處理有變更的檔案，
+不需要重新 embedding 整個專案。point ID 依目標專案名稱重新計算，可改名匯入。
+
+用法：
+    python -m code_rag.storage.snapshot export my-project -o my-project.jsonl.gz
+    python -m code_rag.storage.snapshot import my-project.jsonl.gz --path /data/projects/my-project
+"""
+
+import argparse
+import base64
+import gzip
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import BinaryIO
+
+import numpy as np
+import orjson
+
+from code_rag.config import settings
+from code_rag.storage.qdrant import FAST_VECTOR, FULL_VECTOR, QdrantStorage
+from code_rag.storage.state import SNAPSHOT_TABLES, StateDB
+from code_rag.utils.paths import path_prefixes
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "code-rag-snapshot"
+VERSION = 1
+BATCH_SIZE = 256
+
+
+class SnapshotError(ValueError):
+    """snapshot 格式錯誤、已截斷，或與目前部署的向量設定不相容。"""
+
+
+def _encode(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _decode(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+def _vector_layout() -> dict:
+    return {
+        "embedding_model": settings.embedding_model,
+        "embedding_dims": settings.embedding_dims,
+        "stored_dims": settings.stored_dims,
+        "named_vectors": settings.embedding_two_stage,
+    }
+
+
+def begin_job(state_db: StateDB, project_name: str, kind: str) -> int:
+    """把匯入 / 匯出登記為 index_jobs 中執行中的任務。
+
+    與 POST /index 共用 create_job 的 BEGIN IMMEDIATE 檢查：專案有其他任務時
+    raise RuntimeError，登記後其他行程也無法開始索引此專案。
+    """
+    job_id = state_db.create_job(
+        project_name, "", worker=f"{kind}:{socket.gethostname()}:{os.getpid()}", kind=kind
+    )
+    if job_id is None:
+        raise RuntimeError(f"Project '{project_name}' is currently being indexed")
+    return job_id
+
+
+@contextmanager
+def _running(state_db: StateDB, job_id: int):
+    """執行期間定期更新任務心跳（避免長時間匯入被判定逾時），結束時記錄結果。"""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(settings.job_heartbeat_s):
+            try:
+                state_db.heartbeat_job(job_id)
+            except Exception as e:
+                logger.warning("Heartbeat failed for job %d: %s", job_id, e)
+
+    thread = threading.Thread(target=beat, name=f"snapshot-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    status, error = "completed", None
+    try:
+        yield
+    except BaseException as e:
+        # GeneratorExit：客戶端中斷下載
+        status, error = "failed", str(e) or type(e).__name__
+        raise
+    finally:
+        stop.set()
+        thread.join()
+        state_db.finish_job(job_id, status, error)
+
+
+def export_project(
+    qdrant: QdrantStorage, state_db: StateDB, project_name: str, job_id: int | None = None
+) -> Iterator[bytes]:
+    """逐段產生 gzip 壓縮的 snapshot（可直接作為 HTTP streaming body 或寫檔）。
+
+    job_id 為呼叫端先以 begin_job 登記的任務（HTTP 需在回應開始前檢查），
+    未指定時在開始產生時登記。
+    """
+    if job_id is None:
+        job_id = begin_job(state_db, project_name, "export")
+    with _running(state_db, job_id):
+        yield from _export(qdrant, state_db, project_name)
+
+
+def _export(qdrant: QdrantStorage, state_db: StateDB, project_name: str) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+
+    def emit(records: list[dict]) -> bytes:
+        return compressor.compress(b"".join(orjson.dumps(r) + b"\n" for r in records))
+
+    yield emit([{
+        "type": "header",
+        "format": FORMAT,
+        "version": VERSION,
+        "project_name": project_name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        **_vector_layout(),
+    }])
+
+    rows = 0
+    for table in SNAPSHOT_TABLES:
+        batch = []
+        for row in state_db.iter_project_rows(table, project_name):
+            batch.append({"type": "row", "table": table, "row": row})
+            if len(batch) >= BATCH_SIZE:
+                rows += len(batch)
+                yield emit(batch)
+                batch = []
+        rows += len(batch)
+        yield emit(batch)
+
+    points = 0
+    chunks = 0
+    collections = [("chunks", qdrant.collection)]
+    if qdrant.has_summaries():
+        collections.append(("summaries", qdrant.summary_collection))
+    for kind, collection in collections:
+        for batch in qdrant.scroll_project(collection, project_name, BATCH_SIZE):
+            records = []
+            for point in batch:
+                vector = point.vector
+                if isinstance(vector, dict):
+                    vector = {name: _encode(v) for name, v in vector.items()}
+                else:
+                    vector = _encode(vector)
+                records.append({"type": "point", "kind": kind, "vector": vector, "payload": point.payload})
+            points += len(records)
+            if kind == "chunks":
+                chunks += len(records)
+            yield emit(records)
+
+    end = {"type": "end", "rows": rows, "points": points, "chunks": chunks}
+    yield emit([end]) + compressor.flush()
+
+
+def _check_header(header: dict | None):
+    if not header or header.get("type") != "header" or header.get("format") != FORMAT:
+        raise SnapshotError("Not a code-rag snapshot")
+    if header.get("version") != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {header.get('version')}")
+    layout = _vector_layout()
+    mismatched = [
+        f"{key}: snapshot={header.get(key)!r}, current={value!r}"
+        for key, value in layout.items()
+        if header.get(key) != value
+    ]
+    if mismatched:
+        raise SnapshotError("Snapshot vectors are incompatible: " + "; ".join(mismatched))
+
+
+class _Loader:
+    """累積 point 並分批寫入 Qdrant。"""
+
+    __slots__ = ("qdrant", "project_name", "kind", "collection", "ids", "vectors", "payloads", "count")
+
+    def __init__(self, qdrant: QdrantStorage, project_name: str, kind: str):
+        self.qdrant = qdrant
+        self.project_name = project_name
+        self.kind = kind
+        self.collection = qdrant.summary_collection if kind == "summaries" else qdrant.collection
+        self.ids: list[str] = []
+        self.vectors: list = []
+        self.payloads: list[dict] = []
+        self.count = 0
+
+    def add(self, vector, payload: dict):
+        payload["project_name"] = self.project_name
+        if "path_prefixes" not in payload:
+            payload["path_prefixes"] = path_prefixes(payload["file_path"])
+        make_id = self.qdrant.make_summary_id if self.kind == "summaries" else self.qdrant.make_point_id
+        self.ids.append(make_id(self.project_name, payload["file_path"], payload["chunk_index"]))
+        self.vectors.append(vector)
+        self.payloads.append(payload)
+        if len(self.ids) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.ids:
+            return
+        if isinstance(self.vectors[0], dict):
+            vectors = {
+                name: np.stack([_decode(v[name]) for v in self.vectors]).tolist()
+                for name in (FAST_VECTOR, FULL_VECTOR)
+            }
+        else:
+            vectors = np.stack([_decode(v) for v in self.vectors]).tolist()
+        self.qdrant.upsert_raw(self.collection, self.ids, vectors, self.payloads)
+        self.count += len(self.ids)
+        self.ids, self.vectors, self.payloads = [], [], []
+
+
+def import_project(
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    fileobj: BinaryIO,
+    project_name: str | None = None,
+    path: str | None = None,
+) -> dict:
+    """由 snapshot 載入專案，取代同名專案既有的索引。
+
+    project_name 未指定時沿用 snapshot 中的名稱；path 為此部署中專案的（容器內）路徑，
+    寫入 project_stats 供之後的增量索引使用。失敗時清除已寫入的部分。
+    """
+    started = time.perf_counter()
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as f:
+        lines = iter(f)
+        try:
+            header = orjson.loads(next(lines, b"null"))
+        except (OSError, EOFError, zlib.error, orjson.JSONDecodeError) as e:
+            raise SnapshotError(f"Cannot read snapshot: {e}") from e
+        _check_header(header)
+        target = project_name or header["project_name"]
+        if state_db.get_refs(target) or state_db.get_ref_owner(target):
+            raise SnapshotError(f"'{target}' is a ref-aware project; snapshots cannot replace it")
+        job_id = begin_job(state_db, target, "import")
+        with _running(state_db, job_id):
+            return _import(qdrant, state_db, lines, header, target, path, started)
+
+
+def _import(
+    qdrant: QdrantStorage,
+    state_db: StateDB,
+    lines: Iterator[bytes],
+    header: dict,
+    target: str,
+    path: str | None,
+    started: float,
+) -> dict:
+    """gzip 已開啟、header 已驗證、任務已登記後的實際載入。"""
+    qdrant.ensure_collection()
+    qdrant.delete_by_project(target)
+    state_db.remove_project(target, keep_jobs=True)
+    state_db.set_index_status(target, "running")
+
+    loaders = {kind: _Loader(qdrant, target, kind) for kind in ("chunks", "summaries")}
+    load_summaries = qdrant.has_summaries()
+    rows: dict[str, list[dict]] = {table: [] for table in SNAPSHOT_TABLES}
+    summaries_seen = 0
+    end = None
+    try:
+        for line in lines:
+            record = orjson.loads(line)
+            kind = record["type"]
+            if kind == "point":
+                if record["kind"] == "summaries":
+                    summaries_seen += 1
+                    if not load_summaries:
+                        continue
+                loaders[record["kind"]].add(record["vector"], record["payload"])
+            elif kind == "row":
+                if record["table"] not in rows:
+                    raise SnapshotError(f"Unknown table '{record['table']}'")
+                rows[record["table"]].append(record["row"])
+            elif kind == "end":
+                end = record
+                break
+        if end is None:
+            raise SnapshotError("Snapshot is truncated (no end record)")
+        for loader in loaders.values():
+            loader.flush()
+        row_count = sum(len(r) for r in rows.values())
+        point_count = sum(loader.count for loader in loaders.values())
+        # 舊版 snapshot 的 end 沒有 chunks 欄位，以總數扣掉摘要數推算
+        expected_chunks = end.get("chunks", end["points"] - summaries_seen)
+        # 不載入摘要時只略過摘要的數量比對，chunk 數一律檢查
+        if (
+            row_count != end["rows"]
+            or loaders["chunks"].count != expected_chunks
+            or (load_summaries and point_count != end["points"])
+        ):
+            raise SnapshotError(
+                f"Snapshot is incomplete: {row_count}/{end['rows']} rows, "
+                f"{loaders['chunks'].count}/{expected_chunks} chunks, "
+                f"{point_count}/{end['points']} points"
+            )
+
+        if path:
+            # 與 run_index 相同，project_stats 記錄使用者端的路徑
+            for row in rows["project_stats"]:
+                row["path"] = settings.to_host_path(path)
+        _remap_clusters(qdrant, target, rows["chunk_clusters"])
+        for table, table_rows in rows.items():
+            state_db.load_project_rows(table, target, table_rows)
+    except Exception as e:
+        qdrant.delete_by_project(target)
+        state_db.remove_project(target, keep_jobs=True)
+        state_db.set_index_status(target, "failed", error=f"Snapshot import failed: {e}")
+        if isinstance(e, (orjson.JSONDecodeError, KeyError, OSError, EOFError, zlib.error)):
+            raise SnapshotError(f"Corrupt snapshot: {e}") from e
+        raise
+
+    files = len(rows["file_hashes"])
+    chunks = loaders["chunks"].count
+    state_db.set_index_status(
+        target, "completed", total_files=files, processed_files=files, total_chunks=chunks
+    )
+    result = {
+        "project_name": target,
+        "source_project": header["project_name"],
+        "files": files,
+        "chunks": chunks,
+        "summaries": loaders["summaries"].count,
+        "seconds": time.perf_counter() - started,
+    }
+    logger.info("Imported snapshot for '%s': %d files, %d chunks", target, files, chunks)
+    return result
+
+
+def _remap_clusters(qdrant: QdrantStorage, target: str, cluster_rows: list[dict]):
+    """cluster_id 是代表的 point ID（含專案名稱），以匯入後的 point ID 重新對應。"""
+    ids = {
+        row["cluster_id"]: qdrant.make_point_id(target, row["file_path"], row["chunk_index"])
+        for row in cluster_rows
+        if row["is_representative"]
+    }
+    for row in cluster_rows:
+        row["cluster_id"] = ids.get(row["cluster_id"], row["cluster_id"])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import project index snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="匯出專案")
+    export.add_argument("project")
+    export.add_argument("-o", "--output", default=None, help="輸出檔（預設 <project>.jsonl.gz，- 為 stdout）")
+    load = sub.add_parser("import", help="匯入 snapshot")
+    load.add_argument("file", help="snapshot 檔（- 為 stdin）")
+    load.add_argument("--project", default=None, help="以其他名稱匯入")
+    load.add_argument("--path", default=None, help="此部署中專案的（容器內）路徑")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    qdrant = QdrantStorage()
+    state_db = StateDB(settings.state_db_path)
+    try:
+        if args.command == "export":
+            if not state_db.get_index_status(args.project):
+                print(f"Project '{args.project}' not found", file=sys.stderr)
+                return 1
+            if state_db.get_ref_owner(args.project):
+                print(f"'{args.project}' is a ref of a ref-aware project; snapshots are not supported", file=sys.stderr)
+                return 1
+            job_id = begin_job(state_db, args.project, "export")
+            output = args.output or f"{args.project}.jsonl.gz"
+            try:
+                out = sys.stdout.buffer if output == "-" else open(output, "wb")
+            except OSError as e:
+                state_db.finish_job(job_id, "failed", str(e))
+                raise
+            try:
+                for data in export_project(qdrant, state_db, args.project, job_id):
+                    out.write(data)
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+        else:
+            source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+            try:
+                result = import_project(qdrant, state_db, source, args.project, args.path)
+            finally:
+                if source is not sys.stdin.buffer:
+                    source.close()
+            print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
+    except (SnapshotError, RuntimeError) as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    finally:
+        qdrant.client.close()
+        state_db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,74 @@
+import json
 import sqlite3
 import threading
-from datetime import datetime, timezone
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from urllib.parse import quote
+
+from code_rag.config import settings
+from code_rag.metrics import STATE_DB_LOCK_WAIT_SECONDS, TimedLock
+
+JOB_ACTIVE = ("queued", "running")
+# 專案 snapshot 匯出 / 匯入的資料表（search_tuning 與部署環境相關，不帶走）
+SNAPSHOT_TABLES = ("file_hashes", "file_stats", "chunk_clusters", "project_stats")
+
+
+def ref_state_key(project_name: str, ref: str | None) -> str:
+    """ref-aware 專案每個 ref 的狀態（file_hashes、統計、index_status）以此名稱記錄。"""
+    return project_name if ref is None else f"{project_name}@{ref}"
 
 
 class StateDB:
+    """SQLite 狀態資料庫（WAL 模式，可由多個行程共用）。
+
+    寫入共用一個連線並以 _lock 串行化；讀取使用每個執行緒各自的唯讀連線，
+    不經過 _lock，搜尋不會被索引任務的寫入擋住。
+    """
+
     def __init__(self, db_path: str):
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, timeout=settings.state_db_busy_timeout_s
+        )
         self.conn.row_factory = sqlite3.Row
-        self._lock = threading.Lock()
+        # WAL：讀取不阻塞寫入；synchronous=NORMAL 在 WAL 下只在 checkpoint 時 fsync
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = TimedLock(threading.Lock(), STATE_DB_LOCK_WAIT_SECONDS)
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
         self._init_tables()
 
+    def _reader(self) -> sqlite3.Connection:
+        """目前執行緒的唯讀連線（第一次使用時建立）。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = f"file:{quote(str(Path(self.db_path).resolve()))}?mode=ro"
+            conn = sqlite3.connect(
+                uri, uri=True, check_same_thread=False, timeout=settings.state_db_busy_timeout_s
+            )
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def _immediate(self):
+        """BEGIN IMMEDIATE 交易：先取得資料庫寫入鎖，跨行程的「檢查後寫入」才是原子的。"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
     def _init_tables(self):
         with self._lock:
             self.conn.executescript("""
@@ -32,16 +89,91 @@ class StateDB:
                     started_at TEXT,
                     completed_at TEXT
                 );
+                CREATE TABLE IF NOT EXISTS search_tuning (
+                    project_name TEXT PRIMARY KEY,
+                    hnsw_ef INTEGER NOT NULL,
+                    p95_ms REAL,
+                    recall REAL,
+                    tuned_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS file_stats (
+                    project_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL DEFAULT 0,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    chunk_types TEXT NOT NULL DEFAULT '{}',
+                    PRIMARY KEY (project_name, file_path)
+                );
+                CREATE TABLE IF NOT EXISTS project_stats (
+                    project_name TEXT PRIMARY KEY,
+                    path TEXT,
+                    file_count INTEGER DEFAULT 0,
+                    chunk_count INTEGER DEFAULT 0,
+                    bytes_indexed INTEGER DEFAULT 0,
+                    languages TEXT NOT NULL DEFAULT '{}',
+                    chunk_types TEXT NOT NULL DEFAULT '{}',
+                    last_index_duration REAL,
+                    updated_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS chunk_clusters (
+                    project_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    start_line INTEGER NOT NULL,
+                    end_line INTEGER NOT NULL,
+                    simhash INTEGER NOT NULL,
+                    cluster_id TEXT NOT NULL,
+                    is_representative INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (project_name, file_path, chunk_index)
+                );
+                CREATE INDEX IF NOT EXISTS idx_chunk_clusters_cluster
+                    ON chunk_clusters (project_name, cluster_id);
+                CREATE TABLE IF NOT EXISTS index_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project_name TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    force INTEGER NOT NULL DEFAULT 0,
+                    profile INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    worker TEXT,
+                    created_at TEXT NOT NULL,
+                    claimed_at TEXT,
+                    heartbeat_at TEXT,
+                    completed_at TEXT,
+                    progress TEXT,
+                    error TEXT,
+                    ref TEXT,
+                    kind TEXT NOT NULL DEFAULT 'index'
+                );
+                CREATE INDEX IF NOT EXISTS idx_index_jobs_project
+                    ON index_jobs (project_name, id);
+                CREATE INDEX IF NOT EXISTS idx_index_jobs_status
+                    ON index_jobs (status, id);
+                CREATE TABLE IF NOT EXISTS project_refs (
+                    project_name TEXT NOT NULL,
+                    ref TEXT NOT NULL,
+                    state_key TEXT NOT NULL UNIQUE,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (project_name, ref)
+                );
+                CREATE INDEX IF NOT EXISTS idx_file_hashes_version
+                    ON file_hashes (file_path, hash);
             """)
+            # 升級前建立的 index_jobs 沒有 ref / kind 欄位
+            columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(index_jobs)")}
+            if "ref" not in columns:
+                self.conn.execute("ALTER TABLE index_jobs ADD COLUMN ref TEXT")
+            if "kind" not in columns:
+                self.conn.execute("ALTER TABLE index_jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'index'")
             self.conn.commit()
 
     def get_file_hash(self, project_name: str, file_path: str) -> str | None:
-        with self._lock:
-            row = self.conn.execute(
-                "SELECT hash FROM file_hashes WHERE project_name = ? AND file_path = ?",
-                (project_name, file_path),
-            ).fetchone()
-            return row["hash"] if row else None
+        row = self._reader().execute(
+            "SELECT hash FROM file_hashes WHERE project_name = ? AND file_path = ?",
+            (project_name, file_path),
+        ).fetchone()
+        return row["hash"] if row else None
 
     def set_file_hash(self, project_name: str, file_path: str, hash_val: str):
         now = datetime.now(timezone.utc).isoformat()
@@ -53,12 +185,11 @@ class StateDB:
             self.conn.commit()
 
     def get_all_file_paths(self, project_name: str) -> set[str]:
-        with self._lock:
-            rows = self.conn.execute(
-                "SELECT file_path FROM file_hashes WHERE project_name = ?",
-                (project_name,),
-            ).fetchall()
-            return {row["file_path"] for row in rows}
+        rows = self._reader().execute(
+            "SELECT file_path FROM file_hashes WHERE project_name = ?",
+            (project_name,),
+        ).fetchall()
+        return {row["file_path"] for row in rows}
 
     def remove_file(self, project_name: str, file_path: str):
         with self._lock:
@@ -66,9 +197,21 @@ class StateDB:
                 "DELETE FROM file_hashes WHERE project_name = ? AND file_path = ?",
                 (project_name, file_path),
             )
+            self.conn.execute(
+                "DELETE FROM file_stats WHERE project_name = ? AND file_path = ?",
+                (project_name, file_path),
+            )
+            self.conn.execute(
+                "DELETE FROM chunk_clusters WHERE project_name = ? AND file_path = ?",
+                (project_name, file_path),
+            )
             self.conn.commit()
 
-    def remove_project(self, project_name: str):
+    def remove_project(self, project_name: str, keep_jobs: bool = False):
+        """刪除專案的所有狀態；keep_jobs 時保留 index_jobs（執行中的匯入任務仍需要它的列）。"""
+        tables = ["search_tuning", "file_stats", "project_stats", "chunk_clusters"]
+        if not keep_jobs:
+            tables.append("index_jobs")
         with self._lock:
             self.conn.execute(
                 "DELETE FROM file_hashes WHERE project_name = ?", (project_name,)
@@ -76,6 +219,10 @@ class StateDB:
             self.conn.execute(
                 "DELETE FROM index_status WHERE project_name = ?", (project_name,)
             )
+            for table in tables:
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE project_name = ?", (project_name,)
+                )
             self.conn.commit()
 
     def set_index_status(
@@ -122,16 +269,534 @@ class StateDB:
             self.conn.commit()
 
     def get_index_status(self, project_name: str) -> dict | None:
+        row = self._reader().execute(
+            "SELECT * FROM index_status WHERE project_name = ?", (project_name,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_all_projects(self) -> list[dict]:
+        rows = self._reader().execute("SELECT * FROM index_status").fetchall()
+        return [dict(row) for row in rows]
+
+    def set_search_tuning(
+        self,
+        project_name: str,
+        hnsw_ef: int,
+        p95_ms: float | None = None,
+        recall: float | None = None,
+    ):
+        now = datetime.now(timezone.utc).isoformat()
         with self._lock:
-            row = self.conn.execute(
-                "SELECT * FROM index_status WHERE project_name = ?", (project_name,)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_tuning (project_name, hnsw_ef, p95_ms, recall, tuned_at) VALUES (?, ?, ?, ?, ?)",
+                (project_name, hnsw_ef, p95_ms, recall, now),
+            )
+            self.conn.commit()
+
+    def get_search_tuning(self, project_name: str) -> dict | None:
+        row = self._reader().execute(
+            "SELECT * FROM search_tuning WHERE project_name = ?", (project_name,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_stats_file_paths(self, project_name: str) -> set[str]:
+        rows = self._reader().execute(
+            "SELECT file_path FROM file_stats WHERE project_name = ?",
+            (project_name,),
+        ).fetchall()
+        return {row["file_path"] for row in rows}
+
+    def set_file_stats(
+        self,
+        project_name: str,
+        file_path: str,
+        language: str,
+        size_bytes: int,
+        chunk_types: dict[str, int],
+    ):
+        """記錄單一檔案的索引統計（供專案統計增量彙總）。"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_stats (project_name, file_path, language, size_bytes, chunk_count, chunk_types) VALUES (?, ?, ?, ?, ?, ?)",
+                (project_name, file_path, language, size_bytes, sum(chunk_types.values()), json.dumps(chunk_types)),
+            )
+            self.conn.commit()
+
+    def refresh_project_stats(
+        self,
+        project_name: str,
+        path: str | None = None,
+        last_index_duration: float | None = None,
+    ) -> dict:
+        """由 file_stats 彙總專案統計並寫入 project_stats。"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT language, size_bytes, chunk_count, chunk_types FROM file_stats WHERE project_name = ?",
+                (project_name,),
+            ).fetchall()
+            languages: dict[str, int] = {}
+            chunk_types: dict[str, int] = {}
+            for row in rows:
+                languages[row["language"]] = languages.get(row["language"], 0) + row["chunk_count"]
+                for chunk_type, count in json.loads(row["chunk_types"]).items():
+                    chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + count
+            stats = {
+                "file_count": len(rows),
+                "chunk_count": sum(row["chunk_count"] for row in rows),
+                "bytes_indexed": sum(row["size_bytes"] for row in rows),
+                "languages": languages,
+                "chunk_types": chunk_types,
+            }
+            self.conn.execute(
+                """INSERT INTO project_stats (project_name, path, file_count, chunk_count, bytes_indexed, languages, chunk_types, last_index_duration, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(project_name) DO UPDATE SET
+                       path = COALESCE(excluded.path, path),
+                       file_count = excluded.file_count,
+                       chunk_count = excluded.chunk_count,
+                       bytes_indexed = excluded.bytes_indexed,
+                       languages = excluded.languages,
+                       chunk_types = excluded.chunk_types,
+                       last_index_duration = COALESCE(excluded.last_index_duration, last_index_duration),
+                       updated_at = excluded.updated_at""",
+                (
+                    project_name, path, stats["file_count"], stats["chunk_count"],
+                    stats["bytes_indexed"], json.dumps(languages), json.dumps(chunk_types),
+                    last_index_duration, now,
+                ),
+            )
+            self.conn.commit()
+            return stats
+
+    def update_project_counts(
+        self,
+        project_name: str,
+        chunk_count: int,
+        languages: dict[str, int],
+        chunk_types: dict[str, int],
+    ):
+        """以 Qdrant 的實際計數覆寫專案統計（reconcile 用）。"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self.conn.execute(
+                """INSERT INTO project_stats (project_name, chunk_count, languages, chunk_types, updated_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(project_name) DO UPDATE SET
+                       chunk_count = excluded.chunk_count,
+                       languages = excluded.languages,
+                       chunk_types = excluded.chunk_types,
+                       updated_at = excluded.updated_at""",
+                (project_name, chunk_count, json.dumps(languages), json.dumps(chunk_types), now),
+            )
+            self.conn.commit()
+
+    def get_project_catalog(self) -> list[dict]:
+        """單一查詢取得所有專案的狀態與統計。"""
+        rows = self._reader().execute(
+            """SELECT s.project_name, s.status, s.total_files, s.completed_at,
+                      p.path, p.file_count, p.chunk_count, p.bytes_indexed,
+                      p.languages, p.chunk_types, p.last_index_duration,
+                      r.project_name AS ref_project, r.ref
+               FROM index_status s
+               LEFT JOIN project_stats p ON p.project_name = s.project_name
+               LEFT JOIN project_refs r ON r.state_key = s.project_name
+               ORDER BY s.project_name"""
+        ).fetchall()
+        catalog = []
+        for row in rows:
+            entry = dict(row)
+            entry["languages"] = json.loads(entry["languages"] or "{}")
+            entry["chunk_types"] = json.loads(entry["chunk_types"] or "{}")
+            catalog.append(entry)
+        return catalog
+
+    def get_cluster_representatives(self, project_name: str) -> list[tuple[int, str]]:
+        """取得專案內所有代表 chunk 的 (simhash, cluster_id)，用於重建 SimHash 索引。"""
+        rows = self._reader().execute(
+            "SELECT simhash, cluster_id FROM chunk_clusters WHERE project_name = ? AND is_representative = 1",
+            (project_name,),
+        ).fetchall()
+        return [(_from_signed64(row["simhash"]), row["cluster_id"]) for row in rows]
+
+    def set_file_clusters(
+        self,
+        project_name: str,
+        file_path: str,
+        rows: list[tuple[int, int, int, int, str, bool]],
+    ):
+        """以 (chunk_index, start_line, end_line, simhash, cluster_id, is_representative) 取代檔案的 cluster 紀錄。"""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM chunk_clusters WHERE project_name = ? AND file_path = ?",
+                (project_name, file_path),
+            )
+            self.conn.executemany(
+                "INSERT INTO chunk_clusters (project_name, file_path, chunk_index, start_line, end_line, simhash, cluster_id, is_representative) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (project_name, file_path, idx, start, end, _to_signed64(value), cluster_id, int(rep))
+                    for idx, start, end, value, cluster_id, rep in rows
+                ],
+            )
+            self.conn.commit()
+
+    def get_file_representatives(self, project_name: str, file_path: str) -> set[str]:
+        """檔案中作為 cluster 代表的 chunk 的 cluster_id。"""
+        rows = self._reader().execute(
+            "SELECT cluster_id FROM chunk_clusters WHERE project_name = ? AND file_path = ? AND is_representative = 1",
+            (project_name, file_path),
+        ).fetchall()
+        return {row["cluster_id"] for row in rows}
+
+    def get_cluster_candidates(
+        self, project_name: str, cluster_ids: Iterable[str], exclude_files: Iterable[str]
+    ) -> list[dict]:
+        """cluster 中其他檔案的非代表成員（依 cluster、檔案、chunk 順序），供選出新代表。"""
+        cluster_ids = list(cluster_ids)
+        if not cluster_ids:
+            return []
+        exclude_files = set(exclude_files)
+        placeholders = ", ".join("?" for _ in cluster_ids)
+        rows = self._reader().execute(
+            f"""SELECT cluster_id, file_path, chunk_index, simhash FROM chunk_clusters
+                WHERE project_name = ? AND cluster_id IN ({placeholders}) AND is_representative = 0
+                ORDER BY cluster_id, file_path, chunk_index""",
+            (project_name, *cluster_ids),
+        ).fetchall()
+        return [
+            {**dict(row), "simhash": _from_signed64(row["simhash"])}
+            for row in rows
+            if row["file_path"] not in exclude_files
+        ]
+
+    def promote_cluster_member(
+        self,
+        project_name: str,
+        cluster_id: str,
+        new_cluster_id: str,
+        file_path: str | None = None,
+        chunk_index: int | None = None,
+    ):
+        """cluster 改由新代表（其 point ID 為 new_cluster_id）代表，所有成員改指向它。
+
+        指定 file_path / chunk_index 時把該成員標記為代表；新代表尚未寫入 StateDB
+        （仍在等待嵌入的批次中）時省略。
+        """
+        with self._lock:
+            self.conn.execute(
+                "UPDATE chunk_clusters SET cluster_id = ? WHERE project_name = ? AND cluster_id = ?",
+                (new_cluster_id, project_name, cluster_id),
+            )
+            if file_path is not None:
+                self.conn.execute(
+                    "UPDATE chunk_clusters SET is_representative = 1 WHERE project_name = ? AND file_path = ? AND chunk_index = ?",
+                    (project_name, file_path, chunk_index),
+                )
+            self.conn.commit()
+
+    def add_file_chunk(self, project_name: str, file_path: str, chunk_type: str):
+        """檔案多了一個寫入 Qdrant 的 chunk（重複 chunk 升為代表），更新其 file_stats。"""
+        with self._immediate() as conn:
+            row = conn.execute(
+                "SELECT chunk_types FROM file_stats WHERE project_name = ? AND file_path = ?",
+                (project_name, file_path),
             ).fetchone()
-            return dict(row) if row else None
+            if row is None:
+                return
+            chunk_types = json.loads(row[0])
+            chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
+            conn.execute(
+                "UPDATE file_stats SET chunk_count = ?, chunk_types = ? WHERE project_name = ? AND file_path = ?",
+                (sum(chunk_types.values()), json.dumps(chunk_types), project_name, file_path),
+            )
 
-    def get_all_projects(self) -> list[dict]:
+    def remove_file_clusters(self, project_name: str, file_path: str):
+        """刪除檔案的 cluster 紀錄（其代表的 cluster 需先由 promote_cluster_member 交接）。"""
         with self._lock:
-            rows = self.conn.execute("SELECT * FROM index_status").fetchall()
-            return [dict(row) for row in rows]
+            self.conn.execute(
+                "DELETE FROM chunk_clusters WHERE project_name = ? AND file_path = ?",
+                (project_name, file_path),
+            )
+            self.conn.commit()
+
+    def get_cluster_members(self, project_name: str, cluster_ids: list[str]) -> dict[str, list[dict]]:
+        """取得各 cluster 中未寫入 Qdrant 的重複 chunk 位置。"""
+        if not cluster_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in cluster_ids)
+        rows = self._reader().execute(
+            f"""SELECT cluster_id, file_path, chunk_index, start_line, end_line
+                FROM chunk_clusters
+                WHERE project_name = ? AND cluster_id IN ({placeholders}) AND is_representative = 0
+                ORDER BY file_path, chunk_index""",
+            (project_name, *cluster_ids),
+        ).fetchall()
+        members: dict[str, list[dict]] = {}
+        for row in rows:
+            entry = dict(row)
+            members.setdefault(entry.pop("cluster_id"), []).append(entry)
+        return members
+
+    def get_duplicate_members(
+        self, project_names: list[str] | None, path_prefix: list[str] | None = None
+    ) -> list[dict]:
+        """列出未寫入 Qdrant 的重複 chunk（可限定專案與目錄），供路徑範圍搜尋找出範圍內的成員。
+
+        path_prefix 為已正規化的目錄或檔案路徑；exclude 由呼叫端以 in_scope 比對。
+        """
+        conditions = ["is_representative = 0"]
+        params: list = []
+        if project_names:
+            conditions.append(f"project_name IN ({', '.join('?' for _ in project_names)})")
+            params.extend(project_names)
+        if path_prefix:
+            conditions.append(
+                "(" + " OR ".join(
+                    "file_path = ? OR substr(file_path, 1, ?) = ?" for _ in path_prefix
+                ) + ")"
+            )
+            for prefix in path_prefix:
+                params.extend((prefix, len(prefix) + 1, f"{prefix}/"))
+        rows = self._reader().execute(
+            f"""SELECT project_name, file_path, chunk_index, start_line, end_line, cluster_id
+                FROM chunk_clusters
+                WHERE {' AND '.join(conditions)}
+                ORDER BY project_name, file_path, chunk_index""",
+            params,
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_duplicate_chunks(self, project_name: str) -> int:
+        row = self._reader().execute(
+            "SELECT COUNT(*) AS n FROM chunk_clusters WHERE project_name = ? AND is_representative = 0",
+            (project_name,),
+        ).fetchone()
+        return row["n"]
+
+    def iter_project_rows(self, table: str, project_name: str) -> Iterator[dict]:
+        """逐列讀取專案在 table 中的資料（不含 project_name 欄位），供 snapshot 匯出。"""
+        if table not in SNAPSHOT_TABLES:
+            raise ValueError(f"Table '{table}' is not part of project snapshots")
+        cursor = self._reader().execute(
+            f"SELECT * FROM {table} WHERE project_name = ?", (project_name,)
+        )
+        for row in cursor:
+            entry = dict(row)
+            entry.pop("project_name")
+            yield entry
+
+    def load_project_rows(self, table: str, project_name: str, rows: Iterable[dict]) -> int:
+        """以單一交易寫入 snapshot 匯入的資料列；只接受 table 既有的欄位。"""
+        if table not in SNAPSHOT_TABLES:
+            raise ValueError(f"Table '{table}' is not part of project snapshots")
+        columns = [
+            row["name"]
+            for row in self._reader().execute(f"PRAGMA table_info({table})")
+            if row["name"] != "project_name"
+        ]
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        values = [(project_name, *(row.get(c) for c in columns)) for row in rows]
+        with self._lock:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (project_name, {', '.join(columns)}) VALUES ({placeholders})",
+                values,
+            )
+            self.conn.commit()
+        return len(values)
+
+    def create_job(
+        self,
+        project_name: str,
+        path: str,
+        force: bool = False,
+        profile: bool = False,
+        worker: str | None = None,
+        ref: str | None = None,
+        kind: str = "index",
+    ) -> int | None:
+        """建立索引任務，專案已有排隊中或執行中的任務時回傳 None。
+
+        指定 worker 時任務直接以該 worker 的名義開始執行（inline 模式），
+        否則排入佇列等待 index worker 認領。同一專案不同 ref 的任務也互斥，
+        因為它們會更新相同 point 的 refs。snapshot 匯入 / 匯出以 kind="import" /
+        "export" 登記為任務，與索引互斥的檢查因此同樣是跨行程原子的。
+        """
+        now = _now()
+        with self._immediate() as conn:
+            self._expire_jobs(conn, now)
+            active = conn.execute(
+                "SELECT id FROM index_jobs WHERE project_name = ? AND status IN (?, ?)",
+                (project_name, *JOB_ACTIVE),
+            ).fetchone()
+            if active:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO index_jobs (project_name, ref, kind, path, force, profile, status, worker, created_at, claimed_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    project_name, ref, kind, path, int(force), int(profile),
+                    "running" if worker else "queued", worker, now,
+                    now if worker else None, now if worker else None,
+                ),
+            )
+            return cursor.lastrowid
+
+    def claim_job(self, worker: str) -> dict | None:
+        """認領最早排隊的任務；多個 worker 行程同時呼叫也只有一個會取得。"""
+        now = _now()
+        with self._immediate() as conn:
+            self._expire_jobs(conn, now)
+            row = conn.execute(
+                "SELECT id FROM index_jobs WHERE status = 'queued' AND kind = 'index' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE index_jobs SET status = 'running', worker = ?, claimed_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker, now, now, row["id"]),
+            )
+            return _job(conn.execute("SELECT * FROM index_jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def _expire_jobs(self, conn: sqlite3.Connection, now: str):
+        """心跳逾時（worker 已停止）的執行中任務標記為失敗，讓專案可重新索引。
+
+        匯出不改變索引，逾時只結束任務，不把 index_status 標記為失敗。
+        """
+        cutoff = (datetime.fromisoformat(now) - timedelta(seconds=settings.job_lease_s)).isoformat()
+        error = "Index worker stopped responding"
+        conn.execute(
+            """UPDATE index_status SET status = 'failed', error = ?, completed_at = ?
+               WHERE project_name IN (
+                   SELECT CASE WHEN ref IS NULL THEN project_name ELSE project_name || '@' || ref END
+                   FROM index_jobs WHERE status = 'running' AND heartbeat_at < ? AND kind != 'export'
+               )""",
+            (error, now, cutoff),
+        )
+        conn.execute(
+            "UPDATE index_jobs SET status = 'failed', error = ?, completed_at = ? WHERE status = 'running' AND heartbeat_at < ?",
+            (error, now, cutoff),
+        )
+
+    def heartbeat_job(self, job_id: int, progress: dict | None = None):
+        """更新任務心跳與進度快照（其他行程的 /status、/events 由此讀取）。"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE index_jobs SET heartbeat_at = ?, progress = COALESCE(?, progress) WHERE id = ? AND status = 'running'",
+                (_now(), json.dumps(progress) if progress is not None else None, job_id),
+            )
+            self.conn.commit()
+
+    def finish_job(self, job_id: int, status: str, error: str | None = None, progress: dict | None = None):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE index_jobs SET status = ?, error = ?, completed_at = ?, progress = COALESCE(?, progress) WHERE id = ?",
+                (status, error, _now(), json.dumps(progress) if progress else None, job_id),
+            )
+            self.conn.commit()
+
+    def get_job(self, job_id: int) -> dict | None:
+        row = self._reader().execute("SELECT * FROM index_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def get_latest_job(self, project_name: str, kind: str | None = None) -> dict | None:
+        """專案最近的任務；kind 限定任務種類（index / import / export）。"""
+        if kind is None:
+            row = self._reader().execute(
+                "SELECT * FROM index_jobs WHERE project_name = ? ORDER BY id DESC LIMIT 1",
+                (project_name,),
+            ).fetchone()
+        else:
+            row = self._reader().execute(
+                "SELECT * FROM index_jobs WHERE project_name = ? AND kind = ? ORDER BY id DESC LIMIT 1",
+                (project_name, kind),
+            ).fetchone()
+        return _job(row) if row else None
+
+    def add_ref(self, project_name: str, ref: str) -> str:
+        """登記 ref-aware 專案的 ref，回傳其狀態名稱（見 ref_state_key）。"""
+        state_key = ref_state_key(project_name, ref)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO project_refs (project_name, ref, state_key, created_at) VALUES (?, ?, ?, ?)",
+                (project_name, ref, state_key, _now()),
+            )
+            self.conn.commit()
+        return state_key
+
+    def get_refs(self, project_name: str) -> dict[str, str]:
+        """專案已登記的 ref → 狀態名稱；一般（非 ref-aware）專案為空。"""
+        rows = self._reader().execute(
+            "SELECT ref, state_key FROM project_refs WHERE project_name = ? ORDER BY ref",
+            (project_name,),
+        ).fetchall()
+        return {row["ref"]: row["state_key"] for row in rows}
+
+    def get_ref_owner(self, state_key: str) -> tuple[str, str] | None:
+        """由狀態名稱反查 (專案, ref)；不是 ref 的狀態名稱回傳 None。"""
+        row = self._reader().execute(
+            "SELECT project_name, ref FROM project_refs WHERE state_key = ?", (state_key,)
+        ).fetchone()
+        return (row["project_name"], row["ref"]) if row else None
+
+    def get_version_refs(self, project_name: str, file_path: str, hash_val: str) -> dict[str, str]:
+        """目前包含某個檔案版本（路徑 + 內容 hash）的 ref → 狀態名稱。"""
+        rows = self._reader().execute(
+            """SELECT r.ref, r.state_key FROM file_hashes f
+               JOIN project_refs r ON r.state_key = f.project_name
+               WHERE f.file_path = ? AND f.hash = ? AND r.project_name = ?""",
+            (file_path, hash_val, project_name),
+        ).fetchall()
+        return {row["ref"]: row["state_key"] for row in rows}
+
+    def copy_file_state(self, source: str, target: str, file_path: str):
+        """把檔案的 hash 與統計由一個 ref 複製到另一個 ref（共用既有的 point，不重新索引）。"""
+        now = _now()
+        with self._lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO file_hashes (project_name, file_path, hash, updated_at)
+                   SELECT ?, file_path, hash, ? FROM file_hashes WHERE project_name = ? AND file_path = ?""",
+                (target, now, source, file_path),
+            )
+            self.conn.execute(
+                """INSERT OR REPLACE INTO file_stats (project_name, file_path, language, size_bytes, chunk_count, chunk_types)
+                   SELECT ?, file_path, language, size_bytes, chunk_count, chunk_types
+                   FROM file_stats WHERE project_name = ? AND file_path = ?""",
+                (target, source, file_path),
+            )
+            self.conn.commit()
+
+    def remove_ref(self, project_name: str, ref: str):
+        """刪除 ref 的登記與狀態（呼叫端需先處理 Qdrant 中的 refs）。"""
+        self.remove_project(ref_state_key(project_name, ref))
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM project_refs WHERE project_name = ? AND ref = ?", (project_name, ref)
+            )
+            self.conn.commit()
 
     def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
         self.conn.close()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["force"] = bool(job["force"])
+    job["profile"] = bool(job["profile"])
+    job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+    return job
+
+
+def _to_signed64(value: int) -> int:
+    """SQLite INTEGER 是有號 64-bit，SimHash 以補數形式儲存。"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _from_signed64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
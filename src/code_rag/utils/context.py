@@ -0,0 +1,25 @@
+def merge_chunks(chunks: list[dict]) -> dict:
+    """將同一檔案相鄰的 chunk 合併為一段連續內容，去除 chunk 之間重疊的行。"""
+    chunks = sorted(chunks, key=lambda c: c["chunk_index"])
+    first = chunks[0]
+    parts = [first["content"]]
+    end_line = first.get("end_line", 0)
+
+    for chunk in chunks[1:]:
+        lines = chunk["content"].split("\n")
+        start_line = chunk.get("start_line", 0)
+        if start_line <= end_line:
+            # 與前一個 chunk 重疊（split_lines 的 overlap），略過已出現的行
+            lines = lines[end_line - start_line + 1 :]
+        if lines:
+            parts.append("\n".join(lines))
+        end_line = max(end_line, chunk.get("end_line", 0))
+
+    return {
+        "project_name": first["project_name"],
+        "file_path": first["file_path"],
+        "content": "\n".join(parts),
+        "start_line": first.get("start_line", 0),
+        "end_line": end_line,
+        "chunk_indices": [c["chunk_index"] for c in chunks],
+    }
@@ -1,5 +1,7 @@
 from pathlib import Path
 
+from code_rag.config import settings
+
 # 總是排除的目錄
 EXCLUDED_DIRS: set[str] = {
     ".git",
@@ -100,15 +102,12 @@ EXCLUDED_EXTENSIONS: set[str] = {
     ".sqlite3",
 }
 
-# 最大檔案大小（bytes）- 跳過超過 500KB 的檔案
-MAX_FILE_SIZE = 500 * 1024
-
 
 def should_exclude_dir(dir_name: str) -> bool:
     return dir_name in EXCLUDED_DIRS
 
 
-def should_exclude_file(file_path: Path) -> bool:
+def should_exclude_file(file_path: Path, language: str | None = None) -> bool:
     if file_path.name in EXCLUDED_FILES:
         return True
     if file_path.suffix.lower() in EXCLUDED_EXTENSIONS:
@@ -117,7 +116,9 @@ def should_exclude_file(file_path: Path) -> bool:
         return True
     try:
         size = file_path.stat().st_size
-        if size == 0 or size > MAX_FILE_SIZE:
+        # 大小上限依語言決定（settings.max_file_size_by_language）
+        limit = settings.max_file_size_for(language) if language else settings.max_file_size
+        if size == 0 or size > limit:
             return True
     except OSError:
         return True
@@ -0,0 +1,111 @@
+"""路徑範圍搜尋：chunk 的祖先目錄清單與 exclude glob 的轉換。
+
+payload 的 path_prefixes 記錄檔案所有祖先目錄（相對專案根目錄），例如
+services/billing/api/handler.py → ["services", "services/billing", "services/billing/api"]，
+以 keyword 索引後「目錄底下的所有檔案」就是一個 MatchAny 條件，在 Qdrant 的
+filtered HNSW 內評估。
+"""
+
+import re
+from functools import lru_cache
+
+
+def path_prefixes(file_path: str) -> list[str]:
+    """檔案的所有祖先目錄（由淺到深，不含專案根目錄本身）。"""
+    parts = file_path.split("/")[:-1]
+    return ["/".join(parts[: i + 1]) for i in range(len(parts))]
+
+
+def normalize_path(path: str) -> str:
+    """統一使用者輸入的路徑：去掉開頭的 ./ 與 /，以及結尾的 / 或 /**。"""
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    path = path.strip("/")
+    if path.endswith("/**"):
+        path = path[:-3].rstrip("/")
+    return path
+
+
+def has_wildcard(pattern: str) -> bool:
+    return any(c in pattern for c in "*?[")
+
+
+def split_exclude(pattern: str) -> tuple[str, str]:
+    """將 exclude glob 分類為 (kind, value)。
+
+    - dir：`services/billing/**` 或 `services/billing/`，整個目錄
+    - file：不含萬用字元的檔案路徑
+    - dir_glob：目錄部分含萬用字元，例如 `**/tests/**`、`services/*/fixtures/**`
+    - file_glob：其他，例如 `**/*_test.go`、`*.min.js`
+    """
+    raw = pattern.strip().replace("\\", "/")
+    is_dir = raw.endswith("/") or raw.endswith("/**")
+    value = normalize_path(raw)
+    if not has_wildcard(value):
+        return ("dir" if is_dir else "file"), value
+    return ("dir_glob" if is_dir else "file_glob"), value
+
+
+def in_scope(file_path: str, path_prefix: list[str] | None, exclude: list[str] | None) -> bool:
+    """檔案是否符合搜尋的 path_prefix / exclude 條件（與 Qdrant 過濾條件相同的語意）。
+
+    用於不是 point 的位置（例如近似重複 chunk 的成員），無法交給 Qdrant 過濾。
+    """
+    ancestors = path_prefixes(file_path)
+    prefixes = {normalize_path(p) for p in path_prefix or ()} - {""}
+    if prefixes and file_path not in prefixes and prefixes.isdisjoint(ancestors):
+        return False
+    for pattern in exclude or ():
+        kind, value = split_exclude(pattern)
+        if not value:
+            continue
+        if kind == "dir" and value in ancestors:
+            return False
+        if kind == "file" and value == file_path:
+            return False
+        if kind == "dir_glob" and any(glob_regex(value).match(d) for d in ancestors):
+            return False
+        if kind == "file_glob" and glob_regex(value).match(file_path):
+            return False
+    return True
+
+
+@lru_cache(maxsize=256)
+def glob_regex(pattern: str) -> re.Pattern:
+    """glob 轉正規表示式：`**` 跨目錄，`*` 與 `?` 不跨 `/`。
+
+    不含 `/` 的 pattern（例如 `*.min.js`）比對任意深度的檔名。
+    """
+    if "/" not in pattern and not pattern.startswith("**"):
+        pattern = f"**/{pattern}"
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape("["))
+                i += 1
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(out) + r"\Z")
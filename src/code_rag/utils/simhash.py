@@ -0,0 +1,87 @@
+"""SimHash 近似重複偵測。
+
+以 token shingle 計算 64-bit SimHash，兩個 chunk 的 Hamming 距離不超過
+max_distance 即視為近似重複。索引將指紋切成 max_distance + 1 段（band），
+依鴿籠原理，距離不超過 max_distance 的指紋至少有一段完全相同，因此只需
+比對同 band 的候選。
+"""
+
+import hashlib
+import re
+
+SIMHASH_BITS = 64
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """計算文字的 64-bit SimHash（空白差異不影響結果）。"""
+    tokens = _TOKEN_RE.findall(text)
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [
+            " ".join(tokens[i : i + shingle_size])
+            for i in range(len(tokens) - shingle_size + 1)
+        ]
+    # 以二進位字串逐欄計數，避免 Python 層 64 × N 的位元迴圈
+    bits = [
+        format(int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest()), "064b")
+        for s in shingles
+    ]
+    threshold = len(bits) / 2
+    value = 0
+    for column in zip(*bits):
+        value = (value << 1) | (column.count("1") > threshold)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class SimHashIndex:
+    """以 band 分段查找 Hamming 距離內的指紋，每個指紋對應一個 cluster id。"""
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self._band_bits = SIMHASH_BITS // self.bands
+        self._tables: list[dict[int, list[tuple[int, str]]]] = [{} for _ in range(self.bands)]
+        self._values: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _band_keys(self, value: int) -> list[int]:
+        mask = (1 << self._band_bits) - 1
+        return [(value >> (i * self._band_bits)) & mask for i in range(self.bands)]
+
+    def add(self, value: int, cluster_id: str):
+        self._values[cluster_id] = value
+        for table, key in zip(self._tables, self._band_keys(value)):
+            table.setdefault(key, []).append((value, cluster_id))
+
+    def find(self, value: int) -> str | None:
+        """回傳距離最近且不超過 max_distance 的指紋所屬 cluster id。"""
+        best: tuple[int, str] | None = None
+        for table, key in zip(self._tables, self._band_keys(value)):
+            for candidate, cluster_id in table.get(key, ()):
+                distance = hamming(value, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, cluster_id)
+                    if distance == 0:
+                        return cluster_id
+        return best[1] if best else None
+
+    def remove_clusters(self, cluster_ids: set[str]):
+        for cluster_id in cluster_ids:
+            value = self._values.pop(cluster_id, None)
+            if value is None:
+                continue
+            for table, key in zip(self._tables, self._band_keys(value)):
+                entries = [e for e in table[key] if e[1] != cluster_id]
+                if entries:
+                    table[key] = entries
+                else:
+                    del table[key]
@@ -0,0 +1,23 @@
+"""向量運算：一律以 float32 NumPy 陣列處理（單一向量或每列一個向量的矩陣）。"""
+
+import numpy as np
+
+
+def as_matrix(vectors) -> np.ndarray:
+    """轉為連續的 float32 陣列（已是 float32 時不複製）。"""
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def normalize(vectors) -> np.ndarray:
+    """L2 正規化；矩陣逐列處理，零向量維持不變。"""
+    arr = as_matrix(vectors)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    return arr / np.where(norms == 0, 1, norms)
+
+
+def truncate(vectors, dims: int) -> np.ndarray:
+    """Matryoshka 截斷：保留前 dims 維並重新正規化。"""
+    arr = as_matrix(vectors)
+    if dims <= 0 or dims >= arr.shape[-1]:
+        return arr
+    return normalize(arr[..., :dims])
@@ -0,0 +1,107 @@
+"""Index worker：從 StateDB 認領索引任務，在獨立行程執行。
+
+搭配 INDEX_MODE=queue：API 只把任務寫入 index_jobs，索引的 CPU 與 embedding
+負載移出 API 行程，API 可用多個 uvicorn worker 服務搜尋。可同時執行多個
+worker 行程（需共用同一個 STATE_DB_PATH），任務以 SQLite 交易認領，不會重複執行。
+SIGTERM / SIGINT 會在目前任務完成後結束。
+
+用法：
+    python -m code_rag.worker
+    python -m code_rag.worker --once              # 處理完佇列中的任務後結束
+    python -m code_rag.worker --metrics-port 9101 # 以 HTTP 提供 Prometheus 指標
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+
+from prometheus_client import start_http_server
+
+from code_rag.config import settings
+from code_rag.indexer.embedder import create_embedder, validate_dims
+from code_rag.indexer.jobs import run_job
+from code_rag.indexer.scheduler import EmbeddingScheduler
+from code_rag.metrics import mark_process_dead
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.state import StateDB, ref_state_key
+
+logger = logging.getLogger("code_rag.worker")
+
+
+def _wait_for_qdrant(qdrant: QdrantStorage, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            qdrant.ensure_collection()
+            return True
+        except (RuntimeError, ValueError):
+            # 維度不一致等設定錯誤，重試也不會成功
+            raise
+        except Exception as e:
+            logger.warning("Qdrant not ready (%s), retrying in %.0fs", e, settings.startup_retry_s)
+            stop.wait(settings.startup_retry_s)
+    return False
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Code RAG index worker")
+    parser.add_argument("--once", action="store_true", help="佇列清空後結束")
+    parser.add_argument("--name", default=None, help="記錄在 index_jobs.worker 的名稱（預設 host:pid）")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Prometheus 指標的 HTTP port")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    name = args.name or f"worker:{socket.gethostname()}:{os.getpid()}"
+
+    stop = threading.Event()
+
+    def _shutdown(signum, frame):
+        logger.info("Received %s, stopping after the current job", signal.Signals(signum).name)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    qdrant = QdrantStorage()
+    state_db = StateDB(settings.state_db_path)
+    embedder = EmbeddingScheduler(create_embedder())
+    try:
+        if not _wait_for_qdrant(qdrant, stop):
+            return 0
+        if settings.ollama_warmup:
+            embedder.warmup()
+        validate_dims(embedder)
+        logger.info("Index worker %s ready (state DB: %s)", name, settings.state_db_path)
+
+        while not stop.is_set():
+            job = state_db.claim_job(name)
+            if job is None:
+                if args.once:
+                    break
+                stop.wait(settings.worker_poll_s)
+                continue
+            logger.info(
+                "Claimed job %d: %s (%s)", job["id"],
+                ref_state_key(job["project_name"], job["ref"]), job["path"],
+            )
+            status = run_job(job, qdrant, state_db, embedder)
+            logger.info("Job %d %s", job["id"], status)
+    finally:
+        embedder.close()
+        qdrant.client.close()
+        state_db.close()
+        mark_process_dead()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
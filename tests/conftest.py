@@ -0,0 +1,43 @@
+import pytest
+
+from code_rag.config import settings
+from code_rag.indexer.embedder import HashingEmbedder
+from code_rag.storage.qdrant import QdrantStorage
+from code_rag.storage.state import StateDB
+
+# 足夠長、可被 SimHash 判定為重複的函式
+DUPLICATE_BODY = (
+    "def shared_helper(values):\n    total = 0\n"
+    + "".join(f"    total += values[{i}] * {i}\n" for i in range(60))
+    + "    return total\n"
+)
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    """行程內的 Qdrant、暫存 StateDB 與 hashing embedder，啟用重複 chunk 抑制。"""
+    monkeypatch.setattr(settings, "dedup_chunks", True)
+    monkeypatch.setattr(settings, "summary_vectors", False)
+    qdrant = QdrantStorage(location=":memory:")
+    qdrant.ensure_collection()
+    state_db = StateDB(str(tmp_path / "state.db"))
+    embedder = HashingEmbedder()
+    yield qdrant, state_db, embedder
+    embedder.close()
+    state_db.close()
+    qdrant.client.close()
+
+
+@pytest.fixture
+def make_project(tmp_path):
+    """在暫存目錄建立專案檔案，回傳專案路徑。"""
+
+    def make(files: dict[str, str], name: str = "project") -> str:
+        root = tmp_path / name
+        for relative, content in files.items():
+            path = root / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        return str(root)
+
+    return make
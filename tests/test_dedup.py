@@ -0,0 +1,85 @@
+"""近似重複 chunk 抑制。"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from code_rag.indexer.pipeline import run_index
+
+from conftest import DUPLICATE_BODY
+
+
+def _file_chunks(state_db, project: str) -> dict[str, int]:
+    return {r["file_path"]: r["chunk_count"] for r in state_db.iter_project_rows("file_stats", project)}
+
+
+def test_promoted_member_counts_in_file_stats(storage, make_project, tmp_path):
+    qdrant, state_db, embedder = storage
+    path = make_project({"a.py": DUPLICATE_BODY, "b.py": DUPLICATE_BODY, "c.py": DUPLICATE_BODY})
+    run_index("p", path, qdrant, state_db, embedder)
+    before = _file_chunks(state_db, "p")
+    assert before["b.py"] == 0
+
+    # a.py 的代表被移除，b.py 的成員升為代表
+    (tmp_path / "project" / "a.py").unlink()
+    run_index("p", path, qdrant, state_db, embedder)
+
+    after = _file_chunks(state_db, "p")
+    points = qdrant.get_project_stats("p")["chunk_count"]
+    assert after["b.py"] == before["a.py"]
+    assert sum(after.values()) == points
+    project = next(state_db.iter_project_rows("project_stats", "p"))
+    assert project["chunk_count"] == points
+
+
+SCOPED_FILES = [
+    "services/auth/x.py",
+    "services/billing/x.py",
+    "services/billing/y.py",
+    "services/search/x.py",
+    "tools/x.py",
+    "tools/y.py",
+]
+
+
+@pytest.fixture
+def scoped_client(storage, make_project, monkeypatch):
+    from code_rag import main
+
+    qdrant, state_db, embedder = storage
+    path = make_project({f: DUPLICATE_BODY for f in SCOPED_FILES})
+    run_index("p", path, qdrant, state_db, embedder)
+    monkeypatch.setattr(main, "_qdrant", qdrant)
+    monkeypatch.setattr(main, "_state_db", state_db)
+    monkeypatch.setattr(main, "_embedder", embedder)
+
+    def search(**params) -> list[dict]:
+        async def run():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.get(
+                    "/api/v1/search", params={"q": "shared_helper values", "project": "p", **params}
+                )
+            response.raise_for_status()
+            return response.json()
+
+        return asyncio.run(run())
+
+    return search
+
+
+def test_path_prefix_surfaces_member_of_outside_representative(scoped_client):
+    results = scoped_client(path_prefix="services/billing")
+    assert results
+    assert all(r["file_path"].startswith("services/billing/") for r in results)
+    # 以成員位置回傳的結果不把自己列為重複
+    for hit in results:
+        own = (hit["file_path"], hit["start_line"])
+        assert all((d["file_path"], d["start_line"]) != own for d in hit["duplicates"])
+
+
+def test_exclude_surfaces_member_outside_excluded_directory(scoped_client):
+    results = scoped_client(exclude=["services/**"])
+    assert results
+    assert all(r["file_path"].startswith("tools/") for r in results)
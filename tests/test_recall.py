@@ -0,0 +1,36 @@
+"""recall 評估的查詢抽樣。"""
+
+from code_rag.indexer.pipeline import run_index
+from code_rag.storage.recall import _result_key, evaluate_recall, exact_results
+
+
+def _project(storage, make_project):
+    qdrant, state_db, embedder = storage
+    files = {
+        f"m{i}.py": f"def handler_{i}(request):\n    return render(request, 'page_{i}.html', {{'n': {i}}})\n"
+        for i in range(40)
+    }
+    run_index("p", make_project(files), qdrant, state_db, embedder)
+    return qdrant
+
+
+def test_sample_vectors_is_random(storage, make_project):
+    qdrant = _project(storage, make_project)
+    first = {key for key, _ in qdrant.sample_vectors(10, project_name="p")}
+    second = {key for key, _ in qdrant.sample_vectors(10, project_name="p")}
+    assert len(first) == 10
+    assert first != second
+
+
+def test_query_point_is_left_out_of_ground_truth(storage, make_project):
+    qdrant = _project(storage, make_project)
+    samples = qdrant.sample_vectors(5, project_name="p")
+    keys = [key for key, _ in samples]
+    queries = [vector for _, vector in samples]
+
+    truth = exact_results(qdrant, queries, 3, "p", keys)
+    for key, results in zip(keys, truth):
+        assert len(results) == 3
+        assert key not in {_result_key(r) for r in results}
+    report = evaluate_recall(qdrant, queries, 3, "p", truth=truth, query_keys=keys, exact=True)
+    assert report["recall"] == 1.0
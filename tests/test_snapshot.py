@@ -0,0 +1,64 @@
+"""專案 snapshot 匯出 / 匯入。"""
+
+import gzip
+import io
+
+import orjson
+import pytest
+
+from code_rag.indexer.pipeline import run_index
+from code_rag.storage.snapshot import SnapshotError, export_project, import_project
+
+from conftest import DUPLICATE_BODY
+
+
+def _snapshot(qdrant, state_db, project: str) -> bytes:
+    return b"".join(export_project(qdrant, state_db, project))
+
+
+def _records(data: bytes) -> list[dict]:
+    return [orjson.loads(line) for line in gzip.decompress(data).splitlines()]
+
+
+def _pack(records: list[dict]) -> bytes:
+    return gzip.compress(b"".join(orjson.dumps(r) + b"\n" for r in records))
+
+
+@pytest.fixture
+def indexed(storage, make_project):
+    qdrant, state_db, embedder = storage
+    path = make_project({"a.py": DUPLICATE_BODY, "b.py": DUPLICATE_BODY, "c.py": DUPLICATE_BODY})
+    run_index("p", path, qdrant, state_db, embedder)
+    return qdrant, state_db
+
+
+def test_import_under_new_name_remaps_clusters(indexed):
+    qdrant, state_db = indexed
+    data = _snapshot(qdrant, state_db, "p")
+
+    import_project(qdrant, state_db, io.BytesIO(data), project_name="p2")
+
+    rows = list(state_db.iter_project_rows("chunk_clusters", "p2"))
+    representatives = {
+        qdrant.make_point_id("p2", r["file_path"], r["chunk_index"])
+        for r in rows
+        if r["is_representative"]
+    }
+    assert representatives
+    assert {r["cluster_id"] for r in rows} == representatives
+    assert len(qdrant.client.retrieve(qdrant.collection, list(representatives))) == len(representatives)
+    members = state_db.get_cluster_members("p2", list(representatives))
+    assert sum(len(m) for m in members.values()) == len(rows) - len(representatives) > 0
+
+
+def test_import_rejects_missing_chunks_without_summaries(indexed):
+    qdrant, state_db = indexed
+    records = _records(_snapshot(qdrant, state_db, "p"))
+    truncated = [r for r in records if r["type"] != "point"]
+
+    with pytest.raises(SnapshotError, match="incomplete"):
+        import_project(qdrant, state_db, io.BytesIO(_pack(truncated)), project_name="p2")
+
+    job = state_db.get_latest_job("p2", kind="import")
+    assert job is not None and job["status"] == "failed"
+    assert qdrant.get_project_stats("p2")["chunk_count"] == 0
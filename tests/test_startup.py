@@ -0,0 +1,52 @@
+"""啟動相關檢查：import 不載入重量級套件、/health/live 不等待背景啟動工作。"""
+
+import asyncio
+import os
+import subprocess
+import sys
+
+import httpx
+
+
+def test_import_main_is_lightweight():
+    code = (
+        "import sys, code_rag.main; "
+        "print(' '.join(m for m in sys.modules "
+        "if m.startswith(('tree_sitter_', 'qdrant_client', 'code_rag.indexer.pipeline'))))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_health_live_before_startup_checks(monkeypatch, tmp_path):
+    from code_rag import main
+    from code_rag.config import settings
+
+    monkeypatch.setattr(settings, "qdrant_url", ":memory:")
+    monkeypatch.setattr(settings, "embedding_backend", "hashing")
+    monkeypatch.setattr(settings, "state_db_path", str(tmp_path / "state.db"))
+    monkeypatch.setattr(main, "_readiness", {"qdrant": "pending", "embedder": "pending"})
+
+    async def run():
+        blocked = asyncio.Event()
+
+        async def never_ready():
+            await blocked.wait()
+
+        monkeypatch.setattr(main, "_startup_checks", never_ready)
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                live = await client.get("/api/v1/health/live")
+                ready = await client.get("/api/v1/health/ready")
+            assert not main._startup_task.done()
+        return live, ready
+
+    live, ready = asyncio.run(run())
+    assert live.status_code == 200
+    assert live.json() == {"status": "alive"}
+    assert ready.status_code == 503